@@ -0,0 +1,56 @@
+"""
+Comparison of the replay codecs on this computer.
+
+Encodes the same clip with every codec and container supported by the
+local opencv build and reports the encoding time, the frames encoded
+per second and the file size, sequentially then with the MJPG frames
+encoded by chunks on a pool of workers (as the replay writer does).
+
+Without clip, a synthetic clip of a ball moving over a noisy table is
+used. Recorded clips (for example the replays of goal_videos) are given
+with --clip.
+
+Usage: python -m benchmarks.bench_codecs [-r 640x480] [-s 3] [-q 90] [--resolution 640x480]
+       python -m benchmarks.bench_codecs --clip cam1.avi
+"""
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.bench_vision_detector import read_clip
+from core.utils import constants
+from core.utils.codecs import compare_codecs, format_comparison, sample_frames
+from core.utils.utils import parse_resolution
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-r', '--size', default='640x480', help='size of the synthetic clip')
+    parser.add_argument('-s', '--seconds', type=float, default=3, help='length of the synthetic clip')
+    parser.add_argument('-q', '--quality', type=int, default=constants.JPEG_QUALITY)
+    parser.add_argument('--resolution', default='native', help='resolution of the replays')
+    parser.add_argument('--clip', help='recorded clip to encode instead of the synthetic one')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    if args.clip:
+        frames = read_clip(args.clip)
+    else:
+        frames = sample_frames(parse_resolution(args.size), int(args.seconds * constants.DEFAULT_FPS))
+    resolution = parse_resolution(args.resolution)
+    (h, w) = frames[0].shape[:2]
+    print('%d frames of %dx%d, quality %d, resolution %s\n' % (len(frames), w, h, args.quality,
+                                                               args.resolution))
+
+    print('one thread:')
+    print(format_comparison(compare_codecs(frames, constants.DEFAULT_FPS, args.quality, resolution)))
+
+    print('\nMJPG chunks on %d workers:' % args.workers)
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        print(format_comparison(compare_codecs(frames, constants.DEFAULT_FPS, args.quality, resolution,
+                                               executor, formats=[('MJPG', 'avi')])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+End-to-end goal to replay latency with virtual hardware.
+
+Runs the real IR_Goal_Detector, Webcam and ReplayWriter (the service behind
+Gui.save_goal_replay) against a pty fake arduino and local MJPEG servers,
+and reports the latency percentiles of every stage, measured from the
+first goal byte sent by the arduino:
+
+    detection     goal event received by the callback
+    snapshot      buffers snapshotted (includes the post-roll wait)
+    encode        clips encoded, measured from the snapshot
+    file_ready    replay files written
+    player_start  first frame of the last camera decoded, from file_ready
+    total         goal to first replay frame
+
+Usage: python -m benchmarks.bench_goal_to_replay [-c cameras] [-g goals] [-o results.json]
+"""
+import argparse
+import json
+import os
+import platform
+import queue
+import shutil
+import tempfile
+from time import monotonic, sleep
+
+import cv2
+import numpy as np
+
+from benchmarks.fakes import FakeArduino, MJPEGServer
+from core.utils.replay_writer import ReplayWriter
+from core.utils.serial_bridge import IR_Goal_Detector
+from core.utils.webcam import Webcam
+
+STAGES = ('detection', 'snapshot', 'encode', 'file_ready', 'player_start', 'total')
+
+
+def player_start(filename):
+    """
+    Opens a replay and decodes its first frame, as a player would.
+    Returns the monotonic time at which the frame is ready.
+    """
+    cap = cv2.VideoCapture(filename)
+    cap.read()
+    cap.release()
+    return monotonic()
+
+
+def percentiles(samples):
+    samples = np.array(samples) * 1000
+    return {
+        'p50_ms': float(np.percentile(samples, 50)),
+        'p90_ms': float(np.percentile(samples, 90)),
+        'p99_ms': float(np.percentile(samples, 99)),
+        'max_ms': float(samples.max()),
+    }
+
+
+def run(args):
+    resolution = tuple(int(v) for v in args.resolution.split('x'))
+
+    # one loopback address per camera, droidcam always uses port 4747
+    ips = ['127.0.0.%d' % (i + 1) for i in range(args.cameras)]
+    servers = [MJPEGServer(ip, resolution=resolution, fps=args.fps) for ip in ips]
+    arduino = FakeArduino()
+
+    webcams = [Webcam(ip, args.pre_roll + args.post_roll + 1, args.ingest) for ip in ips]
+    for webcam in webcams:
+        webcam.connect()
+
+    events = queue.Queue()
+    detector = IR_Goal_Detector(9600, arduino.sample_rate, arduino.port, debounce=0.5)
+    detector.start(lambda val, timestamp: events.put((val, timestamp, monotonic())))
+
+    writer = ReplayWriter(max_workers=args.cameras)
+    folder = tempfile.mkdtemp(prefix='goal_to_replay_')
+
+    # fill the buffers before the first goal
+    sleep(args.pre_roll + 0.5)
+
+    samples = {stage: [] for stage in STAGES}
+    try:
+        for goal in range(args.goals):
+            goal_time = arduino.goal('b' if goal % 2 == 0 else 'r')
+            val, detected_time, received_time = events.get(timeout=5)
+
+            goal_folder = os.path.join(folder, 'goal_%d' % goal)
+            os.mkdir(goal_folder)
+            window = (detected_time - args.pre_roll, detected_time + args.post_roll)
+            future = writer.save(webcams, goal_folder, codec=args.codec, window=window)
+            filenames = future.result()
+            timings = future.timings
+            ready_time = monotonic()
+
+            player_time = player_start(filenames[-1])
+
+            samples['detection'].append(received_time - goal_time)
+            samples['snapshot'].append(timings['snapshot'] - goal_time)
+            samples['encode'].append(timings['encoded'] - timings['snapshot'])
+            samples['file_ready'].append(ready_time - goal_time)
+            samples['player_start'].append(player_time - ready_time)
+            samples['total'].append(player_time - goal_time)
+            print('goal %d: %.0f ms' % (goal + 1, samples['total'][-1] * 1000))
+
+            # let the detector debounce
+            sleep(0.5)
+    finally:
+        writer.shutdown()
+        detector.stop()
+        for webcam in webcams:
+            webcam.disconnect()
+        arduino.close()
+        for server in servers:
+            server.close()
+        shutil.rmtree(folder)
+
+    return {
+        'config': vars(args),
+        'machine': {'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'stages': {stage: percentiles(values) for stage, values in samples.items()},
+        'samples_ms': {stage: [v * 1000 for v in values] for stage, values in samples.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-c', '--cameras', type=int, default=1)
+    parser.add_argument('-g', '--goals', type=int, default=10)
+    parser.add_argument('-i', '--ingest', choices=('decode', 'passthrough'), default='decode')
+    parser.add_argument('-r', '--resolution', default='640x480')
+    parser.add_argument('-f', '--fps', type=int, default=30)
+    parser.add_argument('--codec', default='MJPG')
+    parser.add_argument('--pre_roll', type=float, default=4)
+    parser.add_argument('--post_roll', type=float, default=1)
+    parser.add_argument('-o', '--output', help='JSON file to write the results to')
+    args = parser.parse_args()
+
+    results = run(args)
+
+    print('\n%-14s %9s %9s %9s' % ('stage', 'p50 (ms)', 'p90 (ms)', 'p99 (ms)'))
+    for stage, stats in results['stages'].items():
+        print('%-14s %9.1f %9.1f %9.1f' % (stage, stats['p50_ms'], stats['p90_ms'], stats['p99_ms']))
+
+    if args.output:
+        with open(args.output, 'w') as out_file:
+            json.dump(results, out_file, indent=4)
+
+
+if __name__ == '__main__':
+    main()
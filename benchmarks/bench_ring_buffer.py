@@ -0,0 +1,81 @@
+"""
+Compares the list based Queue with the preallocated FrameRingBuffer
+for the webcam frame history.
+
+Usage: python -m benchmarks.bench_ring_buffer [-f fps] [-d duration] [-n frames]
+"""
+import argparse
+from time import perf_counter
+
+import numpy as np
+
+from core.utils.ring_buffer import FrameRingBuffer
+from core.utils.utils import Queue
+
+
+def make_frames(nb_frames, resolution):
+    """
+    Creates a few random frames that are cycled through during the benchmark
+    """
+    (w, h) = resolution
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 255, (h, w, 3), dtype=np.uint8) for _ in range(nb_frames)]
+
+
+def bench_queue(frames, capacity, nb_puts):
+    """
+    Mimics the old capture loop: every read allocates a new frame
+    which is appended to the list.
+    """
+    queue = Queue(capacity)
+    start = perf_counter()
+    for i in range(nb_puts):
+        queue.put(frames[i % len(frames)].copy())
+    put_time = perf_counter() - start
+
+    start = perf_counter()
+    queue.dump()
+    dump_time = perf_counter() - start
+
+    return put_time, dump_time
+
+
+def bench_ring_buffer(frames, capacity, nb_puts):
+    """
+    Capture loop with the ring buffer: frames are copied into
+    the preallocated storage.
+    """
+    buffer = FrameRingBuffer(capacity)
+    start = perf_counter()
+    for i in range(nb_puts):
+        buffer.put(frames[i % len(frames)])
+    put_time = perf_counter() - start
+
+    start = perf_counter()
+    buffer.dump()
+    dump_time = perf_counter() - start
+
+    return put_time, dump_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-f', '--fps', type=int, default=30)
+    parser.add_argument('-d', '--duration', type=int, default=10)
+    parser.add_argument('-n', '--nb_puts', type=int, default=2000)
+    parser.add_argument('-r', '--resolution', default='640x480')
+    args = parser.parse_args()
+
+    resolution = tuple(int(v) for v in args.resolution.split('x'))
+    capacity = args.fps * args.duration
+    frames = make_frames(8, resolution)
+
+    print('%d puts of %s frames, capacity %d' % (args.nb_puts, args.resolution, capacity))
+    for name, bench in (('Queue', bench_queue), ('FrameRingBuffer', bench_ring_buffer)):
+        put_time, dump_time = bench(frames, capacity, args.nb_puts)
+        print('%-16s put: %7.2f us/frame  dump: %7.3f ms' %
+              (name, put_time / args.nb_puts * 1e6, dump_time * 1e3))
+
+
+if __name__ == '__main__':
+    main()
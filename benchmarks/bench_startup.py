@@ -0,0 +1,84 @@
+"""
+Startup time of the headless mode.
+
+Launches `main.py --headless` several times and measures the time from
+the launch of the interpreter until the control interface answers,
+without any camera nor arduino. Fails when the median is above the
+target.
+
+Usage: python -m benchmarks.bench_startup [-n runs] [--target 1.0]
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+from time import monotonic, sleep
+from urllib.error import URLError
+from urllib.request import Request, urlopen
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def startup_time(timeout=30):
+    """
+    Returns the seconds the control interface took to answer
+    """
+    port = free_port()
+    url = 'http://127.0.0.1:%d' % port
+
+    start = monotonic()
+    process = subprocess.Popen([sys.executable, 'main.py', '--headless', '-p', str(port)],
+                               cwd=ROOT, stdout=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                with urlopen(url + '/status', timeout=1) as response:
+                    status = json.load(response)
+                break
+            except (URLError, ConnectionError):
+                if monotonic() - start > timeout or process.poll() is not None:
+                    raise Exception('The headless mode did not start')
+                sleep(0.005)
+        elapsed = monotonic() - start
+
+        urlopen(Request(url + '/stop', method='POST'), timeout=1).close()
+        process.wait(timeout)
+    finally:
+        if process.poll() is None:
+            process.kill()
+
+    # the empty replay folder of the run
+    shutil.rmtree(status['goal_videos'], ignore_errors=True)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--runs', type=int, default=10)
+    parser.add_argument('--target', type=float, default=1.0, help='median target in seconds')
+    args = parser.parse_args()
+
+    samples = np.array([startup_time() for _ in range(args.runs)]) * 1000
+    median = np.percentile(samples, 50)
+    print('headless startup: p50 %.0f ms, p90 %.0f ms, max %.0f ms (target %.0f ms)' %
+          (median, np.percentile(samples, 90), samples.max(), args.target * 1000))
+
+    if median > args.target * 1000:
+        print('Startup slower than the target')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""
+Offline benchmark of the vision goal detector.
+
+Runs the goal regions of Vision_Goal_Detector on every frame of a clip
+and reports the processing time per frame, the number of frames per
+second a single thread can process (three cameras at 30 fps need 90)
+and the detected goals.
+
+Without clip, a synthetic game is generated: a ball moving over a noisy
+table, with a flickering light, that enters the goals at known frames.
+The detections are then compared to them. Recorded clips (for example
+the replays of goal_videos) are given with --clip and their regions
+with --blue and --red.
+
+With --live, the capture frame rate of virtual cameras is measured with
+and without the detector running.
+
+Usage: python -m benchmarks.bench_vision_detector [-r 640x480] [-g goals]
+       python -m benchmarks.bench_vision_detector --clip cam1.avi --blue "1, 0, 0.35, 0.1, 0.3"
+       python -m benchmarks.bench_vision_detector --live [-c cameras]
+"""
+import argparse
+from time import perf_counter, sleep
+
+import cv2
+import numpy as np
+
+from benchmarks.fakes import MJPEGServer
+from core.utils.utils import parse_region
+from core.utils.vision_detector import GoalRegion, Vision_Goal_Detector
+from core.utils.webcam import Webcam
+
+BLUE_GOAL = '1, 0.0, 0.35, 0.1, 0.3'
+RED_GOAL = '1, 0.9, 0.35, 0.1, 0.3'
+
+# frames of the synthetic game between two goals
+RALLY_FRAMES = 60
+
+
+def synthetic_game(resolution, nb_goals, seed=0):
+    """
+    Returns the frames of a synthetic game and the (frame, color)
+    at which the ball enters a goal
+    """
+    (w, h) = resolution
+    rng = np.random.default_rng(seed)
+    table = rng.integers(20, 80, (h, w, 3), dtype=np.uint8)
+    radius = max(h // 40, 4)
+
+    frames = []
+    goals = []
+    for goal in range(nb_goals):
+        color = 'b' if goal % 2 == 0 else 'r'
+        target = 0.03 * w if color == 'b' else 0.97 * w
+
+        # the ball wanders then goes to the goal and rests there
+        start = np.array([w / 2, h * rng.uniform(0.2, 0.8)])
+        end = np.array([target, h / 2])
+        inside = False
+        for i in range(RALLY_FRAMES):
+            t = min(i / (RALLY_FRAMES * 0.7), 1)
+            wobble = np.array([0, h / 6 * np.sin(6 * t)]) * (1 - t)
+            (x, y) = start + (end - start) * t + wobble
+
+            # the ball enters the goal region
+            if not inside and (x < 0.1 * w or x > 0.9 * w) and 0.35 * h < y < 0.65 * h:
+                inside = True
+                goals.append((len(frames), color))
+
+            # flickering light and sensor noise
+            frame = cv2.add(table, int(rng.integers(-3, 4)))
+            noise = rng.integers(0, 6, (h, w, 1), dtype=np.uint8)
+            frame = cv2.add(frame, np.repeat(noise, 3, axis=2))
+            cv2.circle(frame, (int(x), int(y)), radius, (230, 230, 230), -1)
+            frames.append(frame)
+
+    return frames, goals
+
+
+def read_clip(filename):
+    cap = cv2.VideoCapture(filename)
+    frames = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def run_offline(frames, regions):
+    """
+    Processes the frames, returns the processing times and the detected
+    (frame, color)
+    """
+    durations = []
+    detections = []
+    for i, frame in enumerate(frames):
+        for region in regions:
+            start = perf_counter()
+            goal = region.process(frame)
+            durations.append(perf_counter() - start)
+            if goal:
+                detections.append((i, region.color))
+    return np.array(durations), detections
+
+
+def compare(goals, detections, tolerance=10):
+    """
+    Matches the detections to the goals, a detection counts if it has
+    the same color and comes at most tolerance frames after the goal
+    """
+    latencies = []
+    unmatched = list(detections)
+    for frame, color in goals:
+        for detection in unmatched:
+            if detection[1] == color and 0 <= detection[0] - frame <= tolerance:
+                latencies.append(detection[0] - frame)
+                unmatched.remove(detection)
+                break
+    return latencies, len(unmatched)
+
+
+def live_capture_rate(nb_cameras, resolution, duration, regions):
+    """
+    Returns the capture rate of every camera without then with the detector
+    """
+    ips = ['127.0.0.%d' % (i + 1) for i in range(nb_cameras)]
+    servers = [MJPEGServer(ip, resolution=resolution) for ip in ips]
+    webcams = [Webcam(ip, 2) for ip in ips]
+    for webcam in webcams:
+        webcam.connect()
+    detector = Vision_Goal_Detector(lambda: webcams, regions)
+
+    rates = []
+    try:
+        sleep(1)
+        for with_detector in (False, True):
+            if with_detector:
+                detector.start(lambda color, timestamp: None)
+            counts = [webcam.buffer.count for webcam in webcams]
+            sleep(duration)
+            rates.append([(webcam.buffer.count - count) / duration
+                          for webcam, count in zip(webcams, counts)])
+        process_ms = detector.metrics.latency('process', 99)
+    finally:
+        detector.stop()
+        for webcam in webcams:
+            webcam.disconnect()
+        for server in servers:
+            server.close()
+    return rates, process_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-r', '--resolution', default='640x480')
+    parser.add_argument('-g', '--goals', type=int, default=10)
+    parser.add_argument('--clip', help='recorded clip to process instead of the synthetic game')
+    parser.add_argument('--blue', default=BLUE_GOAL, help='blue goal region "camera, x, y, w, h"')
+    parser.add_argument('--red', default=RED_GOAL, help='red goal region "camera, x, y, w, h"')
+    parser.add_argument('--threshold', type=float, default=25)
+    parser.add_argument('--min_area', type=float, default=0.05)
+    parser.add_argument('--live', action='store_true', help='measure the capture rate of virtual cameras')
+    parser.add_argument('-c', '--cameras', type=int, default=3)
+    args = parser.parse_args()
+
+    resolution = tuple(int(v) for v in args.resolution.split('x'))
+    rois = [('b', parse_region(args.blue)), ('r', parse_region(args.red))]
+
+    if args.live:
+        regions = [(color, camera, roi) for color, (camera, roi) in rois]
+        rates, process_ms = live_capture_rate(args.cameras, resolution, 3, regions)
+        for name, camera_rates in zip(('without detector', 'with detector'), rates):
+            print('%-17s %s fps' % (name, ' '.join('%.1f' % rate for rate in camera_rates)))
+        print('detector p99: %.2f ms/frame' % process_ms)
+        return
+
+    if args.clip:
+        frames, goals = read_clip(args.clip), None
+    else:
+        frames, goals = synthetic_game(resolution, args.goals)
+
+    regions = [GoalRegion(color, roi, args.threshold, args.min_area) for color, (_, roi) in rois]
+    durations, detections = run_offline(frames, regions)
+
+    # a frame goes through both regions
+    per_frame = durations.reshape(len(frames), -1).sum(axis=1) * 1000
+    print('%d frames: %.3f ms/frame p50, %.3f ms p99, %.0f frames/s on one thread' % (
+        len(frames), np.percentile(per_frame, 50), np.percentile(per_frame, 99),
+        1000 / per_frame.mean()))
+
+    if goals is None:
+        for frame, color in detections:
+            print('goal %s at frame %d' % (color, frame))
+    else:
+        latencies, false_goals = compare(goals, detections)
+        print('%d/%d goals detected, %d false goals, latency %s frames' % (
+            len(latencies), len(goals), false_goals,
+            '%.1f' % np.mean(latencies) if latencies else '-'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Virtual hardware for the benchmarks: a pty based fake arduino speaking
+the IR detector protocol and a local droidcam-like MJPEG HTTP server.
+"""
+import os
+import tty
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Thread
+from time import monotonic, sleep
+
+import cv2
+import numpy as np
+
+BOUNDARY = b'dcmjpeg'
+
+
+class FakeArduino:
+    """
+    Pseudo terminal that behaves like the arduino of
+    arduino/IR_ball_detection: it sends '0' every sample period,
+    and 'b' or 'r' while a goal is simulated.
+    """
+    def __init__(self, sample_rate=10):
+        self.sample_rate = sample_rate
+
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+
+        self.symbol = b'0'
+        self.goal_time = None
+        self.goal_sent = Event()
+
+        self.running = True
+        self.thread = Thread(target=self.loop, daemon=True)
+        self.thread.start()
+
+    def loop(self):
+        while self.running:
+            symbol = self.symbol
+            send_time = monotonic()
+            os.write(self.master, symbol)
+            if symbol != b'0' and not self.goal_sent.is_set():
+                self.goal_time = send_time
+                self.goal_sent.set()
+            sleep(1 / self.sample_rate)
+
+    def goal(self, color='b', duration=0.5):
+        """
+        Simulates the ball resting in a goal for a while.
+        Returns the monotonic time at which the first byte was sent.
+        """
+        self.goal_sent.clear()
+        self.symbol = color.encode()
+        self.goal_sent.wait()
+        goal_time = self.goal_time
+
+        sleep(duration)
+        self.symbol = b'0'
+        return goal_time
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+
+def synthetic_frames(resolution, nb_frames=30):
+    """
+    Creates JPEG frames of a ball moving over a noisy background
+    """
+    (w, h) = resolution
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 60, (h, w, 3), dtype=np.uint8)
+
+    frames = []
+    for i in range(nb_frames):
+        frame = background.copy()
+        x = int((i + 0.5) / nb_frames * w)
+        cv2.circle(frame, (x, h // 2), max(h // 30, 4), (255, 255, 255), -1)
+        cv2.putText(frame, str(i), (10, h - 10), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+        frames.append(cv2.imencode('.jpg', frame)[1].tobytes())
+    return frames
+
+
+class MJPEGServer:
+    """
+    Local stand-in for the droidcam app serving a multipart MJPEG
+    stream on http://<host>:<port>/video at the given frame rate
+    (or as fast as possible with fps=0).
+    """
+    def __init__(self, host='127.0.0.1', port=4747, resolution=(640, 480), fps=30):
+        frames = synthetic_frames(resolution)
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header('Content-Type',
+                                 'multipart/x-mixed-replace; boundary=--%s' % BOUNDARY.decode())
+                self.end_headers()
+
+                i = 0
+                next_time = monotonic()
+                try:
+                    while True:
+                        data = frames[i % len(frames)]
+                        self.wfile.write(b'--' + BOUNDARY + b'\r\n'
+                                         b'Content-Type: image/jpeg\r\n'
+                                         b'Content-Length: %d\r\n\r\n' % len(data) +
+                                         data + b'\r\n')
+                        i += 1
+
+                        # fps=0 serves the frames as fast as possible
+                        if fps:
+                            next_time += 1 / fps
+                            sleep(max(next_time - monotonic(), 0))
+                except OSError:
+                    # client disconnected
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
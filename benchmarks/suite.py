@@ -0,0 +1,272 @@
+"""
+Micro-benchmarks of the capture, buffer and encode hot paths.
+
+Every case runs headless on synthetic frames, once per resolution and
+number of cameras (one thread per camera), in a fresh process so that
+the peak RSS belongs to the case. It reports the throughput in frames
+per second, the p50/p99 latency of one operation and the peak RSS.
+
+Usage: python -m benchmarks.suite [-k case] [-r 640x480] [-c 1 2 3]
+                                  [--save baseline.json] [--compare baseline.json]
+"""
+import argparse
+import json
+import os
+import resource
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import count
+from multiprocessing import get_context
+from threading import Barrier, Thread
+from time import perf_counter
+
+import cv2
+import numpy as np
+
+from benchmarks.bench_ring_buffer import make_frames
+from benchmarks.fakes import MJPEGServer, synthetic_frames
+from core.utils import constants
+from core.utils.ball_tracker import BallTracker
+from core.utils.clip import Clip
+from core.utils.composite import render_composite
+from core.utils.mjpeg import MJPEGStream
+from core.utils.ring_buffer import FrameRingBuffer
+from core.utils.utils import Queue
+from core.utils.webcam import Webcam
+
+RESOLUTIONS = ('480x360', '640x480', '1280x720')
+
+# 10 seconds at 30 fps
+CAPACITY = 300
+
+# frames per saved clip
+CLIP_LENGTH = 60
+
+
+def buffer_put(buffer_class):
+    def case(resolution):
+        frames = make_frames(8, resolution)
+        buffer = buffer_class(CAPACITY)
+        i = count()
+
+        def op():
+            # a capture read allocates a new frame with the list Queue
+            frame = frames[next(i) % len(frames)]
+            buffer.put(frame.copy() if buffer_class is Queue else frame)
+        return op, 1
+    return case
+
+
+def buffer_dump(buffer_class):
+    def case(resolution):
+        frames = make_frames(8, resolution)
+        buffer = buffer_class(CAPACITY)
+        for i in range(CAPACITY):
+            buffer.put(frames[i % len(frames)].copy())
+
+        if buffer_class is Queue:
+            return buffer.dump, CAPACITY
+        return buffer.snapshot, CAPACITY
+    return case
+
+
+def preview_png(resolution):
+    """
+    Former Webcam.current_frame: full resolution PNG encoding
+    """
+    frame = make_frames(1, resolution)[0]
+    return (lambda: cv2.imencode('.png', frame)), 1
+
+
+def preview_pipeline(resolution):
+    """
+    Webcam.update_preview: downscale then PPM encoding
+    """
+    frame = make_frames(1, resolution)[0]
+    webcam = Webcam('127.0.0.1', 1)
+
+    def op():
+        webcam.preview_time = 0
+        webcam.update_preview(frame)
+    return op, 1
+
+
+def ball_tracking(resolution):
+    """
+    BallTracker.process on a moving ball, with its search window
+    """
+    frames = [cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+              for data in synthetic_frames(resolution)]
+    tracker = BallTracker(Webcam('127.0.0.1', 1), constants.BALL_COLORS['white'])
+    i = count()
+
+    def op():
+        n = next(i)
+        tracker.process(frames[n % len(frames)], n / 30)
+    return op, 1
+
+
+def save_clip(codec, jpeg=False):
+    def case(resolution):
+        frames = np.stack(make_frames(8, resolution) * (CLIP_LENGTH // 8))
+        if jpeg:
+            frames = [cv2.imencode('.jpg', frame)[1].tobytes() for frame in frames]
+        clip = Clip(frames, np.arange(len(frames)) / 30, jpeg=jpeg)
+
+        directory = tempfile.TemporaryDirectory()
+        filename = os.path.join(directory.name, 'clip.avi')
+        return (lambda: clip.save(filename, codec)), len(frames), directory.cleanup
+    return case
+
+
+def save_composite(resolution):
+    # the clips of three cameras in a single video, in the tiles of the replay window
+    frames = np.stack(make_frames(8, resolution) * (CLIP_LENGTH // 8))
+    clips = [Clip(frames, np.arange(len(frames)) / 30 + i / 100) for i in range(3)]
+
+    directory = tempfile.TemporaryDirectory()
+    filename = os.path.join(directory.name, 'composite.avi')
+    return ((lambda: render_composite(clips, filename, constants.CAM_RESOLUTION_SMALL)),
+            len(frames), directory.cleanup)
+
+
+def read_stream(reader):
+    def case(resolution):
+        server = MJPEGServer(port=0, resolution=resolution, fps=0)
+        url = 'http://127.0.0.1:%d/video' % server.server.server_address[1]
+
+        if reader == 'opencv':
+            cap = cv2.VideoCapture(url)
+        else:
+            cap = MJPEGStream(url)
+            cap.open()
+
+        def cleanup():
+            cap.release()
+            server.close()
+        return cap.read, 1, cleanup
+    return case
+
+
+CASES = {
+    'queue_put': buffer_put(Queue),
+    'ring_buffer_put': buffer_put(FrameRingBuffer),
+    'queue_dump': buffer_dump(Queue),
+    'ring_buffer_snapshot': buffer_dump(FrameRingBuffer),
+    'preview_png': preview_png,
+    'preview_pipeline': preview_pipeline,
+    'ball_tracking': ball_tracking,
+    'save_mjpg': save_clip('MJPG'),
+    'save_mjpg_passthrough': save_clip('MJPG', jpeg=True),
+    'save_mp4v': save_clip('mp4v'),
+    'save_xvid': save_clip('XVID'),
+    'save_composite': save_composite,
+    'read_opencv': read_stream('opencv'),
+    'read_mjpeg_passthrough': read_stream('passthrough'),
+}
+
+
+def run_case(name, resolution, nb_cameras, duration):
+    """
+    Runs a case in one thread per camera for about duration seconds.
+    A case returns its operation, the number of frames per operation
+    and optionally a function cleaning up after the runs.
+    """
+    resolution = tuple(int(v) for v in resolution.split('x'))
+    cases = [CASES[name](resolution) for _ in range(nb_cameras)]
+    try:
+        return measure([case[:2] for case in cases], duration)
+    finally:
+        for case in cases:
+            if len(case) > 2:
+                case[2]()
+
+
+def measure(ops, duration):
+    """
+    Runs every (operation, frames per operation) in its own thread
+    """
+    nb_cameras = len(ops)
+    frames_per_op = ops[0][1]
+
+    latencies = [[] for _ in range(nb_cameras)]
+    barrier = Barrier(nb_cameras + 1)
+
+    def worker(op, samples):
+        barrier.wait()
+        end = perf_counter() + duration
+        while perf_counter() < end or len(samples) < 3:
+            start = perf_counter()
+            op()
+            samples.append(perf_counter() - start)
+
+    threads = [Thread(target=worker, args=(op, samples))
+               for (op, _), samples in zip(ops, latencies)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = perf_counter() - start
+
+    samples = np.concatenate(latencies) * 1000
+    return {
+        'fps': len(samples) * frames_per_op / elapsed,
+        'p50_ms': float(np.percentile(samples, 50)),
+        'p99_ms': float(np.percentile(samples, 99)),
+        # kilobytes on linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-k', '--cases', nargs='+', choices=CASES, default=list(CASES))
+    parser.add_argument('-r', '--resolutions', nargs='+', default=RESOLUTIONS)
+    parser.add_argument('-c', '--cameras', nargs='+', type=int, default=[1, 2, 3])
+    parser.add_argument('-d', '--duration', type=float, default=1, help='seconds per run')
+    parser.add_argument('--save', help='JSON file to save the results to')
+    parser.add_argument('--compare', help='baseline JSON file to compare against')
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    print('%-24s %9s %4s %10s %9s %9s %8s %8s' %
+          ('case', 'res', 'cams', 'fps', 'p50 (ms)', 'p99 (ms)', 'RSS (MB)', 'vs base'))
+
+    results = {}
+    context = get_context('spawn')
+    for name in args.cases:
+        for resolution in args.resolutions:
+            for nb_cameras in args.cameras:
+                key = '%s@%s@%d' % (name, resolution, nb_cameras)
+                with ProcessPoolExecutor(1, mp_context=context) as executor:
+                    try:
+                        result = executor.submit(run_case, name, resolution,
+                                                 nb_cameras, args.duration).result()
+                    except Exception as e:
+                        print('%-24s %9s %4d  failed: %s' % (name, resolution, nb_cameras, e))
+                        continue
+                results[key] = result
+
+                comparison = ''
+                if key in baseline:
+                    comparison = '%+7.1f%%' % ((result['fps'] / baseline[key]['fps'] - 1) * 100)
+                print('%-24s %9s %4d %10.1f %9.3f %9.3f %8.1f %8s' %
+                      (name, resolution, nb_cameras, result['fps'], result['p50_ms'],
+                       result['p99_ms'], result['peak_rss_mb'], comparison))
+
+    if args.save:
+        with open(args.save, 'w') as out_file:
+            json.dump(results, out_file, indent=4)
+
+
+if __name__ == '__main__':
+    # the cases import the modules relative to the repository root
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    main()
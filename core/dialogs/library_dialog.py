@@ -0,0 +1,127 @@
+import os
+from datetime import datetime
+from time import time
+
+import PySimpleGUI as sg
+
+HEADINGS = ['Date', 'Replay', 'Scorer', 'Score', 'Speed', 'Size']
+
+SCORERS = {'all': None, 'blue': 'blue', 'red': 'red', 'no goal': ''}
+
+
+class Library_dialog:
+    """
+    Dialog to browse the replays of the library, search them by scorer
+    and age, watch them and delete them. Only the index is read.
+    """
+
+    def __init__(self, library, replay_dialog):
+        self.library = library
+        self.replay_dialog = replay_dialog
+        self.replays = []
+
+        self.window = sg.Window("Replay library",
+                                self.setup_layout(),
+                                finalize=True)
+        self.search()
+
+    def setup_layout(self):
+        """
+        Setup layout for library dialog
+        """
+        search_row = [
+            sg.Text('Scorer'),
+            sg.Combo(list(SCORERS), 'all', readonly=True, enable_events=True, key='k_scorer'),
+            sg.Text('Last days', tooltip='Only the replays of the last days (empty for all)'),
+            sg.Input('', size=(5, 1), key='k_days'),
+            sg.Button('Search'),
+        ]
+
+        replays_row = [
+            sg.Table([], headings=HEADINGS,
+                     col_widths=[16, 8, 6, 6, 9, 8],
+                     auto_size_columns=False,
+                     num_rows=15,
+                     select_mode=sg.TABLE_SELECT_MODE_BROWSE,
+                     enable_events=True,
+                     key='k_replays'),
+            sg.Image(size=(320, 120), key='k_thumbnail'),
+        ]
+
+        buttons = [sg.Text('', key='k_total'), sg.Push(),
+                   sg.Button('Play'), sg.Button('Delete'), sg.Button('Close')]
+
+        return [search_row, replays_row, buttons]
+
+    def search(self):
+        """
+        Fills the table with the replays matching the search
+        """
+        since = None
+        try:
+            days = float(self.window['k_days'].get())
+            since = time() - days * 24 * 3600
+        except ValueError:
+            pass
+
+        self.replays = self.library.search(SCORERS[self.window['k_scorer'].get()], since)
+        rows = []
+        for replay in self.replays:
+            score = '' if replay['blue_score'] is None else '%d - %d' % (replay['blue_score'],
+                                                                          replay['red_score'])
+            speed = '' if replay['speed'] is None else '%.0f km/h' % replay['speed']
+            rows.append([datetime.fromtimestamp(replay['time']).strftime('%d.%m.%Y %H:%M'),
+                         replay['name'],
+                         replay['scorer'] or '',
+                         score,
+                         speed,
+                         '%.1f MB' % (replay['size'] / 1e6)])
+        self.window['k_replays'].update(values=rows)
+
+        quota = self.library.quota
+        self.window['k_total'].update('%d replays, %.0f MB%s' % (
+            len(rows), self.library.total_size() / 1e6,
+            ' of %.0f MB' % (quota / 1e6) if quota > 0 else ''))
+
+    def selected(self):
+        """
+        Returns the selected replay, or None
+        """
+        selection = self.window['k_replays'].SelectedRows
+        if selection and selection[0] < len(self.replays):
+            return self.replays[selection[0]]
+        return None
+
+    def run(self):
+        """
+        Runs the dialog event loop
+        """
+        while True:
+            event, values = self.window.read()
+
+            if event in ("Close", sg.WIN_CLOSED):
+                break
+
+            elif event in ("Search", 'k_scorer'):
+                self.search()
+
+            elif event == 'k_replays':
+                replay = self.selected()
+                if replay is not None:
+                    self.window['k_thumbnail'].update(data=self.library.thumbnail(replay['id']))
+
+            elif event == "Play":
+                replay = self.selected()
+                files = self.library.files(replay['id']) if replay is not None else []
+                if files:
+                    self.library.mark_used(replay['id'])
+                    self.replay_dialog.play_folder(os.path.dirname(files[0]))
+
+            elif event == "Delete":
+                replay = self.selected()
+                if replay is not None and sg.popup_yes_no('Delete the replay %s?' % replay['name'],
+                                                          keep_on_top=True) == 'Yes':
+                    self.library.remove(replay['id'])
+                    self.search()
+
+        self.window.close()
@@ -1,35 +1,60 @@
-import json
 import os
+from glob import glob
+from threading import Lock
+from time import monotonic
 
 import PySimpleGUI as sg
 import vlc
 
 from core.utils import constants
+from core.utils.clip_player import ClipPlayer
+from core.utils.metrics import Metrics
 
 
 class Replay_dialog:
     """
-    Small window that show the replay and then exits
+    Window that shows the goal replays.
+
+    It is created once, hidden, with its VLC instance and its media
+    players already bound to the window, so that showing a replay only
+    swaps the media of the players. The media of a replay can be
+    preloaded as soon as its files are written, even while another
+    replay is playing. A new speed factor applies to the replay playing.
+
+    A composite replay (all the cameras in a single video) is played by
+    a single player, in an image as wide as the camera images.
+
+    The clips snapshotted for a replay can also be shown straight from
+    memory, without waiting for the files: their frames are drawn in
+    images of their own, paced by their timestamps and the speed factor.
+
+    A replay is started with start() and followed with poll(), so that
+    the main window keeps running while it plays. It can be cut short
+    with the Skip button or the Escape key.
     """
-    def __init__(self, camera_keys):
+    def __init__(self, camera_keys, config):
         self.camera_keys = camera_keys
         self.nb_camera = len(camera_keys)
-
-        # load settings
-        with open(constants.SETTINGS_PATH, "r") as content:
-            self.settings = json.load(content)
+        self.config = config
 
         # create the window
         if self.nb_camera < 3:
-            replay_row = [sg.Image('',
-                                   size=constants.CAM_RESOLUTION_BIG,
-                                   key=key) for key in self.camera_keys]
+            (w, h) = constants.CAM_RESOLUTION_BIG
         else:
-            replay_row = [sg.Image('',
-                                   size=constants.CAM_RESOLUTION_SMALL,
-                                   key=key) for key in self.camera_keys]
+            (w, h) = constants.CAM_RESOLUTION_SMALL
+        self.image_size = (w, h)
+        self.memory_keys = ['k_memory_%d' % i for i in range(self.nb_camera)]
+        replay_row = [sg.Image('', size=(w, h), key=key) for key in self.camera_keys]
+        composite_row = [sg.Image('', size=(w * self.nb_camera, h), key='k_composite', visible=False)]
+        memory_row = [sg.Image('', size=(w, h), key=key, visible=False) for key in self.memory_keys]
+        buttons_row = [sg.Push(), sg.Button('Skip'), sg.Button('Skip all')]
 
-        self.replay_window = sg.Window("Replay", [replay_row], finalize=True)
+        # closing the window only hides it
+        self.replay_window = sg.Window("Replay",
+                                       [replay_row, composite_row, memory_row, buttons_row],
+                                       finalize=True,
+                                       return_keyboard_events=True,
+                                       enable_close_attempted_event=True)
 
         # create media players
         self.vlc_instance = vlc.Instance()
@@ -38,29 +63,269 @@ class Replay_dialog:
             self.media_players.append(self.vlc_instance.media_player_new())
             self.replay_window[key].expand(True, True)
             self.media_players[-1].set_hwnd(self.replay_window[key].Widget.winfo_id())
+        self.composite_player = self.vlc_instance.media_player_new()
+        self.composite_player.set_hwnd(self.replay_window['k_composite'].Widget.winfo_id())
+        self.layout = 'cameras'
+
+        self.replay_window.hide()
+        self.shown = False
+
+        # replay playing: (media players, medias) or the clip player
+        self.current = None
+        self.clip_player = None
+        self.start_time = None
+        self.goal_time = None
+        self.started = False
+
+        # (composite, media) of the replays ready to be played, by goal number
+        self.preloaded = {}
+        # clips of the replays to show from memory, by goal number
+        self.clips = {}
+        self.preload_lock = Lock()
+
+        self.metrics = Metrics('replay')
 
-    def play(self, goal_number):
-        i = 1
-        for media_player in self.media_players:
-            source = os.path.join(constants.GOAL_VIDEOS_PATH,
-                                  'goal_%d' % goal_number,
-                                  'cam%d.avi' % i)
-            i += 1
+    def load(self, folder_path):
+        """
+        Creates the media of the replay saved in a folder and starts
+        parsing them in the background. Returns (composite, media).
+        """
+        # the extension depends on the container of the replays
+        sources = glob(os.path.join(folder_path, 'composite.*'))
+        composite = len(sources) > 0
+        if not composite:
+            sources = [source for i in range(1, self.nb_camera + 1)
+                       for source in glob(os.path.join(folder_path, 'cam%d.*' % i))[:1]]
 
+        medias = []
+        for source in sources:
             media = self.vlc_instance.media_new(source)
+            media.parse_with_options(vlc.MediaParseFlag.local, 0)
+            medias.append(media)
+        return composite, medias
+
+    def preload(self, goal_number):
+        """
+        Loads the replay of a goal of the current game, so that it is
+        ready to be played. Can be called from any thread.
+        """
+        (composite, medias) = self.load(os.path.join(constants.GOAL_VIDEOS_PATH,
+                                                     'goal_%d' % goal_number))
+
+        with self.preload_lock:
+            # a replay saved again replaces the previous one
+            for media in self.preloaded.pop(goal_number, (False, []))[1]:
+                media.release()
+            self.preloaded[goal_number] = (composite, medias)
+
+    def speed_changed(self):
+        """
+        Applies a new speed factor to the players, from the event loop
+        """
+        for media_player in self.media_players + [self.composite_player]:
+            media_player.set_rate(self.config.speed_factor)
+
+    def preload_clips(self, goal_number, clips):
+        """
+        Keeps the clips of a goal to show its replay from memory
+        """
+        with self.preload_lock:
+            self.clips[goal_number] = clips
+
+    def drop(self, goal_number):
+        """
+        Forgets the replay of a goal that will not be shown
+        """
+        with self.preload_lock:
+            self.clips.pop(goal_number, None)
+            for media in self.preloaded.pop(goal_number, (False, []))[1]:
+                media.release()
+
+    def show_layout(self, layout):
+        """
+        Shows the camera images, the composite image or the images
+        of the replays from memory
+        """
+        if layout != self.layout:
+            self.layout = layout
+            for key in self.camera_keys:
+                self.replay_window[key].update(visible=layout == 'cameras')
+            self.replay_window['k_composite'].update(visible=layout == 'composite')
+            for key in self.memory_keys:
+                self.replay_window[key].update(visible=layout == 'memory')
+
+    def start(self, goal_number, goal_time=None):
+        """
+        Starts the replay of a goal, from memory if its clips were kept.
+        Returns False if there is none. The time between goal_time
+        (monotonic) and the first frame on screen is recorded in the
+        metrics.
+        """
+        with self.preload_lock:
+            clips = self.clips.pop(goal_number, None)
+        if clips is not None:
+            return self.start_clips(clips, goal_time)
+
+        with self.preload_lock:
+            preloaded = self.preloaded.pop(goal_number, None)
+        if preloaded is None:
+            self.preload(goal_number)
+            with self.preload_lock:
+                preloaded = self.preloaded.pop(goal_number)
+
+        return self.start_medias(*preloaded, goal_time=goal_time)
+
+    def start_medias(self, composite, medias, goal_time=None):
+        """
+        Starts playing the media, returns False if there are none
+        """
+        self.stop()
+        if not medias:
+            return False
+        media_players = [self.composite_player] if composite else self.media_players[:len(medias)]
+        self.show_layout('composite' if composite else 'cameras')
+
+        self.begin(goal_time)
+        for media_player, media in zip(media_players, medias):
             media_player.set_media(media)
-            media_player.set_rate(float(self.settings['speed_factor']))
+            media_player.set_rate(self.config.speed_factor)
             media_player.play()
+        self.current = (media_players, medias)
+        return True
+
+    def start_clips(self, clips, goal_time=None):
+        """
+        Starts showing clips from memory, returns False if they are empty
+        """
+        self.stop()
+        clips = clips[:self.nb_camera]
+        if not any(len(clip) > 0 for clip in clips):
+            return False
+        self.show_layout('memory')
+
+        self.begin(goal_time)
+        self.clip_player = ClipPlayer(clips, self.image_size, self.config.speed_factor)
+        self.clip_player.start(self.start_time)
+        return True
+
+    def begin(self, goal_time):
+        self.start_time = monotonic()
+        self.goal_time = goal_time
+        self.started = False
+        if not self.shown:
+            self.shown = True
+            self.replay_window.un_hide()
+
+    def on_screen(self, now):
+        """
+        Records the latencies of the first frame on screen
+        """
+        self.started = True
+        self.metrics.observe('player_start', now - self.start_time)
+        if self.goal_time is not None:
+            self.metrics.observe('goal_to_replay', now - self.goal_time)
+
+    def poll(self, timeout=0):
+        """
+        Handles the events of the replay window and follows the replay.
+        Returns None while it plays, else why it stopped: 'ended',
+        'skip' or 'skip_all'.
+        """
+        if self.current is None and self.clip_player is None:
+            return 'ended'
+        event, values = self.replay_window.read(timeout=timeout)
+
+        if self.clip_player is not None:
+            reason = self.follow_clips()
+        else:
+            reason = self.follow_medias()
+
+        if event in ("Skip", sg.WIN_CLOSED, sg.WINDOW_CLOSE_ATTEMPTED_EVENT) or \
+                (event or '').startswith('Escape'):
+            reason = 'skip'
+        elif event == "Skip all":
+            reason = 'skip_all'
+
+        if reason is not None:
+            self.stop()
+        return reason
+
+    def follow_medias(self):
+        """
+        Returns 'ended' once the media players stopped
+        """
+        media_player = self.current[0][-1]
+        if not self.started and media_player.is_playing():
+            self.on_screen(monotonic())
+        elif self.started and not media_player.is_playing():
+            return 'ended'
+        if media_player.get_state() in (vlc.State.Ended, vlc.State.Error):
+            return 'ended'
+        return None
+
+    def follow_clips(self):
+        """
+        Draws the frames of the clips due by now, returns 'ended'
+        after the last one
+        """
+        now = monotonic()
+        self.clip_player.set_speed(self.config.speed_factor, now)
+        for i, data in self.clip_player.updates(now):
+            self.replay_window[self.memory_keys[i]].update(data=data)
+        if not self.started:
+            self.on_screen(monotonic())
+        return 'ended' if self.clip_player.ended(now) else None
+
+    def stop(self):
+        """
+        Stops the replay playing, the window stays ready for the next one
+        """
+        self.clip_player = None
+        if self.current is None:
+            return
+        (media_players, medias) = self.current
+        self.current = None
+        for media_player in media_players:
+            media_player.stop()
+            # so that the files can be deleted
+            media_player.set_media(None)
+        for media in medias:
+            media.release()
+
+    def hide(self):
+        if self.shown:
+            self.shown = False
+            self.replay_window.hide()
 
-        while True:
-            event, values = self.replay_window.read(timeout=200)
+    def play_folder(self, folder_path):
+        """
+        Shows the replay saved in a folder until it ends, for the replay library
+        """
+        if self.start_medias(*self.load(folder_path)):
+            while self.poll(timeout=50) is None:
+                pass
+        self.hide()
 
-            if not self.media_players[-1].is_playing():
-                break
-            if event == "Exit" or event == sg.WIN_CLOSED:
-                break
+    def status(self):
+        """
+        Returns a short summary of the metrics for the status strip
+        """
+        return 'replay: player start %.0f ms, goal to replay %.0f ms' % (
+            self.metrics.latency('player_start'),
+            self.metrics.latency('goal_to_replay'))
 
-        # cleanup after replay
-        for media_player in self.media_players:
+    def close(self):
+        """
+        Releases the players and closes the window
+        """
+        self.stop()
+        for media_player in self.media_players + [self.composite_player]:
             media_player.release()
+        with self.preload_lock:
+            for (_, medias) in self.preloaded.values():
+                for media in medias:
+                    media.release()
+            self.preloaded.clear()
+            self.clips.clear()
+        self.vlc_instance.release()
         self.replay_window.close()
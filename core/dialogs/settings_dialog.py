@@ -1,8 +1,11 @@
 import json
+import os
+from concurrent.futures import ThreadPoolExecutor
 
 import PySimpleGUI as sg
 
 from core.utils import constants
+from core.utils.utils import parse_resolution
 
 
 class Settings_dialog:
@@ -18,7 +21,8 @@ class Settings_dialog:
         # Load current settings
         try:
             with open(constants.SETTINGS_PATH, "r") as content:
-                self.settings = json.load(content)
+                # settings added since the file was created take their default value
+                self.settings = dict(self.default_settings, **json.load(content))
         except FileNotFoundError:
             self.settings = self.default_settings
             self.save()
@@ -36,10 +40,102 @@ class Settings_dialog:
         replay_settings = [sg.Frame("Replay", [
             [sg.Text('Speed factor', size=(15, 1), tooltip='How much the video is slowed'),
              sg.Input(self.settings['speed_factor'], key='speed_factor')],
-            [sg.Text('Replay duration', size=(15, 1), tooltip='How long the replay will be'),
+            [sg.Text('Replay duration', size=(15, 1), tooltip='How many seconds of video are kept in memory'),
              sg.Input(self.settings['replay_duration'], key='replay_duration')],
             [sg.Text('Replay delay', size=(15, 1), tooltip='Time between the goal detection and the replay'),
              sg.Input(self.settings['replay_delay'], key='replay_delay')],
+            [sg.Text('Pre-roll', size=(15, 1), tooltip='Seconds of replay before the goal'),
+             sg.Input(self.settings['pre_roll'], key='pre_roll')],
+            [sg.Text('Post-roll', size=(15, 1), tooltip='Seconds of replay after the goal'),
+             sg.Input(self.settings['post_roll'], key='post_roll')],
+            [sg.Text('Replay layout', size=(15, 1),
+                     tooltip='separate: one video per camera\n'
+                             'composite: the cameras side by side in a single video'),
+             sg.Combo(['separate', 'composite'], self.settings['replay_layout'],
+                      readonly=True, key='replay_layout')],
+            [sg.Text('Replay source', size=(15, 1),
+                     tooltip='file: show the replay once its videos are written\n'
+                             'memory: show the buffered frames right away, the videos are written meanwhile'),
+             sg.Combo(['file', 'memory'], self.settings['replay_source'],
+                      readonly=True, key='replay_source')],
+            [sg.Text('Library quota', size=(15, 1),
+                     tooltip='GB of replays kept on disk, the oldest are deleted beyond (0 for no limit)'),
+             sg.Input(self.settings['library_quota'], key='library_quota')],
+            [sg.Text('Library eviction', size=(15, 1),
+                     tooltip='lru: delete the replays watched the longest ago first\n'
+                             'age: delete the oldest replays first'),
+             sg.Combo(['lru', 'age'], self.settings['library_eviction'],
+                      readonly=True, key='library_eviction')],
+        ])]
+
+        encoding_settings = [sg.Frame("Encoding", [
+            [sg.Text('Codec', size=(15, 1),
+                     tooltip='MJPG: fastest to write, largest files\n'
+                             'mp4v, XVID: smaller files, slower to write\n'
+                             'avc1: H.264, if supported by this computer\n'
+                             'Unsupported codecs fall back to MJPG/avi'),
+             sg.Combo(list(constants.REPLAY_CODECS), self.settings['replay_codec'],
+                      readonly=True, key='replay_codec')],
+            [sg.Text('Container', size=(15, 1), tooltip='File format of the replays'),
+             sg.Combo(list(constants.REPLAY_CONTAINERS), self.settings['replay_container'],
+                      readonly=True, key='replay_container')],
+            [sg.Text('Quality', size=(15, 1), tooltip='JPEG quality of the MJPG replays (1-100)'),
+             sg.Input(self.settings['replay_quality'], key='replay_quality')],
+            [sg.Text('Resolution', size=(15, 1),
+                     tooltip='Largest size of the replays (WIDTHxHEIGHT), native to keep the camera size'),
+             sg.Combo(['native', '1280x720', '960x540', '640x480', '480x360'],
+                      self.settings['replay_resolution'], key='replay_resolution')],
+            [sg.Button("Compare codecs", tooltip='Encoding time and file size of every codec on this computer')],
+        ])]
+
+        camera_settings = [sg.Frame("Cameras", [
+            [sg.Text('Ingest mode', size=(15, 1),
+                     tooltip='decode: buffer decoded frames\n'
+                             'passthrough: buffer the compressed stream, lighter on memory and CPU'),
+             sg.Combo(['decode', 'passthrough'], self.settings['ingest_mode'],
+                      readonly=True, key='ingest_mode')],
+            [sg.Text('Capture mode', size=(15, 1),
+                     tooltip='thread: capture in the GUI process\n'
+                             'process: one process per camera (decode ingest only), scales with the CPU cores'),
+             sg.Combo(['thread', 'process'], self.settings['capture_mode'],
+                      readonly=True, key='capture_mode')],
+            [sg.Text('Preview FPS', size=(15, 1), tooltip='Maximum frame rate of the live preview'),
+             sg.Input(self.settings['preview_fps'], key='preview_fps')],
+            [sg.Text('Camera timeout', size=(15, 1),
+                     tooltip='Seconds to connect to a camera or to wait for a frame,\n'
+                             'a camera without frame for longer is reconnected'),
+             sg.Input(self.settings['camera_timeout'], key='camera_timeout')],
+            [sg.Text('Stored resolution', size=(15, 1),
+                     tooltip='Largest size of the buffered frames, e.g. 640x480 or native\n'
+                             'per camera separated by commas: 640x480, native'),
+             sg.Input(self.settings['stored_resolution'], key='stored_resolution')],
+            [sg.Text('Stored FPS', size=(15, 1),
+                     tooltip='Highest frame rate of the buffered frames, e.g. 15 or native\n'
+                             'per camera separated by commas: 30, 15'),
+             sg.Input(self.settings['stored_fps'], key='stored_fps')],
+            [sg.Text('Recording mode', size=(15, 1),
+                     tooltip='memory: encode the replay from memory after the goal\n'
+                             'segments: continuously record short segments on disk, saving a replay is instant'),
+             sg.Combo(['memory', 'segments'], self.settings['recording_mode'],
+                      readonly=True, key='recording_mode')],
+            [sg.Text('Segment duration', size=(15, 1), tooltip='Length of the recorded segments (s)'),
+             sg.Input(self.settings['segment_duration'], key='segment_duration')],
+            [sg.Text('Ball color', size=(15, 1),
+                     tooltip='Color of the ball followed to measure the shots speed (none to disable)'),
+             sg.Combo(['none'] + list(constants.BALL_COLORS), self.settings['ball_color'],
+                      readonly=True, key='ball_color')],
+            [sg.Text('Field width', size=(15, 1),
+                     tooltip='Meters of table seen across the width of the cameras'),
+             sg.Input(self.settings['field_width'], key='field_width')],
+            [sg.Text('Metrics interval', size=(15, 1),
+                     tooltip='Seconds between two lines of the metrics file (0 to disable)'),
+             sg.Input(self.settings['metrics_interval'], key='metrics_interval')],
+            [sg.Text('Spectator port', size=(15, 1),
+                     tooltip='Port of the live streams and replays for the spectators (0 to disable)'),
+             sg.Input(self.settings['stream_port'], key='stream_port')],
+            [sg.Text('Spectator FPS', size=(15, 1),
+                     tooltip='Frame rate of the live streams sent to the spectators'),
+             sg.Input(self.settings['stream_fps'], key='stream_fps')],
         ])]
 
         serial_settings = [sg.Frame("Serial", [
@@ -49,11 +145,34 @@ class Settings_dialog:
              sg.Input(self.settings['port'], key='port')],
             [sg.Text('Detector Sample Rate', size=(15, 1), tooltip='IR detector sample rate'),
              sg.Input(self.settings['detector_sample_rate'], key='detector_sample_rate')],
+            [sg.Text('Detector Debounce', size=(15, 1), tooltip='Minimum time between two goals (s)'),
+             sg.Input(self.settings['detector_debounce'], key='detector_debounce')],
+        ])]
+
+        vision_settings = [sg.Frame("Goal detection", [
+            [sg.Text('Goal detector', size=(15, 1),
+                     tooltip='ir: arduino and IR sensors (Serial settings)\n'
+                             'vision: ball entering the goal regions of the cameras'),
+             sg.Combo(['ir', 'vision'], self.settings['goal_detector'],
+                      readonly=True, key='goal_detector')],
+            [sg.Text('Blue goal region', size=(15, 1),
+                     tooltip='camera, x, y, w, h (relative to the frame size, from 0 to 1)'),
+             sg.Input(self.settings['vision_blue_goal'], key='vision_blue_goal')],
+            [sg.Text('Red goal region', size=(15, 1),
+                     tooltip='camera, x, y, w, h (relative to the frame size, from 0 to 1)'),
+             sg.Input(self.settings['vision_red_goal'], key='vision_red_goal')],
+            [sg.Text('Vision threshold', size=(15, 1),
+                     tooltip='Gray level difference for a pixel to be changed (0-255)'),
+             sg.Input(self.settings['vision_threshold'], key='vision_threshold')],
+            [sg.Text('Vision min area', size=(15, 1),
+                     tooltip='Fraction of the goal region that must change for a goal (0-1)'),
+             sg.Input(self.settings['vision_min_area'], key='vision_min_area')],
         ])]
 
         buttons = [sg.Button("Save", pad=(0, 2)), sg.Button("Reset to defaults")]
 
-        return [replay_settings, serial_settings, buttons]
+        return [replay_settings, encoding_settings, camera_settings, serial_settings,
+                vision_settings, buttons]
 
     def save(self):
         """
@@ -62,6 +181,29 @@ class Settings_dialog:
         with open(constants.SETTINGS_PATH, "w") as out_file:
             json.dump(self.settings, out_file, indent=4)
 
+    def compare_codecs(self):
+        """
+        Shows the encoding time and the file size of every codec,
+        with the quality and the resolution entered
+        """
+        # opencv is only loaded for the comparison
+        from core.utils.codecs import compare_codecs, format_comparison, sample_frames
+
+        try:
+            quality = int(self.window['replay_quality'].get())
+            resolution = parse_resolution(self.window['replay_resolution'].get())
+        except ValueError:
+            sg.popup_error('Invalid quality or resolution', keep_on_top=True)
+            return
+
+        frames = sample_frames(constants.CAM_RESOLUTION_BIG, 3 * constants.DEFAULT_FPS)
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            results = compare_codecs(frames, constants.DEFAULT_FPS, quality, resolution, executor)
+        (w, h) = constants.CAM_RESOLUTION_BIG
+        header = '3 s of %dx%d video at %d fps:\n\n' % (w, h, constants.DEFAULT_FPS)
+        sg.popup_scrolled(header + format_comparison(results),
+                          title='Codec comparison', font='Courier 10', keep_on_top=True)
+
     def run(self):
         """
         Runs the settings dialog
@@ -79,6 +221,10 @@ class Settings_dialog:
                 self.save()
                 break
 
+            # Encode sample frames with every codec
+            elif event == "Compare codecs":
+                self.compare_codecs()
+
             # Reset to defaults
             elif event == "Reset to defaults":
                 self.settings = self.default_settings
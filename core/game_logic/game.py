@@ -1,5 +1,6 @@
 from enum import Enum
 
+from .goal import Goal
 from .player import Player
 
 
@@ -18,19 +19,24 @@ class Game:
         self.player_red = Player(Color.RED)
 
         self.game_finished = False
+        self.goals = []
 
         self.max_points = max_points
 
-    def goal(self, scorer):
+    def goal(self, scorer, time=None):
         """
         Records a goal for the specified player and
-        check if he has won the game.
+        check if he has won the game. Returns the goal record.
         """
         if scorer.score < self.max_points:
             scorer.score += 1
         if scorer.score == self.max_points:
             self.win(scorer)
 
+        goal = Goal(scorer.color, time)
+        self.goals.append(goal)
+        return goal
+
     def win(self, winner):
         """
         Called when one of the player reaches the maxpoint
@@ -46,5 +52,6 @@ class Game:
         """
         self.player_blue.score = 0
         self.player_red.score = 0
+        self.goals = []
 
         print('Game has been reset.')
@@ -0,0 +1,13 @@
+class Goal:
+    """
+    Record of a goal: who scored, when and how fast the shot was.
+    """
+    def __init__(self, color, time=None):
+        self.color = color
+        # monotonic time of the detection
+        self.time = time
+        # peak speed of the ball in km/h, measured on the replay
+        self.speed = None
+
+    def to_dict(self):
+        return {'color': self.color.value, 'speed_kmh': self.speed}
@@ -1,17 +1,25 @@
 import os
 import shutil
 from datetime import datetime
-from time import sleep
+from time import monotonic
 
 import PySimpleGUI as sg
 
-from core.dialogs.replay_dialog import Replay_dialog
+from core.dialogs.library_dialog import Library_dialog
 from core.dialogs.settings_dialog import Settings_dialog
 from core.game_logic.game import Game
 from core.utils import constants
-from core.utils.serial_bridge import IR_Goal_Detector
-from core.utils.utils import parse_IPs
-from core.utils.webcam import Webcam
+from core.utils.camera_supervisor import CameraSupervisor
+from core.utils.cameras import (configure_webcams, connect_webcams, peak_speed,
+                                replay_encoding, replay_tile_size, replay_window)
+from core.utils.config import Config
+from core.utils.detection import configure_detector, create_detector
+from core.utils.metrics import MetricsLogger
+from core.utils.replay_library import ReplayLibrary
+from core.utils.replay_queue import ReplayQueue
+from core.utils.replay_writer import ReplayWriter
+from core.utils.stream_server import configure_stream_server, create_stream_server
+from core.utils.utils import create_replay_folder, parse_IPs
 
 
 class Gui:
@@ -22,25 +30,36 @@ class Gui:
     def __init__(self, nb_camera):
         sg.theme('DarkGrey12')
 
-        # Create initial settings file with the default settings
-        if not os.path.exists(constants.SETTINGS_PATH):
-            shutil.copyfile(constants.DEFAULT_SETTINGS_PATH, constants.SETTINGS_PATH)
-
-        # Load settings
-        sg.user_settings_filename(filename='settings.json', path='core/settings')
+        # Load settings, they are reloaded when the file changes
+        self.config = Config()
 
         self.nb_camera = nb_camera
         self.webcams = []
+        # reconnects the stalled cameras
+        self.supervisor = None
 
         # creating game
         self.game = Game()
 
         self.streaming = False
+        # last preview shown for every camera
+        self.preview_seqs = {}
+
+        # creating goal detector (IR sensors or video)
+        self.detector = create_detector(self.config.get, lambda: self.webcams)
 
-        # creating IR detector
-        baudrate = int(sg.user_settings_get_entry('baudrate'))
-        detector_sample_rate = int(sg.user_settings_get_entry('detector_sample_rate'))
-        self.detector = IR_Goal_Detector(baudrate, detector_sample_rate)
+        # replays are saved in the background, one encoder per camera
+        self.replay_writer = ReplayWriter(max_workers=nb_camera)
+        self.goal_time = None
+
+        # index of the replays, the eviction waits for the replays being saved
+        self.library = ReplayLibrary(quota=self.config.library_quota,
+                                     eviction=self.config.library_eviction)
+        self.library.start(lambda: bool(self.replay_writer.pending))
+        # created once the cameras are connected, then reused for every replay
+        self.replay_dialog = None
+        # goal replays to show, one after the other
+        self.replays = None
 
         # creating main window
         self.camera_keys = ['k_cam_%d' % i for i in range(nb_camera)]
@@ -56,6 +75,24 @@ class Gui:
 
         self.setup_replay_folders()
 
+        # live streams and replays for the spectators, if enabled
+        self.stream_server = create_stream_server(self.config.get, lambda: self.webcams, self.game)
+
+        # runtime metrics, shown in the status strip and logged to a file
+        self.health_time = 0
+        self.metrics_logger = None
+        metrics_interval = self.config.metrics_interval
+        if metrics_interval > 0:
+            filename = os.path.join(os.getcwd(), 'metrics',
+                                    datetime.now().strftime("%d.%m.%Y_%Hh%Mm%S.jsonl"))
+            self.metrics_logger = MetricsLogger(filename, self.metrics_sources, metrics_interval)
+            self.metrics_logger.start()
+
+        # the changed settings are applied by the event loop
+        self.config.subscribe(
+            lambda changed: self.window.write_event_value('k_settings_changed', changed))
+        self.config.watch()
+
     def setup_layout(self):
         """
         Setup the layout for the main window.
@@ -67,6 +104,9 @@ class Gui:
                 "Edit settings",
                 "&About"
             ]],
+            ["Replays", [
+                "Replay library"
+            ]],
         ])]
 
         # Scores
@@ -88,6 +128,10 @@ class Gui:
                         key='k_red_score'),
                 sg.Text("Red", font=('Helvetica bold', 30), text_color='red3'),
                 sg.Push(),
+            ], [
+                sg.Push(),
+                sg.Text("", font=('Helvetica', 14), key='k_shot_speed'),
+                sg.Push(),
             ]], expand_x=True)
         ]
 
@@ -117,8 +161,11 @@ class Gui:
                 sg.Checkbox("Delete replays",
                             default=True,
                             key='k_delete_replays'),
+                sg.Button("Skip replay", tooltip="Cut short the replay playing"),
                 sg.Button("New Game"),
                 sg.Button("Connect camera(s)"),
+            ], [
+                sg.Text("", font=('Courier', 8), key='k_health'),
             ]], expand_x=True)
         ]
 
@@ -132,23 +179,34 @@ class Gui:
 
         return layout
 
+    def metrics_sources(self):
+        """
+        Returns the metrics of the running components
+        """
+        sources = [self.detector.metrics] + [webcam.metrics for webcam in self.webcams]
+        sources += [webcam.tracker.metrics for webcam in self.webcams if webcam.tracker is not None]
+        sources.append(self.replay_writer.metrics)
+        if self.stream_server is not None:
+            sources.append(self.stream_server.metrics)
+        if self.replay_dialog is not None:
+            sources.append(self.replay_dialog.metrics)
+        return sources
+
+    def update_health(self):
+        """
+        Updates the status strip with the metrics, once per second
+        """
+        now = monotonic()
+        if now - self.health_time >= 1:
+            self.health_time = now
+            statuses = [self.detector.status()] + [webcam.status() for webcam in self.webcams]
+            if self.replay_dialog is not None:
+                statuses.append(self.replay_dialog.status())
+            self.window['k_health'].update(' | '.join(statuses))
+
     def setup_replay_folders(self):
         # create path for goal videos
-        now = datetime.now()
-        time_str = now.strftime("%d.%m.%Y_%Hh%Mm%S")
-
-        dir_path = os.path.join(os.getcwd(), 'goal_videos')
-        if not os.path.exists(dir_path):
-            os.mkdir(dir_path)
-
-        goal_videos_path = os.path.join(dir_path, time_str)
-        try:
-            os.mkdir(goal_videos_path)
-        except FileExistsError:
-            pass    # just override old file
-
-        # add path to the constants
-        constants.GOAL_VIDEOS_PATH = goal_videos_path
+        self.library.new_game(create_replay_folder())
 
     def connect_webcams(self, ips):
         """
@@ -158,20 +216,20 @@ class Gui:
         # disconnect potential existing webcams
         self.disconnect_webcams()
 
-        # Load variables from settings
-        replay_duration = int(sg.user_settings_get_entry('replay_duration'))
-
-        # creating webcams
-        self.webcams = []
-        for ip in ips:
-            try:
-                webcam = Webcam(ip, replay_duration)
-                webcam.connect()
-            except Exception as e:
-                print("Error : %s" % e)
-                return
-
-            self.webcams.append(webcam)
+        if self.nb_camera < 3:
+            preview_size = constants.CAM_RESOLUTION_BIG
+        else:
+            preview_size = constants.CAM_RESOLUTION_SMALL
+
+        self.preview_seqs = {}
+        self.webcams = connect_webcams(ips, self.config.get, preview_size)
+        # one encoder per camera
+        self.replay_writer.ensure_workers(len(self.webcams))
+        self.supervisor = CameraSupervisor(self.webcams)
+        self.supervisor.start()
+        if len(self.webcams) > 0:
+            # warm up the replay window before the first goal
+            self.setup_replay_dialog()
 
         # start listening for goals
         self.detector.start(self.goal_callback)
@@ -179,12 +237,15 @@ class Gui:
             self.window['k_serial_port_status'].update(filename=constants.GREEN_LIGHT_ICON)
         else:
             self.window['k_serial_port_status'].update(filename=constants.RED_LIGHT_ICON)
-            print("Could not connect to the serial port. Please check the wiring or the settings")
+            print("Could not connect the goal detector. Please check the wiring or the settings")
 
     def disconnect_webcams(self):
         """
         Disonnect the webcams.
         """
+        if self.supervisor is not None:
+            self.supervisor.stop()
+            self.supervisor = None
         try:
             for webcam in self.webcams:
                 webcam.disconnect()
@@ -192,15 +253,72 @@ class Gui:
             # No webcam to disconnect
             pass
 
-    def play_goal_replay(self):
-        replay_dialog = Replay_dialog(self.camera_keys)
+    def setup_replay_dialog(self):
+        """
+        Creates the replay window and its players once.
+        """
+        if self.replay_dialog is None:
+            # vlc is only loaded once the cameras are connected
+            from core.dialogs.replay_dialog import Replay_dialog
 
-        goal_number = self.game.player_blue.score + self.game.player_red.score
-        replay_dialog.play(goal_number)
+            self.replay_dialog = Replay_dialog(self.camera_keys, self.config)
+            self.replays = ReplayQueue(self.replay_dialog, lambda: self.config.replay_delay)
 
-    def save_goal_replay(self):
+    def update_shot_speed(self):
+        """
+        Shows the speed of the last goal and the fastest one of the game
+        """
+        speeds = [goal for goal in self.game.goals if goal.speed is not None]
+        if not speeds:
+            self.window['k_shot_speed'].update('')
+            return
+
+        fastest = max(speeds, key=lambda goal: goal.speed)
+        last = self.game.goals[-1]
+        text = 'Fastest: %.0f km/h (%s)' % (fastest.speed, fastest.color.value)
+        if last.speed is not None:
+            text = 'Last goal: %.0f km/h    %s' % (last.speed, text)
+        self.window['k_shot_speed'].update(text)
+
+    def clear_replays(self):
+        """
+        Stops the replay playing and forgets the queued ones
+        """
+        if self.replays is not None:
+            self.replays.clear()
+
+    def apply_settings(self, changed):
+        """
+        Applies the changed settings to the running components
         """
-        Save goal replays in a folder named 'goal_<goal_number>'
+        configure_webcams(self.webcams, self.config.get, changed)
+
+        self.detector = configure_detector(self.detector, self.config.get,
+                                           lambda: self.webcams, changed)
+
+        if self.metrics_logger is not None and self.config.metrics_interval > 0:
+            self.metrics_logger.interval = self.config.metrics_interval
+
+        if 'speed_factor' in changed and self.replay_dialog is not None:
+            self.replay_dialog.speed_changed()
+
+        if changed & {'library_quota', 'library_eviction'}:
+            self.library.configure(self.config.library_quota, self.config.library_eviction)
+
+        self.stream_server = configure_stream_server(self.stream_server, self.config.get,
+                                                     lambda: self.webcams, self.game, changed)
+
+    def save_goal_replay(self, goal_time, goal=None):
+        """
+        Save goal replays in a folder named 'goal_<goal_number>'.
+        The replays go from pre_roll seconds before the goal_time
+        to post_roll seconds after it.
+        The replays are written in the background and queued to be shown:
+        the 'k_replay_saved' event is sent with the goal number and whether
+        they were written, then they are added to the replay library. The
+        peak speed of the ball during the replay is stored in the goal.
+        With the 'memory' replay source, the snapshotted clips are sent
+        with the 'k_replay_clips' event to be shown while they are written.
         """
         goal_number = self.game.player_blue.score + self.game.player_red.score
         folder_path = os.path.join(constants.GOAL_VIDEOS_PATH,
@@ -213,11 +331,37 @@ class Gui:
         except FileExistsError:
             pass
 
-        i = 1
-        for webcam in self.webcams:
-            filename = os.path.join(folder_path, 'cam%d.avi' % i)
-            i += 1
-            webcam.save_buffer(filename)
+        window = replay_window(goal_time, self.config.get)
+        score = (self.game.player_blue.score, self.game.player_red.score)
+
+        from_memory = self.config.replay_source == 'memory'
+        # the clips are shown from memory while they are written
+        on_snapshot = ((lambda clips: self.window.write_event_value('k_replay_clips', (goal_number, clips)))
+                       if from_memory else None)
+
+        def saved(filenames):
+            scorer = None
+            # the ball was tracked while the frames arrived
+            if goal is not None:
+                goal.speed = peak_speed(self.webcams, window)
+                scorer = goal.color.value
+            # the replay is loaded while the delay runs out
+            # (or while the previous replay plays)
+            if filenames is not None and self.replay_dialog is not None and not from_memory:
+                self.replay_dialog.preload(goal_number)
+            self.window.write_event_value('k_replay_saved', (goal_number, filenames is not None))
+
+            if filenames is not None:
+                self.library.add_replay(folder_path, filenames, scorer, goal_time,
+                                        goal.speed if goal is not None else None, score)
+
+        self.setup_replay_dialog()
+        self.replays.add(goal_number, goal_time)
+
+        tile_size = replay_tile_size(self.config.get, len(self.webcams))
+        return self.replay_writer.save(self.webcams, folder_path, saved, window=window,
+                                       tile_size=tile_size, on_snapshot=on_snapshot,
+                                       **replay_encoding(self.config.get))
 
     def run(self):
         """
@@ -232,29 +376,50 @@ class Gui:
 
             # Closing the window
             if event in ("Exit", sg.WIN_CLOSED):
+                self.clear_replays()
+                self.replay_writer.shutdown()
+
                 # if checked, delete goal replays
                 if self.window['k_delete_replays'].get():
                     shutil.rmtree(constants.GOAL_VIDEOS_PATH)
+                    self.library.remove_game(constants.GOAL_VIDEOS_PATH)
                     print("Replays deleted.")
                 break
 
             # Goal detected
             elif event in ('r', 'b'):
+                # the detector gives the time at which the goal arrived
+                # (keyboard events do not)
+                self.goal_time = values.get(event) or monotonic()
+
                 if event == 'b':
                     # update score
-                    self.game.goal(self.game.player_blue)
+                    goal = self.game.goal(self.game.player_blue, self.goal_time)
                     self.window["k_blue_score"].update(value=self.game.player_blue.score)
 
                 elif event == 'r':
-                    self.game.goal(self.game.player_red)
+                    goal = self.game.goal(self.game.player_red, self.goal_time)
                     self.window["k_red_score"].update(value=self.game.player_red.score)
 
+                # the goals scored during a replay are shown next
                 if len(self.webcams) > 0:
-                    self.save_goal_replay()
-                    sleep(int(sg.user_settings_get_entry('replay_delay')))
-                    self.play_goal_replay()
-                    # restart the listening after the replay
-                    self.detector.start(self.goal_callback)
+                    self.save_goal_replay(self.goal_time, goal)
+
+            # Goal replay saved in the background, shown once the delay is over
+            elif event == 'k_replay_saved':
+                self.update_shot_speed()
+                self.replays.saved(*values[event])
+
+            # Goal replay snapshotted, shown from memory while it is written
+            elif event == 'k_replay_clips':
+                (goal_number, clips) = values[event]
+                self.replay_dialog.preload_clips(goal_number, clips)
+                self.replays.saved(goal_number)
+
+            # Cut short the replay playing
+            elif event == "Skip replay":
+                if self.replays is not None:
+                    self.replays.skip()
 
             # Update score when the spinner is changed
             elif event == 'k_blue_score':
@@ -286,18 +451,23 @@ class Gui:
                     self.window['k_serial_port_status'].update(filename=constants.GREEN_LIGHT_ICON)
                 else:
                     self.window['k_serial_port_status'].update(filename=constants.RED_LIGHT_ICON)
-                    print("Could not connect to the serial port. Please check the wiring or the settings")
+                    print("Could not connect the goal detector. Please check the wiring or the settings")
 
             # Resets the score for a new game
             elif event == "New Game":
                 self.game.reset()
                 self.window['k_blue_score'].update(self.game.player_blue.score)
                 self.window['k_red_score'].update(self.game.player_red.score)
+                self.update_shot_speed()
 
                 # if checked, delete goal replays
+                # (once the replays being saved are written)
+                self.clear_replays()
+                self.replay_writer.wait()
                 if self.window['k_delete_replays'].get():
                     try:
                         shutil.rmtree(constants.GOAL_VIDEOS_PATH)
+                        self.library.remove_game(constants.GOAL_VIDEOS_PATH)
                         print("Replays deleted.")
                     except PermissionError:
                         print("Could not delete the files, another process was using them. Try closing the replay window.")
@@ -308,15 +478,44 @@ class Gui:
             elif event == "Edit settings":
                 settings_dialog = Settings_dialog()
                 settings_dialog.run()
-                # maybe not useful ? need to test
-                sg.user_settings_load(filename='settings.json', path='core/settings')
+                # apply the new settings right away
+                self.config.reload()
+
+            # Browse the saved replays
+            elif event == "Replay library":
+                self.setup_replay_dialog()
+                self.replays.skip()
+                library_dialog = Library_dialog(self.library, self.replay_dialog)
+                library_dialog.run()
+
+            # Settings file changed
+            elif event == 'k_settings_changed':
+                self.apply_settings(values[event])
 
             # Stream the webcam output to the main window screen
+            # (only when a new preview frame is available)
             if self.streaming:
                 for key, webcam in zip(self.camera_keys, self.webcams):
-                    self.window[key].update(data=webcam.current_frame())
+                    if self.preview_seqs.get(key) != webcam.preview_seq:
+                        self.preview_seqs[key] = webcam.preview_seq
+                        self.window[key].update(data=webcam.current_frame())
+
+            # save -> delay -> play -> next goal, without blocking the loop
+            if self.replays is not None:
+                self.replays.update()
+
+            self.update_health()
 
         # cleaning up
+        self.config.stop()
+        if self.metrics_logger is not None:
+            self.metrics_logger.stop()
+        if self.stream_server is not None:
+            self.stream_server.stop()
+        self.replay_writer.shutdown()
         self.detector.stop()
         self.disconnect_webcams()
+        self.library.close()
+        if self.replay_dialog is not None:
+            self.replay_dialog.close()
         self.window.close()
@@ -0,0 +1,325 @@
+import json
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Empty, Queue
+from threading import Thread
+from time import monotonic, time
+from urllib.parse import parse_qs, urlparse
+
+from core.game_logic.game import Game
+from core.utils import constants
+from core.utils.camera_supervisor import CameraSupervisor
+from core.utils.cameras import (configure_webcams, connect_webcams, peak_speed,
+                                replay_encoding, replay_tile_size, replay_window)
+from core.utils.config import Config
+from core.utils.detection import configure_detector, create_detector
+from core.utils.replay_library import ReplayLibrary
+from core.utils.replay_writer import ReplayWriter
+from core.utils.stream_server import configure_stream_server, create_stream_server
+from core.utils.utils import create_replay_folder, parse_IPs
+
+# port of the control interface
+CONTROL_PORT = 8470
+
+
+class ControlHandler(BaseHTTPRequestHandler):
+    """
+    Local HTTP control interface of the headless mode:
+
+        GET  /score               scores of both players
+        GET  /status              scores, detector and cameras status
+        POST /connect?ips=a,b     connects to the cameras
+        POST /disconnect          disconnects the cameras
+        POST /replay              saves a replay of the last seconds now
+        POST /goal?color=blue     records a goal (and saves its replay)
+        POST /new_game            resets the scores
+        POST /stop                stops the program
+        GET  /library?scorer=blue&days=7&limit=20
+                                  saved replays, most recent first
+
+    The commands are posted as events to the main loop, like the GUI
+    events, and answered with 202 before they are handled.
+    """
+    COMMANDS = ('connect', 'disconnect', 'replay', 'goal', 'new_game', 'stop')
+
+    def do_GET(self):
+        headless = self.server.headless
+        path = urlparse(self.path).path.strip('/')
+
+        if path == 'score':
+            self.reply(200, headless.score())
+        elif path == 'status':
+            self.reply(200, headless.status())
+        elif path == 'library':
+            values = {key: value[0] for key, value in parse_qs(urlparse(self.path).query).items()}
+            try:
+                self.reply(200, headless.search_library(values))
+            except ValueError as e:
+                self.reply(400, {'error': str(e)})
+        else:
+            self.reply(404, {'error': 'unknown resource %s' % path})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        command = url.path.strip('/')
+        if command not in self.COMMANDS:
+            self.reply(404, {'error': 'unknown command %s' % command})
+            return
+
+        values = {key: value[0] for key, value in parse_qs(url.query).items()}
+        self.server.headless.post_event(command, values)
+        self.reply(202, {'event': command})
+
+    def reply(self, code, content):
+        body = json.dumps(content).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # the requests are not worth a line in the console
+        pass
+
+
+class Headless:
+    """
+    Runs the goal detector, the cameras buffering and the replay saving
+    without any window, for a computer that only records.
+
+    The goals and the commands of the control interface are handled one
+    at a time by the event loop of run(). Neither PySimpleGUI nor vlc
+    are imported, and opencv is only loaded when the cameras connect.
+    """
+    def __init__(self, ips=None, control_port=CONTROL_PORT, start_time=None):
+        self.start_time = monotonic() if start_time is None else start_time
+
+        # Load settings, they are reloaded when the file changes
+        self.config = Config()
+
+        self.ips = ips or []
+        self.webcams = []
+        # reconnects the stalled cameras
+        self.supervisor = None
+        self.game = Game()
+        self.events = Queue()
+        self.goal_time = None
+        self.nb_replays = 0
+
+        # creating goal detector (IR sensors or video)
+        self.detector = create_detector(self.config.get, lambda: self.webcams)
+
+        # replays are saved in the background, one encoder per camera
+        self.replay_writer = ReplayWriter(max_workers=max(len(self.ips), 1))
+
+        # index of the replays, the eviction waits for the replays being saved
+        self.library = ReplayLibrary(quota=self.config.library_quota,
+                                     eviction=self.config.library_eviction)
+        self.library.new_game(create_replay_folder())
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', control_port), ControlHandler)
+        self.server.headless = self
+        self.server_thread = None
+        # live streams and replays for the spectators, if enabled
+        self.stream_server = None
+
+    def post_event(self, event, value=None):
+        """
+        Sends an event to the main loop, from any thread
+        """
+        self.events.put((event, value))
+
+    def goal_callback(self, event, timestamp):
+        self.post_event(event, timestamp)
+
+    def score(self):
+        return {'blue': self.game.player_blue.score,
+                'red': self.game.player_red.score}
+
+    def status(self):
+        return dict(self.score(),
+                    goals=[goal.to_dict() for goal in self.game.goals],
+                    detector=self.detector.status(),
+                    cameras=[webcam.status() for webcam in self.webcams],
+                    goal_videos=constants.GOAL_VIDEOS_PATH)
+
+    def search_library(self, values):
+        """
+        Returns the saved replays matching the query values
+        (scorer, days and limit)
+        """
+        since = time() - float(values['days']) * 24 * 3600 if 'days' in values else None
+        replays = self.library.search(values.get('scorer'), since, limit=int(values.get('limit', 200)))
+        for replay in replays:
+            replay['files'] = self.library.files(replay['id'])
+        return replays
+
+    def connect_webcams(self, ips):
+        """
+        Connects to the webcams and starts listening for goals
+        """
+        self.disconnect_webcams()
+        self.webcams = connect_webcams(ips, self.config.get)
+        # one encoder per camera
+        self.replay_writer.ensure_workers(len(self.webcams))
+        self.supervisor = CameraSupervisor(self.webcams)
+        self.supervisor.start()
+
+        self.detector.start(self.goal_callback)
+        if not self.detector.connected:
+            print("Could not connect the goal detector. Please check the wiring or the settings")
+
+    def disconnect_webcams(self):
+        if self.supervisor is not None:
+            self.supervisor.stop()
+            self.supervisor = None
+        for webcam in self.webcams:
+            webcam.disconnect()
+        self.webcams = []
+
+    def save_goal_replay(self, goal_time, folder_name=None, goal=None):
+        """
+        Saves the replay around goal_time in a folder named
+        'goal_<goal_number>' (unless another name is given),
+        in the background, then adds it to the replay library.
+        The peak speed of the ball during the replay is stored in the goal.
+        """
+        if folder_name is None:
+            goal_number = self.game.player_blue.score + self.game.player_red.score
+            folder_name = 'goal_%d' % goal_number
+        folder_path = os.path.join(constants.GOAL_VIDEOS_PATH, folder_name)
+        os.makedirs(folder_path, exist_ok=True)
+
+        window = replay_window(goal_time, self.config.get)
+        score = (self.game.player_blue.score, self.game.player_red.score)
+
+        def saved(filenames):
+            scorer = None
+            # the ball was tracked while the frames arrived
+            if goal is not None:
+                goal.speed = peak_speed(self.webcams, window)
+                scorer = goal.color.value
+                if goal.speed is not None:
+                    print('Shot speed: %.0f km/h' % goal.speed)
+            self.post_event('replay_saved', filenames)
+
+            if filenames is not None:
+                self.library.add_replay(folder_path, filenames, scorer, goal_time,
+                                        goal.speed if goal is not None else None, score)
+        tile_size = replay_tile_size(self.config.get, len(self.webcams))
+        return self.replay_writer.save(self.webcams, folder_path, saved, window=window,
+                                       tile_size=tile_size, **replay_encoding(self.config.get))
+
+    def start(self):
+        """
+        Starts the control interface, then connects the cameras
+        """
+        self.server_thread = Thread(target=self.server.serve_forever, daemon=True)
+        self.server_thread.start()
+        (host, port) = self.server.server_address[:2]
+        print('Control interface on http://%s:%d, ready in %.0f ms' %
+              (host, port, (monotonic() - self.start_time) * 1000))
+
+        # the changed settings are applied by the event loop
+        self.config.subscribe(lambda changed: self.post_event('settings_changed', changed))
+        self.config.watch()
+        self.library.start(lambda: bool(self.replay_writer.pending))
+        self.stream_server = create_stream_server(self.config.get, lambda: self.webcams, self.game)
+
+        if self.ips:
+            self.post_event('connect', {'ips': ','.join(self.ips)})
+        else:
+            # listen for goals even without camera
+            self.detector.start(self.goal_callback)
+
+    def run(self):
+        """
+        Runs the event loop until the 'stop' command or Ctrl+C
+        """
+        self.start()
+        try:
+            while True:
+                try:
+                    event, values = self.events.get(timeout=1)
+                except Empty:
+                    continue
+
+                if event == 'stop':
+                    break
+                self.handle(event, values)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.cleanup()
+
+    def handle(self, event, values):
+        """
+        Handles an event of the detector, the replay writer
+        or the control interface
+        """
+        # Goal detected
+        if event in ('b', 'r', 'goal'):
+            if event == 'goal':
+                event = values.get('color', 'b')[0]
+            # the detector gives the time at which the goal arrived
+            self.goal_time = values if isinstance(values, float) else monotonic()
+            if event == 'b':
+                goal = self.game.goal(self.game.player_blue, self.goal_time)
+            elif event == 'r':
+                goal = self.game.goal(self.game.player_red, self.goal_time)
+            else:
+                return
+            print('Score: blue %d - %d red' % (self.game.player_blue.score,
+                                                self.game.player_red.score))
+
+            # the goals scored while a replay is saved are saved too
+            if len(self.webcams) > 0:
+                self.save_goal_replay(self.goal_time, goal=goal)
+
+        # Replay of the last seconds, without goal
+        elif event == 'replay':
+            if len(self.webcams) > 0:
+                self.nb_replays += 1
+                self.save_goal_replay(monotonic(), 'replay_%d' % self.nb_replays)
+
+        # Goal replay saved in the background
+        elif event == 'replay_saved':
+            if values is None:
+                print('Could not save the replay')
+            else:
+                print('Replay saved: %s' % ', '.join(values))
+
+        elif event == 'connect':
+            ips = parse_IPs(values.get('ips', ''))
+            self.connect_webcams([ip for ip in ips if ip])
+
+        elif event == 'disconnect':
+            self.disconnect_webcams()
+
+        # Settings file changed
+        elif event == 'settings_changed':
+            configure_webcams(self.webcams, self.config.get, values)
+            self.detector = configure_detector(self.detector, self.config.get,
+                                               lambda: self.webcams, values)
+            if values & {'library_quota', 'library_eviction'}:
+                self.library.configure(self.config.library_quota, self.config.library_eviction)
+            self.stream_server = configure_stream_server(self.stream_server, self.config.get,
+                                                         lambda: self.webcams, self.game, values)
+
+        # Resets the score for a new game
+        elif event == 'new_game':
+            self.game.reset()
+            self.replay_writer.wait()
+            self.library.new_game(create_replay_folder())
+
+    def cleanup(self):
+        self.config.stop()
+        self.server.shutdown()
+        self.server.server_close()
+        if self.stream_server is not None:
+            self.stream_server.stop()
+        self.replay_writer.shutdown()
+        self.detector.stop()
+        self.disconnect_webcams()
+        self.library.close()
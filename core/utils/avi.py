@@ -0,0 +1,106 @@
+import struct
+
+AVIF_HASINDEX = 0x10
+AVIIF_KEYFRAME = 0x10
+
+
+class MJPEGAviWriter:
+    """
+    Minimal AVI muxer writing already compressed JPEG frames
+    as an MJPG video stream, without decoding or re-encoding them.
+    """
+    def __init__(self, filename, fps, size):
+        self.fps = fps
+        (self.w, self.h) = size
+
+        self.file = open(filename, 'wb')
+        self.index = []
+        self.max_frame_size = 0
+
+        # (file position, size) of the JPEG data of every frame
+        self.positions = []
+
+        self.write_headers()
+
+    def chunk(self, fourcc, data):
+        self.file.write(fourcc + struct.pack('<I', len(data)) + data)
+        if len(data) % 2:
+            self.file.write(b'\0')
+
+    def write_headers(self):
+        """
+        Writes the headers, the counters are patched in release()
+        """
+        f = self.file
+        f.write(b'RIFF' + struct.pack('<I', 0) + b'AVI ')
+
+        avih = struct.pack('<14I',
+                           int(round(1e6 / self.fps)),  # microseconds per frame
+                           0, 0, AVIF_HASINDEX,
+                           0,                           # total frames
+                           0, 1, 0,
+                           self.w, self.h,
+                           0, 0, 0, 0)
+        strh = (b'vidsMJPG' +
+                struct.pack('<IHHIIIIIIiI4h',
+                            0, 0, 0, 0,
+                            1000,                       # scale
+                            int(round(self.fps * 1000)),  # rate
+                            0,
+                            0,                          # length in frames
+                            0, -1, 0,
+                            0, 0, self.w, self.h))
+        strf = struct.pack('<IiiHH4sIiiII',
+                           40, self.w, self.h, 1, 24, b'MJPG',
+                           self.w * self.h * 3, 0, 0, 0, 0)
+
+        strl = (b'strl' +
+                b'strh' + struct.pack('<I', len(strh)) + strh +
+                b'strf' + struct.pack('<I', len(strf)) + strf)
+        hdrl = (b'hdrl' +
+                b'avih' + struct.pack('<I', len(avih)) + avih +
+                b'LIST' + struct.pack('<I', len(strl)) + strl)
+
+        self.avih_offset = f.tell() + 12 + 8
+        self.strh_offset = f.tell() + 12 + 8 + len(avih) + 12 + 8
+        self.chunk(b'LIST', hdrl)
+
+        self.movi_offset = f.tell()
+        f.write(b'LIST' + struct.pack('<I', 0) + b'movi')
+
+    def write(self, jpeg):
+        """
+        Appends a JPEG frame to the video
+        """
+        position = self.file.tell()
+        self.chunk(b'00dc', jpeg)
+        # idx1 offsets are relative to the 'movi' fourcc
+        self.index.append((position - (self.movi_offset + 8), len(jpeg)))
+        self.positions.append((position + 8, len(jpeg)))
+        self.max_frame_size = max(self.max_frame_size, len(jpeg))
+
+    def release(self):
+        """
+        Writes the index, patches the headers and closes the file
+        """
+        f = self.file
+        movi_end = f.tell()
+
+        idx1 = b''.join(b'00dc' + struct.pack('<III', AVIIF_KEYFRAME, offset, size)
+                        for offset, size in self.index)
+        self.chunk(b'idx1', idx1)
+        riff_end = f.tell()
+
+        nb_frames = len(self.index)
+        f.seek(4)
+        f.write(struct.pack('<I', riff_end - 8))
+        f.seek(self.avih_offset + 16)
+        f.write(struct.pack('<I', nb_frames))
+        f.seek(self.avih_offset + 28)
+        f.write(struct.pack('<I', self.max_frame_size))
+        f.seek(self.strh_offset + 32)
+        f.write(struct.pack('<II', nb_frames, self.max_frame_size))
+        f.seek(self.movi_offset + 4)
+        f.write(struct.pack('<I', movi_end - self.movi_offset - 8))
+
+        f.close()
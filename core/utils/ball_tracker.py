@@ -0,0 +1,176 @@
+from collections import deque
+from math import hypot
+from threading import Thread
+from time import monotonic, sleep
+
+import cv2
+import numpy as np
+
+from core.utils.metrics import Metrics
+
+# longest side of the downscaled search window (pixels)
+WINDOW_SIZE = 64
+
+# longest side of the downscaled frame searched when the ball is lost
+LOST_SIZE = 160
+
+# half size of the search window relative to the frame width, it grows
+# with the distance the ball travels in a frame
+MIN_WINDOW = 0.08
+
+# frames where the ball is lost between two positions used for a speed
+MAX_GAP = 3
+
+# fastest plausible shot (m/s), a faster move is a wrong detection
+MAX_SPEED = 20
+
+
+class BallTracker:
+    """
+    Follows the ball in the frames buffered by a webcam, as they arrive.
+
+    The ball is found by its color in a small downscaled window centred
+    on where it should be (its last position moved by its last
+    velocity), the whole frame is only searched, more coarsely, when
+    the ball is lost. The positions are relative to the frame size and
+    the speeds are computed on the fly, so the peak speed of a replay
+    is known as soon as its last frame is captured.
+    """
+    def __init__(self, webcam, color_range, field_width=1.2, keep_duration=10, min_pixels=3):
+        self.webcam = webcam
+        # (low, high) HSV bounds of the ball color
+        self.color_range = color_range
+        # meters seen across the width of the frame
+        self.field_width = field_width
+        self.keep_duration = keep_duration
+        self.min_pixels = min_pixels
+
+        # last (timestamp, x, y) of the ball, and its velocity per second
+        self.position = None
+        self.velocity = (0, 0)
+        self.lost_frames = 0
+        # (timestamp, speed in m/s), and the last raw speeds for the median
+        self.speeds = deque()
+        self.raw_speeds = deque(maxlen=3)
+
+        self.metrics = Metrics(webcam.ip + ' ball')
+        self.tracking = False
+        self.thread = None
+
+    def start(self):
+        if not self.tracking:
+            self.tracking = True
+            self.thread = Thread(target=self.loop, daemon=True)
+            self.thread.start()
+
+    def loop(self):
+        """
+        Processes the frames buffered since the last check
+        """
+        buffer = None
+        seq = 0
+        while self.tracking:
+            sleep(0.01)
+
+            if self.webcam.buffer is not buffer:
+                buffer = self.webcam.buffer
+                seq = max(buffer.count - 1, 0)
+
+            # copied, the capture overwrites the slots while they are processed
+            (frames, timestamps, seq) = buffer.since(seq)
+            for frame, timestamp in zip(frames, timestamps):
+                start = monotonic()
+                self.process(frame, timestamp)
+                self.metrics.observe('track', monotonic() - start)
+
+    def process(self, frame, timestamp):
+        """
+        Finds the ball in a frame (BGR array or JPEG bytes)
+        and updates its speed
+        """
+        if isinstance(frame, bytes):
+            frame = cv2.imdecode(np.frombuffer(frame, np.uint8), cv2.IMREAD_REDUCED_COLOR_4)
+
+        (h, w) = frame.shape[:2]
+        if self.position is None:
+            window = (0, 0, w, h)
+            size = LOST_SIZE
+        else:
+            # where the ball should be now
+            (t, x, y) = self.position
+            dt = timestamp - t
+            (x, y) = (x + self.velocity[0] * dt, y + self.velocity[1] * dt)
+            half = max(MIN_WINDOW, 1.5 * hypot(*self.velocity) * dt) * w
+            window = (max(int(x * w - half), 0), max(int(y * h - half), 0),
+                      min(int(x * w + half), w), min(int(y * h + half), h))
+            size = WINDOW_SIZE
+
+        found = self.find(frame, window, size)
+        if found is None:
+            self.lost_frames += 1
+            if self.lost_frames > MAX_GAP:
+                self.position = None
+            self.metrics.increment('lost')
+            return
+
+        (x, y) = (found[0] / w, found[1] / h)
+        if self.position is not None and self.lost_frames <= MAX_GAP:
+            (t, px, py) = self.position
+            dt = timestamp - t
+            if dt > 0:
+                self.velocity = ((x - px) / dt, (y - py) / dt)
+                self.add_speed(timestamp, hypot(x - px, y - py) * self.field_width / dt)
+        else:
+            self.velocity = (0, 0)
+
+        self.position = (timestamp, x, y)
+        self.lost_frames = 0
+        self.metrics.tick('found', timestamp=timestamp)
+
+    def find(self, frame, window, size):
+        """
+        Returns the (x, y) pixel position of the ball in the window
+        (x0, y0, x1, y1) of the frame, or None
+        """
+        (x0, y0, x1, y1) = window
+        if x1 <= x0 or y1 <= y0:
+            return None
+        step = max(max(x1 - x0, y1 - y0) // size, 1)
+
+        crop = np.ascontiguousarray(frame[y0:y1:step, x0:x1:step])
+        mask = cv2.inRange(cv2.cvtColor(crop, cv2.COLOR_BGR2HSV), *self.color_range)
+        (ys, xs) = np.nonzero(mask)
+        if len(xs) < self.min_pixels:
+            return None
+        return (x0 + xs.mean() * step, y0 + ys.mean() * step)
+
+    def add_speed(self, timestamp, speed):
+        """
+        Records a speed (m/s), the median of the last three speeds is
+        kept so that a single wrong detection does not count as a shot
+        """
+        if speed > MAX_SPEED:
+            return
+        self.raw_speeds.append(speed)
+        if len(self.raw_speeds) == 3:
+            self.speeds.append((timestamp, sorted(self.raw_speeds)[1]))
+
+        limit = timestamp - self.keep_duration
+        while self.speeds and self.speeds[0][0] < limit:
+            self.speeds.popleft()
+
+    def peak_speed(self, start=None, end=None):
+        """
+        Returns the highest speed of the ball (km/h) between start and
+        end (monotonic timestamps), or None if it was not seen
+        """
+        speeds = [speed for timestamp, speed in list(self.speeds)
+                  if (start is None or timestamp >= start) and (end is None or timestamp <= end)]
+        if not speeds:
+            return None
+        return max(speeds) * 3.6
+
+    def stop(self):
+        if self.tracking:
+            self.tracking = False
+            self.thread.join()
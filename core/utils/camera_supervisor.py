@@ -0,0 +1,68 @@
+from threading import Event, Thread
+from time import monotonic
+
+
+class CameraSupervisor:
+    """
+    Watches the connected webcams and reconnects the ones whose stream
+    ended or stalled (no new frame for their timeout), waiting longer
+    after every failed attempt. Only the stalled webcams are touched,
+    and they keep their buffered frames.
+    """
+    MIN_BACKOFF = 1
+    MAX_BACKOFF = 30
+
+    def __init__(self, webcams, interval=1):
+        self.webcams = list(webcams)
+        self.interval = interval
+
+        # webcam: (monotonic time of the next attempt, following delay)
+        self.attempts = {}
+
+        self.stopped = Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = Thread(target=self.loop, daemon=True)
+            self.thread.start()
+
+    def loop(self):
+        while not self.stopped.wait(self.interval):
+            self.check()
+
+    def check(self):
+        """
+        Reconnects the stalled webcams whose delay is over
+        """
+        for webcam in self.webcams:
+            if self.stopped.is_set():
+                break
+            if not webcam.stalled():
+                self.attempts.pop(webcam, None)
+                continue
+
+            (next_attempt, backoff) = self.attempts.get(webcam, (0, self.MIN_BACKOFF))
+            if monotonic() < next_attempt:
+                continue
+
+            print('%s stalled, reconnecting ...' % webcam.ip)
+            try:
+                webcam.reconnect()
+            except Exception as e:
+                print('Error : %s, next attempt in %.0f s' % (e, backoff))
+                self.attempts[webcam] = (monotonic() + backoff, min(backoff * 2, self.MAX_BACKOFF))
+                continue
+
+            webcam.metrics.increment('reconnects')
+            self.attempts.pop(webcam, None)
+            print('Succefully reconnected to %s!' % webcam.ip)
+
+    def stop(self):
+        """
+        Stops watching, before the webcams are disconnected
+        """
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
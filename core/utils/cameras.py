@@ -0,0 +1,168 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from core.utils import constants
+from core.utils.utils import camera_value, parse_fps, parse_per_camera, parse_resolution
+
+
+def replay_window(goal_time, settings):
+    """
+    Returns the (start, end) monotonic times of the replay of a goal
+    """
+    pre_roll = float(settings('pre_roll', 4))
+    post_roll = float(settings('post_roll', 1))
+    return (goal_time - pre_roll, goal_time + post_roll)
+
+
+def buffer_duration(settings):
+    """
+    Returns the seconds of video the webcams must keep
+    """
+    replay_duration = float(settings('replay_duration', 5))
+    pre_roll = float(settings('pre_roll', 4))
+    post_roll = float(settings('post_roll', 1))
+    # the buffer must hold the whole replay window, plus a margin
+    # for the time the goal event takes to be handled
+    return max(replay_duration, pre_roll + post_roll + 1)
+
+
+def replay_encoding(settings):
+    """
+    Returns the encoding settings of the replays,
+    as arguments of ReplayWriter.save()
+    """
+    return {'codec': settings('replay_codec', 'MJPG'),
+            'container': settings('replay_container', 'avi'),
+            'quality': int(settings('replay_quality', constants.JPEG_QUALITY)),
+            'resolution': parse_resolution(settings('replay_resolution', 'native'))}
+
+
+def stored_format(settings, index):
+    """
+    Returns the stored (size, fps) of the camera index, None for native
+    """
+    sizes = parse_per_camera(settings('stored_resolution', 'native'), parse_resolution)
+    rates = parse_per_camera(settings('stored_fps', 'native'), parse_fps)
+    return camera_value(sizes, index), camera_value(rates, index)
+
+
+def replay_tile_size(settings, nb_camera):
+    """
+    Returns the size of a camera in the composite replay (the size of its
+    image in the replay window), or None for one replay per camera
+    """
+    if settings('replay_layout', 'separate') != 'composite':
+        return None
+    if nb_camera < 3:
+        return constants.CAM_RESOLUTION_BIG
+    return constants.CAM_RESOLUTION_SMALL
+
+
+def connect_webcams(ips, settings, preview_size=constants.CAM_RESOLUTION_BIG):
+    """
+    Connects to the webcams with the buffering configured in the settings
+    (a function returning the value of a setting, or a default value).
+    The webcams are connected at the same time, each within the camera
+    timeout. The ones that cannot be connected are reported, the others
+    are returned in the order of the ips.
+
+    The webcam modules (and opencv) are only imported here, so that
+    the program starts without them.
+    """
+    if settings('capture_mode', 'thread') == 'process':
+        # each camera captures in its own process
+        from core.utils.process_webcam import ProcessWebcam as webcam_class
+    else:
+        from core.utils.webcam import Webcam as webcam_class
+
+    duration = buffer_duration(settings)
+    recording_mode = settings('recording_mode', 'memory')
+    segment_duration = float(settings('segment_duration', 1))
+    ingest_mode = settings('ingest_mode', 'decode')
+    preview_fps = float(settings('preview_fps', 15))
+    timeout = float(settings('camera_timeout', 5))
+
+    def connect(index, ip):
+        (stored_size, stored_fps) = stored_format(settings, index)
+        if recording_mode == 'segments':
+            # the replay is kept on disk, the memory only holds
+            # the frames of the next segments
+            webcam = webcam_class(ip, 3 * segment_duration, ingest_mode, preview_size,
+                                  preview_fps, stored_size, stored_fps, timeout)
+            webcam.connect()
+            webcam.record_segments(segment_duration, duration)
+        else:
+            webcam = webcam_class(ip, duration, ingest_mode, preview_size,
+                                  preview_fps, stored_size, stored_fps, timeout)
+            webcam.connect()
+        return webcam
+
+    if not ips:
+        return []
+    with ThreadPoolExecutor(max_workers=len(ips)) as executor:
+        futures = [executor.submit(connect, index, ip) for index, ip in enumerate(ips)]
+
+    webcams = []
+    for future in futures:
+        try:
+            webcam = future.result()
+        except Exception as e:
+            print("Error : %s" % e)
+            continue
+
+        webcams.append(webcam)
+        track_ball(webcam, settings)
+
+    return webcams
+
+
+def track_ball(webcam, settings):
+    """
+    Starts or stops the ball tracking of a webcam
+    """
+    ball_color = settings('ball_color', 'none')
+    if ball_color in constants.BALL_COLORS:
+        webcam.track_ball(constants.BALL_COLORS[ball_color],
+                          float(settings('field_width', 1.2)),
+                          buffer_duration(settings))
+    else:
+        webcam.stop_tracking()
+
+
+def peak_speed(webcams, window):
+    """
+    Returns the highest ball speed (km/h) seen by the webcams during the
+    replay window, or None if the ball was not tracked
+    """
+    speeds = [webcam.peak_speed(*window) for webcam in webcams]
+    speeds = [speed for speed in speeds if speed is not None]
+    return max(speeds) if speeds else None
+
+
+def configure_webcams(webcams, settings, changed):
+    """
+    Applies the changed settings to the connected webcams: the buffers
+    are resized, the stored format and the previews rate changed while
+    capturing. The ingest, capture and recording modes need a reconnection.
+    """
+    for index, webcam in enumerate(webcams):
+        if changed & {'stored_resolution', 'stored_fps'}:
+            webcam.configure_storage(*stored_format(settings, index))
+
+        if webcam.recorder is not None:
+            segment_duration = float(settings('segment_duration', 1))
+            webcam.recorder.keep_duration = buffer_duration(settings)
+            webcam.recorder.segment_duration = segment_duration
+            if 'segment_duration' in changed:
+                webcam.resize_buffer(3 * segment_duration)
+        elif changed & {'replay_duration', 'pre_roll', 'post_roll'}:
+            webcam.resize_buffer(buffer_duration(settings))
+
+        webcam.preview_fps = float(settings('preview_fps', 15))
+        # the streams are opened with the new timeout when they reconnect
+        webcam.timeout = float(settings('camera_timeout', 5))
+
+        if changed & {'ball_color', 'field_width', 'replay_duration', 'pre_roll', 'post_roll'}:
+            track_ball(webcam, settings)
+
+    if webcams and changed & {'ingest_mode', 'capture_mode', 'recording_mode'}:
+        print('The new camera modes apply once the cameras are reconnected')
@@ -0,0 +1,167 @@
+import cv2
+import numpy as np
+
+from core.utils import constants
+from core.utils.codecs import JPEGWriter, encode_jpeg, open_writer
+from core.utils.mjpeg import jpeg_size
+
+# reduced decoding of the JPEG decoder, by downscale factor
+REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8),
+                 (4, cv2.IMREAD_REDUCED_COLOR_4),
+                 (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+def decode_jpeg(data, size=None):
+    """
+    Decodes a JPEG image to a BGR array. If a (width, height) is given,
+    the decoder downscales by 2, 4 or 8 when the image stays at least
+    that large.
+    """
+    flags = cv2.IMREAD_COLOR
+    if size is not None:
+        (w, h) = jpeg_size(data)
+        for factor, reduced in REDUCED_FLAGS:
+            if w // factor >= size[0] and h // factor >= size[1]:
+                flags = reduced
+                break
+    return cv2.imdecode(np.frombuffer(data, np.uint8), flags)
+
+
+def fit_size(size, target):
+    """
+    Returns the largest size with the aspect ratio of size that fits in
+    target (width, height), never larger than size, with even sides as
+    most codecs require
+    """
+    (w, h) = size
+    scale = min(target[0] / w, target[1] / h, 1)
+    return max(int(w * scale) // 2 * 2, 2), max(int(h * scale) // 2 * 2, 2)
+
+
+def resize(frame, size, dst=None):
+    """
+    Resizes a BGR frame to size (width, height) if needed,
+    into dst if given (an array of that size)
+    """
+    (h, w) = frame.shape[:2]
+    if (w, h) == size:
+        if dst is None:
+            return frame
+        dst[:] = frame
+        return dst
+    # area averaging only pays off when the frame is at least halved
+    interpolation = cv2.INTER_AREA if size[0] <= w / 2 else cv2.INTER_LINEAR
+    return cv2.resize(frame, size, dst=dst, interpolation=interpolation)
+
+
+class Clip:
+    """
+    Frames snapshotted from a webcam buffer along with their capture
+    timestamps. The frames are either BGR arrays or, for the passthrough
+    ingest mode, compressed JPEG bytes.
+    """
+    def __init__(self, frames, timestamps, fps=None, jpeg=False):
+        self.frames = frames
+        self.timestamps = timestamps
+        self.jpeg = jpeg
+
+        # nominal frame rate, the measured one is used if not given
+        self.fps = fps if fps else self.measured_fps()
+
+    def __len__(self):
+        return len(self.frames)
+
+    def measured_fps(self):
+        """
+        Returns the frame rate measured from the timestamps
+        """
+        if len(self.timestamps) < 2 or self.timestamps[-1] <= self.timestamps[0]:
+            return 0
+        return (len(self.timestamps) - 1) / (self.timestamps[-1] - self.timestamps[0])
+
+    def start(self):
+        return self.timestamps[0]
+
+    def end(self):
+        return self.timestamps[-1]
+
+    def cut(self, start, end):
+        """
+        Returns a new clip with the frames captured between start and end
+        (monotonic timestamps). The frame rate is measured again.
+        """
+        first = np.searchsorted(self.timestamps, start, side='left')
+        last = np.searchsorted(self.timestamps, end, side='right')
+        return Clip(self.frames[first:last], self.timestamps[first:last], jpeg=self.jpeg)
+
+    def size(self):
+        """
+        Returns the (width, height) of the frames
+        """
+        if self.jpeg:
+            return jpeg_size(self.frames[0])
+        (h, w) = self.frames[0].shape[:2]
+        return w, h
+
+    def decoded(self):
+        """
+        Iterates over the frames as BGR arrays
+        """
+        for frame in self.frames:
+            if self.jpeg:
+                frame = decode_jpeg(frame)
+            yield frame
+
+    def prepared(self, frames, size):
+        """
+        Returns the frames as BGR arrays of the given size
+        """
+        if self.jpeg:
+            # the JPEG decoder already downscales when it can
+            return [resize(decode_jpeg(frame, size), size) for frame in frames]
+        return [resize(frame, size) for frame in frames]
+
+    def jpeg_frames(self, size, quality, executor=None):
+        """
+        Iterates over the frames as JPEG images of the given size. They
+        are encoded by chunks on the executor if one is given, the JPEG
+        frames of the right size are kept as they are.
+        """
+        if self.jpeg and size == self.size():
+            return iter(self.frames)
+
+        def encode(chunk):
+            return [encode_jpeg(frame, quality) for frame in self.prepared(chunk, size)]
+
+        chunks = [self.frames[i:i + constants.ENCODE_CHUNK]
+                  for i in range(0, len(self), constants.ENCODE_CHUNK)]
+        # map keeps the order of the chunks
+        encoded = executor.map(encode, chunks) if executor is not None else map(encode, chunks)
+        return (data for chunk in encoded for data in chunk)
+
+    def save(self, filename, codec='MJPG', quality=constants.JPEG_QUALITY, resolution=None, executor=None):
+        """
+        Saves the clip to the filename provided, the container is given by
+        its extension. The frames are downscaled to fit the resolution
+        (width, height) if one is given.
+
+        For MJPG in AVI, the JPEG frames are written without re-encoding
+        when their size is kept and the others are encoded by chunks on
+        the executor, if any, since MJPG frames are independent. The other
+        codecs encode the frames one after the other.
+        Returns the filename, or None if the clip is empty.
+        """
+        if len(self) == 0 or not self.fps > 0:
+            return None
+
+        size = fit_size(self.size(), resolution) if resolution else self.size()
+        writer = open_writer(filename, codec, self.fps, size, quality)
+        if isinstance(writer, JPEGWriter):
+            for data in self.jpeg_frames(size, quality, executor):
+                writer.write(data)
+        else:
+            for i in range(0, len(self), constants.ENCODE_CHUNK):
+                for frame in self.prepared(self.frames[i:i + constants.ENCODE_CHUNK], size):
+                    writer.write(frame)
+        writer.release()
+        return filename
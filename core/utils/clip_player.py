@@ -0,0 +1,72 @@
+import cv2
+import numpy as np
+
+from core.utils import constants
+from core.utils.clip import decode_jpeg, fit_size, resize
+
+
+class ClipPlayer:
+    """
+    Plays synchronized clips straight from memory, paced by their capture
+    timestamps slowed down by the speed factor. Every call to updates()
+    gives the frames to show at that time, only for the clips whose frame
+    changed, encoded in the fast preview format at the image size.
+    """
+    def __init__(self, clips, size, speed=1):
+        self.clips = clips
+        self.size = size
+        self.speed = speed
+
+        recorded = [clip for clip in clips if len(clip) > 0]
+        self.start_time = min(clip.start() for clip in recorded)
+        self.end_time = max(clip.end() for clip in recorded)
+
+        # (wall time, clip time) from which the position is computed
+        self.anchor = None
+        self.shown = [-1] * len(clips)
+
+    def start(self, now):
+        self.anchor = (now, self.start_time)
+
+    def position(self, now):
+        """
+        Returns the capture time of the frames to show at now
+        """
+        (wall, clip_time) = self.anchor
+        return clip_time + (now - wall) * self.speed
+
+    def set_speed(self, speed, now):
+        """
+        Changes the speed factor, the replay goes on from where it is
+        """
+        if speed != self.speed:
+            self.anchor = (now, self.position(now))
+            self.speed = speed
+
+    def ended(self, now):
+        return self.position(now) > self.end_time
+
+    def updates(self, now):
+        """
+        Returns the (clip index, image bytes) of the frames to show
+        at now, for the clips whose frame changed
+        """
+        position = self.position(now)
+        updates = []
+        for i, clip in enumerate(self.clips):
+            if len(clip) == 0:
+                continue
+            index = max(np.searchsorted(clip.timestamps, position, side='right') - 1, 0)
+            if index != self.shown[i]:
+                self.shown[i] = index
+                updates.append((i, self.render(clip, index)))
+        return updates
+
+    def render(self, clip, index):
+        frame = clip.frames[index]
+        if clip.jpeg:
+            # let the JPEG decoder downscale when possible
+            frame = decode_jpeg(frame, self.size)
+        (h, w) = frame.shape[:2]
+        frame = resize(frame, fit_size((w, h), self.size))
+        return cv2.imencode(constants.PREVIEW_FORMAT, frame)[1].tobytes()
@@ -0,0 +1,138 @@
+import os
+import tempfile
+from functools import lru_cache
+from time import perf_counter
+
+import cv2
+import numpy as np
+
+from core.utils import constants
+from core.utils.avi import MJPEGAviWriter
+
+
+def encode_jpeg(frame, quality=constants.JPEG_QUALITY):
+    return cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])[1].tobytes()
+
+
+class JPEGWriter:
+    """
+    Writes an MJPG video in an AVI file: JPEG frames are written as they
+    are, BGR frames are encoded with the quality given (the opencv
+    writers ignore it).
+    """
+    def __init__(self, filename, fps, size, quality=constants.JPEG_QUALITY):
+        self.writer = MJPEGAviWriter(filename, fps, size)
+        self.quality = quality
+
+    def write(self, frame):
+        if not isinstance(frame, bytes):
+            frame = encode_jpeg(frame, self.quality)
+        self.writer.write(frame)
+
+    def release(self):
+        self.writer.release()
+
+
+def open_writer(filename, codec, fps, size, quality=constants.JPEG_QUALITY):
+    """
+    Returns a writer for a video of the codec given, in the container
+    given by the extension of filename. Only JPEGWriter accepts JPEG
+    frames. Raises an exception if opencv can not write it.
+    """
+    if codec == 'MJPG' and filename.endswith('.avi'):
+        return JPEGWriter(filename, fps, size, quality)
+
+    writer = cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*codec), fps, size, True)
+    if not writer.isOpened():
+        raise Exception('Could not write %s with the codec %s' % (os.path.basename(filename), codec))
+    return writer
+
+
+@lru_cache(maxsize=None)
+def codec_available(codec, container):
+    """
+    Returns True if opencv can write the codec in the container,
+    by writing a small video
+    """
+    (fd, filename) = tempfile.mkstemp(suffix='.' + container)
+    os.close(fd)
+    try:
+        writer = open_writer(filename, codec, 30, (64, 48))
+        writer.write(np.zeros((48, 64, 3), dtype=np.uint8))
+        writer.release()
+        return os.path.getsize(filename) > 0
+    except Exception:
+        return False
+    finally:
+        os.remove(filename)
+
+
+def replay_format(codec, container):
+    """
+    Returns the (codec, container) to write the replays with,
+    MJPG in AVI if the ones chosen are not supported
+    """
+    if codec_available(codec, container):
+        return codec, container
+    print('The codec %s can not be written in %s here, the replays are saved in MJPG/avi' %
+          (codec, container))
+    return 'MJPG', 'avi'
+
+
+def sample_frames(resolution=constants.CAM_RESOLUTION_BIG, nb_frames=60, seed=0):
+    """
+    Returns frames of a ball moving over a noisy table, to compare the codecs
+    """
+    (w, h) = resolution
+    rng = np.random.default_rng(seed)
+    table = cv2.GaussianBlur(rng.integers(30, 120, (h, w, 3), dtype=np.uint8), (9, 9), 0)
+    frames = []
+    for i in range(nb_frames):
+        frame = cv2.add(table, rng.integers(0, 8, (h, w, 3), dtype=np.uint8))
+        x = int(w * (0.1 + 0.8 * i / max(nb_frames - 1, 1)))
+        cv2.circle(frame, (x, h // 2), max(h // 40, 4), (230, 230, 230), -1)
+        frames.append(frame)
+    return frames
+
+
+def compare_codecs(frames, fps=30, quality=constants.JPEG_QUALITY, resolution=None,
+                   executor=None, formats=None):
+    """
+    Encodes the frames with every (codec, container) supported here and
+    returns, for each, a dict with the encoding time, the frames encoded
+    per second and the file size
+    """
+    # the clips use the codecs
+    from core.utils.clip import Clip
+
+    clip = Clip(frames, np.arange(len(frames)) / fps, fps=fps)
+    results = []
+    for codec, container in formats or [(codec, container) for codec in constants.REPLAY_CODECS
+                                        for container in constants.REPLAY_CONTAINERS]:
+        result = {'codec': codec, 'container': container, 'available': codec_available(codec, container)}
+        if result['available']:
+            (fd, filename) = tempfile.mkstemp(suffix='.' + container)
+            os.close(fd)
+            start = perf_counter()
+            clip.save(filename, codec, quality, resolution, executor)
+            result['encode_s'] = perf_counter() - start
+            result['fps'] = len(frames) / result['encode_s']
+            result['size_mb'] = os.path.getsize(filename) / 1e6
+            os.remove(filename)
+        results.append(result)
+    return results
+
+
+def format_comparison(results):
+    """
+    Returns the results of compare_codecs as a text table
+    """
+    lines = ['%-6s %-5s %9s %9s %9s' % ('codec', 'file', 'time (s)', 'frames/s', 'size (MB)')]
+    for result in results:
+        if result['available']:
+            lines.append('%-6s %-5s %9.2f %9.0f %9.1f' % (result['codec'], result['container'],
+                                                          result['encode_s'], result['fps'],
+                                                          result['size_mb']))
+        else:
+            lines.append('%-6s %-5s %29s' % (result['codec'], result['container'], 'not supported'))
+    return '\n'.join(lines)
@@ -0,0 +1,98 @@
+import cv2
+import numpy as np
+
+from core.utils import constants
+from core.utils.clip import decode_jpeg
+from core.utils.codecs import JPEGWriter, encode_jpeg, open_writer
+
+
+def composite_timeline(clips):
+    """
+    Returns the timestamps and the frame rate of the composite video,
+    those of the clip with the most frames, and for every clip the index
+    of the frame shown at each of these timestamps (the last one captured
+    by then, -1 for an empty clip).
+    """
+    master = max(clips, key=len)
+    timestamps = np.asarray(master.timestamps)
+
+    indices = []
+    for clip in clips:
+        if len(clip) == 0:
+            indices.append(np.full(len(timestamps), -1))
+        else:
+            index = np.searchsorted(np.asarray(clip.timestamps), timestamps, side='right') - 1
+            # a frame slightly after the first composite frame is shown from the start
+            indices.append(np.maximum(index, 0))
+    return timestamps, master.fps, indices
+
+
+def draw_tile(tile, frame, jpeg=False):
+    """
+    Draws a frame (BGR array or JPEG bytes) in a tile of the composite,
+    scaled to fit it without changing its aspect ratio. The tile is a
+    view of the composite frame, the frame is resized directly in it.
+    """
+    (th, tw) = tile.shape[:2]
+    if jpeg:
+        frame = decode_jpeg(frame, (tw, th))
+
+    (h, w) = frame.shape[:2]
+    scale = min(tw / w, th / h)
+    (fw, fh) = (min(round(w * scale), tw), min(round(h * scale), th))
+    (x, y) = ((tw - fw) // 2, (th - fh) // 2)
+    target = tile[y:y + fh, x:x + fw]
+
+    if (fw, fh) == (w, h):
+        target[:] = frame
+    else:
+        # area averaging only pays off when the frame is at least halved
+        interpolation = cv2.INTER_AREA if scale <= 0.5 else cv2.INTER_LINEAR
+        cv2.resize(frame, (fw, fh), dst=target, interpolation=interpolation)
+
+
+def render_composite(clips, filename, tile_size, codec='MJPG',
+                     quality=constants.JPEG_QUALITY, executor=None):
+    """
+    Renders synchronized clips side by side, each in a tile of tile_size,
+    into a single video file encoded in one pass.
+
+    The frames of every clip are matched to the timeline of the clip
+    with the most frames, so the angles stay aligned even if the cameras
+    run at different frame rates. A tile is only drawn again when its
+    frame changes. For MJPG in AVI, the composite frames are encoded by
+    chunks on the executor, if any. Returns False if there was nothing
+    to render.
+    """
+    if not clips or max(len(clip) for clip in clips) == 0:
+        return False
+
+    (timestamps, fps, indices) = composite_timeline(clips)
+    if not fps > 0:
+        return False
+
+    (tw, th) = tile_size
+    canvas = np.zeros((th, tw * len(clips), 3), dtype=np.uint8)
+    tiles = [canvas[:, i * tw:(i + 1) * tw] for i in range(len(clips))]
+    shown = [-1] * len(clips)
+
+    writer = open_writer(filename, codec, fps, (canvas.shape[1], canvas.shape[0]), quality)
+    # the frames are copied for the workers, the canvas is drawn on again
+    parallel = executor is not None and isinstance(writer, JPEGWriter)
+    chunk = []
+    for n in range(len(timestamps)):
+        for i, (clip, tile, index) in enumerate(zip(clips, tiles, indices)):
+            if index[n] >= 0 and index[n] != shown[i]:
+                shown[i] = index[n]
+                draw_tile(tile, clip.frames[index[n]], clip.jpeg)
+
+        if not parallel:
+            writer.write(canvas)
+            continue
+        chunk.append(canvas.copy())
+        if len(chunk) == constants.ENCODE_CHUNK or n == len(timestamps) - 1:
+            for data in executor.map(lambda frame: encode_jpeg(frame, quality), chunk):
+                writer.write(data)
+            chunk = []
+    writer.release()
+    return True
@@ -0,0 +1,191 @@
+import json
+import os
+import shutil
+from threading import Event, Lock, Thread
+
+from core.utils import constants
+from core.utils.utils import parse_fps, parse_per_camera, parse_region, parse_resolution
+
+
+def positive(value):
+    return value > 0
+
+
+def not_negative(value):
+    return value >= 0
+
+
+def one_of(*choices):
+    return lambda value: value in choices
+
+
+def region(value):
+    if value:
+        parse_region(value)
+    return True
+
+
+def resolution(value):
+    parse_resolution(value)
+    return True
+
+
+def per_camera(parse):
+    return lambda value: bool(parse_per_camera(value, parse))
+
+
+class Config:
+    """
+    Typed settings, loaded once and kept in memory.
+
+    The settings file is watched and reloaded when it changes: the values
+    are converted and validated (an invalid value keeps the previous one)
+    and the subscribers are called with the names of the settings that
+    changed, so that the running components apply them. Reading a
+    setting never touches the disk.
+    """
+    # name: (type, validation)
+    FIELDS = {
+        'speed_factor': (float, positive),
+        'replay_duration': (float, positive),
+        'replay_delay': (float, not_negative),
+        'pre_roll': (float, not_negative),
+        'post_roll': (float, not_negative),
+        'replay_layout': (str, one_of('separate', 'composite')),
+        'replay_source': (str, one_of('file', 'memory')),
+        'library_quota': (float, not_negative),
+        'library_eviction': (str, one_of('lru', 'age')),
+        'replay_codec': (str, one_of(*constants.REPLAY_CODECS)),
+        'replay_container': (str, one_of(*constants.REPLAY_CONTAINERS)),
+        'replay_quality': (int, lambda value: 1 <= value <= 100),
+        'replay_resolution': (str, resolution),
+        'ingest_mode': (str, one_of('decode', 'passthrough')),
+        'capture_mode': (str, one_of('thread', 'process')),
+        'preview_fps': (float, positive),
+        'camera_timeout': (float, positive),
+        'stored_resolution': (str, per_camera(parse_resolution)),
+        'stored_fps': (str, per_camera(parse_fps)),
+        'recording_mode': (str, one_of('memory', 'segments')),
+        'segment_duration': (float, positive),
+        'metrics_interval': (float, not_negative),
+        'stream_port': (int, lambda value: 0 <= value < 65536),
+        'stream_fps': (float, positive),
+        'baudrate': (int, positive),
+        'port': (str, None),
+        'detector_sample_rate': (int, positive),
+        'detector_debounce': (float, not_negative),
+        'goal_detector': (str, one_of('ir', 'vision')),
+        'vision_blue_goal': (str, region),
+        'vision_red_goal': (str, region),
+        'vision_threshold': (float, positive),
+        'vision_min_area': (float, lambda value: 0 < value < 1),
+        'ball_color': (str, one_of('none', *constants.BALL_COLORS)),
+        'field_width': (float, positive),
+    }
+
+    def __init__(self, filename=constants.SETTINGS_PATH,
+                 defaults_filename=constants.DEFAULT_SETTINGS_PATH):
+        self.filename = filename
+
+        # Create initial settings file with the default settings
+        if not os.path.exists(filename):
+            shutil.copyfile(defaults_filename, filename)
+
+        with open(defaults_filename, 'r') as content:
+            self.values = self.convert(json.load(content), {})
+
+        self.mtime = None
+        self.subscribers = []
+        self.lock = Lock()
+        self.reload()
+
+        self.stopped = Event()
+        self.thread = None
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['values'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def get(self, key, default=None):
+        """
+        Returns the value of a setting, same signature as
+        sg.user_settings_get_entry
+        """
+        return self.values.get(key, default)
+
+    def convert(self, raw, previous):
+        """
+        Converts the raw values of the settings file,
+        the invalid ones keep their previous value
+        """
+        values = dict(previous)
+        for key, value in raw.items():
+            if key not in self.FIELDS:
+                values[key] = value
+                continue
+
+            (kind, valid) = self.FIELDS[key]
+            try:
+                # the settings dialog saves the numbers as strings
+                value = kind(float(value)) if kind is int else kind(value)
+                if valid is not None and not valid(value):
+                    raise ValueError
+            except (TypeError, ValueError):
+                print('Invalid setting %s: %r, keeping %r' % (key, value, previous.get(key)))
+                continue
+            values[key] = value
+        return values
+
+    def subscribe(self, callback, keys=None):
+        """
+        Calls callback(changed) with the set of the changed settings
+        whenever one of the keys (any setting if None) changes.
+        The callback is called from the watching thread.
+        """
+        self.subscribers.append((callback, None if keys is None else set(keys)))
+
+    def reload(self):
+        """
+        Reloads the settings file if it changed and notifies the
+        subscribers. Returns the set of the changed settings.
+        """
+        with self.lock:
+            try:
+                mtime = os.stat(self.filename).st_mtime_ns
+                if mtime == self.mtime:
+                    return set()
+                with open(self.filename, 'r') as content:
+                    raw = json.load(content)
+            except (OSError, ValueError):
+                # missing or being written, tried again at the next check
+                return set()
+            self.mtime = mtime
+
+            values = self.convert(raw, self.values)
+            changed = {key for key in values if values[key] != self.values.get(key)}
+            self.values = values
+
+        for callback, keys in list(self.subscribers):
+            if changed and (keys is None or changed & keys):
+                callback(changed)
+        return changed
+
+    def watch(self, interval=1):
+        """
+        Starts checking the settings file every interval seconds
+        """
+        if self.thread is None:
+            self.thread = Thread(target=self.loop, args=(interval,), daemon=True)
+            self.thread.start()
+
+    def loop(self, interval):
+        while not self.stopped.wait(interval):
+            self.reload()
+
+    def stop(self):
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
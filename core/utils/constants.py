@@ -4,6 +4,32 @@ import os
 CAM_RESOLUTION_BIG = (640, 480)
 CAM_RESOLUTION_SMALL = (480, 360)
 
+# Live preview image format, PPM is the cheapest to encode and to display
+PREVIEW_FORMAT = '.ppm'
+
+# JPEG quality of the recorded segments and default one of the replays
+JPEG_QUALITY = 90
+
+# Frames encoded together by a worker when saving a replay
+ENCODE_CHUNK = 16
+
+# Codecs and containers of the replays, H.264 (avc1) depends on the opencv build
+REPLAY_CODECS = ('MJPG', 'mp4v', 'XVID', 'avc1')
+REPLAY_CONTAINERS = ('avi', 'mp4', 'mkv')
+
+# Frame rate used when the camera does not report one
+DEFAULT_FPS = 30
+
+# Highest frame rate expected from a camera
+MAX_FPS = 60
+
+# HSV bounds of the ball colors for the ball tracking
+BALL_COLORS = {
+    'white': ((0, 0, 190), (180, 50, 255)),
+    'orange': ((5, 120, 120), (22, 255, 255)),
+    'yellow': ((22, 100, 120), (35, 255, 255)),
+}
+
 # Icons paths
 GREEN_LIGHT_ICON = 'core/icons/Green_Light_Icon.png'
 RED_LIGHT_ICON = 'core/icons/Red_Light_Icon.png'
@@ -13,4 +39,8 @@ DEFAULT_SETTINGS_PATH = os.path.join(os.getcwd(), 'core', 'settings', 'default_s
 SETTINGS_PATH = os.path.join(os.getcwd(), 'core', 'settings', 'settings.json')
 
 # Goal videos path
+GOAL_VIDEOS_ROOT = os.path.join(os.getcwd(), 'goal_videos')
 GOAL_VIDEOS_PATH = ''
+
+# Index of the replays, in the goal videos folder
+LIBRARY_FILE = 'library.sqlite3'
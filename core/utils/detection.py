@@ -0,0 +1,67 @@
+from core.utils.serial_bridge import IR_Goal_Detector
+from core.utils.utils import parse_region
+
+IR_SETTINGS = {'baudrate', 'port', 'detector_sample_rate', 'detector_debounce'}
+VISION_SETTINGS = {'vision_blue_goal', 'vision_red_goal', 'vision_threshold',
+                   'vision_min_area', 'detector_debounce'}
+
+
+def vision_regions(settings):
+    """
+    Returns the (color, camera number, roi) of the goal regions
+    """
+    regions = []
+    for color, key in (('b', 'vision_blue_goal'), ('r', 'vision_red_goal')):
+        if settings(key, ''):
+            (camera, roi) = parse_region(settings(key))
+            regions.append((color, camera, roi))
+    return regions
+
+
+def create_detector(settings, webcams):
+    """
+    Creates the goal detector chosen in the settings (a function
+    returning the value of a setting), webcams is a function returning
+    the connected webcams.
+    """
+    if settings('goal_detector', 'ir') == 'vision':
+        # opencv is only imported for the vision detector
+        from core.utils.vision_detector import Vision_Goal_Detector
+
+        return Vision_Goal_Detector(webcams, vision_regions(settings),
+                                    float(settings('vision_threshold', 25)),
+                                    float(settings('vision_min_area', 0.05)),
+                                    float(settings('detector_debounce', 1)))
+
+    return IR_Goal_Detector(int(settings('baudrate')),
+                            int(settings('detector_sample_rate')),
+                            settings('port') or None,
+                            float(settings('detector_debounce', 1)))
+
+
+def configure_detector(detector, settings, webcams, changed):
+    """
+    Applies the changed settings to the running detector. Returns the
+    detector to use, a new one if the kind of detector changed.
+    """
+    if 'goal_detector' in changed:
+        callback = detector.callback
+        detector.stop()
+        detector = create_detector(settings, webcams)
+        if callback is not None:
+            detector.start(callback)
+
+    elif isinstance(detector, IR_Goal_Detector):
+        if changed & IR_SETTINGS:
+            detector.configure(int(settings('baudrate')),
+                               int(settings('detector_sample_rate')),
+                               settings('port') or None,
+                               float(settings('detector_debounce', 1)))
+
+    elif changed & VISION_SETTINGS:
+        detector.configure(vision_regions(settings),
+                           float(settings('vision_threshold', 25)),
+                           float(settings('vision_min_area', 0.05)),
+                           float(settings('detector_debounce', 1)))
+
+    return detector
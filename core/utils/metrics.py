@@ -0,0 +1,150 @@
+import json
+import os
+from collections import deque
+from datetime import datetime
+from threading import Event, Thread
+from time import monotonic
+
+
+class Metrics:
+    """
+    Runtime counters of a component: event counts, rates measured over a
+    sliding window, durations of the recent operations and gauges computed
+    when the metrics are read.
+    """
+    def __init__(self, name, window=5):
+        self.name = name
+        self.window = window
+
+        self.counters = {}
+        self.events = {}
+        self.durations = {}
+        self.gauges = {}
+
+    def increment(self, name, n=1):
+        """
+        Increments a counter
+        """
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def tick(self, name, n=1, timestamp=None):
+        """
+        Records n events to measure their rate, they are counted too
+        """
+        if name not in self.events:
+            self.events[name] = deque()
+        timestamp = monotonic() if timestamp is None else timestamp
+        self.events[name].append((timestamp, n))
+        self.increment(name, n)
+        self.trim(self.events[name], timestamp)
+
+    def trim(self, events, now):
+        """
+        Forgets the events older than the window
+        """
+        limit = now - self.window
+        try:
+            while events and events[0][0] < limit:
+                events.popleft()
+        except IndexError:
+            # emptied by another thread
+            pass
+
+    def rate(self, name):
+        """
+        Returns the number of events per second over the window
+        """
+        events = self.events.get(name)
+        if not events:
+            return 0
+
+        self.trim(events, monotonic())
+        return sum(n for _, n in list(events)) / self.window
+
+    def observe(self, name, duration):
+        """
+        Records the duration (in seconds) of an operation
+        """
+        if name not in self.durations:
+            self.durations[name] = deque(maxlen=100)
+        self.durations[name].append(duration)
+
+    def latency(self, name, q=50):
+        """
+        Returns a percentile of the recent durations in milliseconds
+        """
+        durations = self.durations.get(name)
+        if not durations:
+            return 0
+
+        # linear interpolation between the closest ranks, like numpy
+        # (which is not imported to keep the startup fast)
+        durations = sorted(durations)
+        position = (len(durations) - 1) * q / 100
+        lower = int(position)
+        upper = min(lower + 1, len(durations) - 1)
+        duration = durations[lower] + (durations[upper] - durations[lower]) * (position - lower)
+        return duration * 1000
+
+    def gauge(self, name, function):
+        """
+        Registers a value computed by function when the metrics are read
+        """
+        self.gauges[name] = function
+
+    def summary(self):
+        """
+        Returns all the metrics as a dict
+        """
+        summary = {'component': self.name}
+        # copies, the component may add new metrics meanwhile
+        summary.update(dict(self.counters))
+        for name in list(self.events):
+            summary[name + '_per_s'] = self.rate(name)
+        for name in list(self.durations):
+            summary[name + '_p50_ms'] = self.latency(name, 50)
+            summary[name + '_p99_ms'] = self.latency(name, 99)
+        for name, function in list(self.gauges.items()):
+            summary[name] = function()
+        return summary
+
+
+class MetricsLogger:
+    """
+    Periodically appends the metrics of the running components
+    to a JSON lines file.
+    """
+    def __init__(self, filename, sources, interval=5):
+        self.filename = filename
+        # function returning the Metrics objects to log
+        self.sources = sources
+        self.interval = interval
+
+        self.stopped = Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+            self.thread = Thread(target=self.loop, daemon=True)
+            self.thread.start()
+
+    def loop(self):
+        while not self.stopped.wait(self.interval):
+            self.log()
+
+    def log(self):
+        """
+        Writes one line per component
+        """
+        time = datetime.now().isoformat(timespec='seconds')
+        with open(self.filename, 'a') as out_file:
+            for metrics in self.sources():
+                out_file.write(json.dumps(dict(time=time, **metrics.summary())) + '\n')
+
+    def stop(self):
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+            self.log()
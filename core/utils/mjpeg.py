@@ -0,0 +1,123 @@
+import struct
+from time import monotonic
+from urllib.request import urlopen
+
+
+class MJPEGStream:
+    """
+    Reader for a multipart MJPEG HTTP stream (as served by droidcam)
+    that returns the compressed JPEG frames without decoding them.
+    """
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+        self.response = None
+        self.boundary = None
+
+        # true when the boundary of the next part has already been read
+        self.at_part = False
+
+    def open(self):
+        """
+        Opens the HTTP stream and reads the multipart boundary.
+        """
+        self.response = urlopen(self.url, timeout=self.timeout)
+
+        content_type = self.response.headers.get('Content-Type', '')
+        for param in content_type.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.lower() == 'boundary':
+                self.boundary = value.strip('"').lstrip('-').encode()
+
+        if not self.boundary:
+            self.release()
+            raise Exception('%s is not a multipart MJPEG stream' % self.url)
+
+    def isOpened(self):
+        return self.response is not None
+
+    def is_boundary(self, line):
+        # the last boundary of the stream ends with '--'
+        return line.strip().lstrip(b'-') in (self.boundary, self.boundary + b'--')
+
+    def read(self):
+        """
+        Reads the next frame of the stream.
+        Returns the JPEG bytes and the arrival timestamp of the frame,
+        or (None, None) if the stream ended.
+        """
+        readline = self.response.readline
+
+        # skip everything until the next part
+        while not self.at_part:
+            line = readline()
+            if not line:
+                return None, None
+            self.at_part = self.is_boundary(line)
+
+        # part headers
+        headers = {}
+        while True:
+            line = readline()
+            if not line:
+                return None, None
+            line = line.strip()
+            if not line:
+                break
+            key, _, value = line.partition(b':')
+            headers[key.strip().lower()] = value.strip()
+
+        length = headers.get(b'content-length')
+        if length:
+            data = self.response.read(int(length))
+            self.at_part = False
+        else:
+            # no length given, the frame ends with the next boundary
+            lines = []
+            while True:
+                line = readline()
+                if not line or self.is_boundary(line):
+                    break
+                lines.append(line)
+            data = b''.join(lines).rstrip(b'\r\n')
+            self.at_part = bool(line)
+
+        return data, monotonic()
+
+    def release(self):
+        """
+        Closes the stream
+        """
+        if self.response is not None:
+            self.response.close()
+            self.response = None
+        self.at_part = False
+
+
+def jpeg_size(data):
+    """
+    Returns the (width, height) of a JPEG image by reading its
+    start of frame marker, without decoding the image.
+    """
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            i += 1
+            continue
+
+        marker = data[i + 1]
+        # start of frame markers, except DHT, JPG and DAC
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            (h, w) = struct.unpack('>HH', data[i + 5:i + 9])
+            return w, h
+
+        # markers without a payload
+        if marker in (0x01, 0xFF) or 0xD0 <= marker <= 0xD8:
+            i += 2 if marker != 0xFF else 1
+            continue
+
+        (length,) = struct.unpack('>H', data[i + 2:i + 4])
+        i += 2 + length
+
+    raise ValueError('Invalid JPEG data')
@@ -0,0 +1,262 @@
+from multiprocessing import Pipe, get_context
+from threading import Event, Lock, Thread
+from time import monotonic, sleep
+
+from core.utils import constants
+from core.utils.metrics import Metrics
+from core.utils.shared_ring import SharedFrameRing
+from core.utils.webcam import Webcam
+
+# seconds for the capture process to start, on top of the connection timeout
+STARTUP_TIME = 10
+
+
+class RemoteMetrics(Metrics):
+    """
+    Metrics of a capture process, merged with the ones recorded locally.
+    """
+    def __init__(self, name):
+        super().__init__(name)
+        self.remote = {}
+
+    def rate(self, name):
+        return self.remote.get(name + '_per_s', super().rate(name))
+
+    def latency(self, name, q=50):
+        return self.remote.get('%s_p%d_ms' % (name, q), super().latency(name, q))
+
+    def summary(self):
+        summary = dict(self.remote)
+        summary.update(super().summary())
+        return summary
+
+
+class CaptureWebcam(Webcam):
+    """
+    The webcam running in the capture process. Its buffer is a shared
+    memory ring, the GUI process makes the previews from it.
+    """
+    def __init__(self, conn, *args):
+        super().__init__(*args)
+        self.conn = conn
+        self.send_lock = Lock()
+
+    def send(self, message):
+        with self.send_lock:
+            self.conn.send(message)
+
+    def create_buffer(self, duration):
+        return SharedFrameRing(int(self.stored_rate(self.fps) * duration),
+                               on_allocate=self.announce_ring, size=self.stored_size)
+
+    def announce_ring(self, ring):
+        self.send(('ring', ring.name, ring.capacity, ring.frames.shape[1:]))
+
+    def resize_buffer(self, duration):
+        previous = self.buffer
+        super().resize_buffer(duration)
+        previous.release()
+
+    def update_preview(self, frame):
+        pass
+
+
+def capture_process(conn, ip, buffer_duration, preview_size, preview_fps,
+                    stored_size=None, stored_fps=None, timeout=5):
+    """
+    Entry point of the capture process: captures the frames of a webcam
+    until the 'stop' message arrives.
+    """
+    webcam = CaptureWebcam(conn, ip, buffer_duration, 'decode', preview_size, preview_fps,
+                           stored_size, stored_fps, timeout)
+    try:
+        webcam.connect()
+    except Exception as e:
+        conn.send(('error', str(e)))
+        return
+    webcam.send(('connected', webcam.fps))
+
+    while True:
+        if conn.poll(1):
+            message = conn.recv()
+            if message[0] == 'stop':
+                break
+            elif message[0] == 'resize':
+                webcam.resize_buffer(message[1])
+            elif message[0] == 'storage':
+                webcam.configure_storage(*message[1:])
+            elif message[0] == 'reconnect':
+                try:
+                    webcam.reconnect()
+                    webcam.send(('reconnected', None))
+                except Exception as e:
+                    webcam.send(('reconnected', str(e)))
+
+        webcam.send(('metrics', webcam.metrics.summary(), webcam.last_read))
+
+    webcam.disconnect()
+    webcam.buffer.release()
+    conn.close()
+
+
+class ProcessWebcam(Webcam):
+    """
+    Webcam capturing in its own process, so that capture does not compete
+    with the GUI for the interpreter lock. The frames are written to a
+    shared memory ring mapped by this process: the preview is made from
+    its latest slot at most preview_fps times per second, and the
+    replays copy it once. Only the control messages and the metrics go
+    through a pipe.
+
+    Only the 'decode' ingest mode is supported.
+    """
+    def __init__(self, ip, buffer_duration, ingest='decode',
+                 preview_size=constants.CAM_RESOLUTION_BIG, preview_fps=15,
+                 stored_size=None, stored_fps=None, timeout=5):
+        super().__init__(ip, buffer_duration, 'decode', preview_size, preview_fps,
+                         stored_size, stored_fps, timeout)
+        self.metrics = RemoteMetrics(ip)
+        self.metrics.gauge('buffer_frames', lambda: len(self.buffer))
+        self.metrics.gauge('buffer_mb', lambda: self.buffer.nbytes() / 1e6)
+        self.metrics.gauge('stalled', lambda: self.stalled())
+
+        self.conn = None
+        self.process = None
+        self.listening_thread = None
+        self.preview_thread = None
+
+        # answer of the capture process to a reconnection
+        self.reconnected = Event()
+        self.reconnect_error = None
+
+    def connect(self):
+        """
+        Starts the capture process and waits for it to connect.
+        """
+        print('Connecting to %s ...' % self.ip)
+        self.conn, child_conn = Pipe()
+        self.process = get_context('spawn').Process(
+            target=capture_process,
+            args=(child_conn, self.ip, self.buffer_duration,
+                  self.preview_size, self.preview_fps,
+                  self.stored_size, self.stored_fps, self.timeout),
+            daemon=True)
+        self.process.start()
+        child_conn.close()
+
+        if not self.conn.poll(STARTUP_TIME + self.timeout):
+            self.process.kill()
+            raise Exception('Could not connect %s' % self.ip)
+
+        message = self.conn.recv()
+        if message[0] == 'error':
+            self.process.join()
+            raise Exception(message[1])
+
+        self.fps = message[1]
+        self.last_read = monotonic()
+        self.is_buffering = True
+        print('Succefully connected to %s!' % self.ip)
+
+        self.listening_thread = Thread(target=self.listen, daemon=True)
+        self.listening_thread.start()
+        self.preview_thread = Thread(target=self.follow_preview, daemon=True)
+        self.preview_thread.start()
+
+    def listen(self):
+        """
+        Handles the messages of the capture process.
+        """
+        while True:
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                break
+
+            if message[0] == 'ring':
+                (name, capacity, shape) = message[1:]
+                previous, self.buffer = self.buffer, SharedFrameRing.attach(name, capacity, shape)
+                if isinstance(previous, SharedFrameRing):
+                    previous.close()
+            elif message[0] == 'metrics':
+                (self.metrics.remote, self.last_read) = message[1:]
+            elif message[0] == 'reconnected':
+                self.reconnect_error = message[1]
+                self.reconnected.set()
+
+        self.is_buffering = False
+
+    def follow_preview(self):
+        """
+        Makes the preview from the latest frame of the shared ring
+        """
+        count = 0
+        while self.is_buffering:
+            sleep(1 / self.preview_fps)
+            ring = self.buffer
+            if not isinstance(ring, SharedFrameRing) or ring.count in (0, count):
+                continue
+            # only the latest slot is copied, dropped if overwritten meanwhile
+            frames, _, count = ring.since(ring.count - 1)
+            if len(frames) > 0:
+                self.update_preview(frames[-1])
+
+    def resize_buffer(self, duration):
+        self.buffer_duration = duration
+        self.conn.send(('resize', duration))
+
+    def configure_storage(self, stored_size, stored_fps):
+        if (stored_size, stored_fps) != (self.stored_size, self.stored_fps):
+            self.stored_size = stored_size
+            self.stored_fps = stored_fps
+            self.conn.send(('storage', stored_size, stored_fps))
+
+    def reconnect(self):
+        """
+        Reopens the stream in the capture process, the buffered frames
+        are kept. A capture process that died is started again.
+        """
+        if not self.process.is_alive():
+            self.listening_thread.join()
+            self.preview_thread.join()
+            self.conn.close()
+            self.connect()
+            return
+
+        self.reconnected.clear()
+        self.conn.send(('reconnect',))
+        if not self.reconnected.wait(STARTUP_TIME + self.timeout):
+            raise Exception('Could not reconnect %s' % self.ip)
+        if self.reconnect_error is not None:
+            raise Exception(self.reconnect_error)
+
+    def stop_buffering(self):
+        if self.is_buffering:
+            self.conn.send(('stop',))
+            self.process.join()
+            self.listening_thread.join()
+            self.is_buffering = False
+            self.preview_thread.join()
+
+    def disconnect(self):
+        if self.recorder is not None:
+            self.recorder.stop()
+            self.recorder = None
+        self.stop_tracking()
+        self.stop_buffering()
+        if isinstance(self.buffer, SharedFrameRing):
+            self.buffer.close()
+
+        print('%s disconnected' % self.ip)
+
+    def status(self):
+        metrics = self.metrics
+        return '%s: %.1f/%.0f fps, %d dup, read %.0f ms, buf %.0f%% %.0f MB%s (process)' % (
+            self.ip,
+            metrics.rate('frames'),
+            self.fps or 0,
+            metrics.remote.get('duplicates', 0),
+            metrics.latency('read'),
+            100 * len(self.buffer) / self.buffer.capacity,
+            self.buffer.nbytes() / 1e6,
+            self.connection_status())
@@ -0,0 +1,309 @@
+import os
+import re
+import sqlite3
+from threading import Event, Lock, Thread
+from time import monotonic, time
+
+from core.utils import constants
+
+# largest size of the thumbnails (the composite replays are wider)
+THUMBNAIL_SIZE = (320, 120)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    folder TEXT UNIQUE NOT NULL,
+    started REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS replays (
+    id INTEGER PRIMARY KEY,
+    game_id INTEGER NOT NULL REFERENCES games(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    scorer TEXT,
+    time REAL NOT NULL,
+    speed REAL,
+    blue_score INTEGER,
+    red_score INTEGER,
+    size INTEGER NOT NULL,
+    thumbnail BLOB,
+    last_used REAL NOT NULL,
+    UNIQUE (game_id, name)
+);
+CREATE TABLE IF NOT EXISTS files (
+    replay_id INTEGER NOT NULL REFERENCES replays(id) ON DELETE CASCADE,
+    camera INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS replays_time ON replays(time);
+CREATE INDEX IF NOT EXISTS replays_last_used ON replays(last_used);
+CREATE INDEX IF NOT EXISTS replays_scorer ON replays(scorer, time);
+CREATE INDEX IF NOT EXISTS files_replay ON files(replay_id);
+"""
+
+# columns returned by search()
+COLUMNS = ('replays.id', 'games.folder', 'name', 'scorer', 'time', 'speed',
+           'blue_score', 'red_score', 'size', 'last_used')
+
+
+def create_thumbnail(filename, size=THUMBNAIL_SIZE):
+    """
+    Returns the middle frame of a video as PNG bytes fitting in size,
+    or None if it can not be read
+    """
+    # opencv is only loaded once there are replays
+    import cv2
+
+    cap = cv2.VideoCapture(filename)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, cap.get(cv2.CAP_PROP_FRAME_COUNT) // 2)
+    ret, frame = cap.read()
+    cap.release()
+    if not ret:
+        return None
+
+    (h, w) = frame.shape[:2]
+    scale = min(size[0] / w, size[1] / h)
+    frame = cv2.resize(frame, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+    return cv2.imencode('.png', frame)[1].tobytes()
+
+
+class ReplayLibrary:
+    """
+    Index of the saved replays, in a SQLite database next to the goal
+    videos: the games, their replays (scorer, time, score, shot speed,
+    size, thumbnail) and the files of every camera. Browsing and
+    searching the replays only reads the index.
+
+    A disk quota can be set, the replays are then evicted in the
+    background, least recently watched ('lru') or oldest ('age') first.
+    The eviction never runs while a replay is being saved and never
+    touches the current game.
+    """
+    def __init__(self, root=constants.GOAL_VIDEOS_ROOT, quota=0, eviction='lru'):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+
+        # the index is used by the GUI, the replay writer and the eviction
+        self.connection = sqlite3.connect(os.path.join(root, constants.LIBRARY_FILE),
+                                          check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.executescript(SCHEMA)
+        self.lock = Lock()
+
+        # function returning True while a replay is being saved
+        self.saving = lambda: False
+        self.stopped = Event()
+        self.check = Event()
+        self.thread = None
+
+        self.configure(quota, eviction)
+        self.game_id = None
+
+    def execute(self, sql, parameters=()):
+        """
+        Runs a statement in a transaction, returns the rows
+        """
+        with self.lock, self.connection:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def configure(self, quota, eviction='lru'):
+        """
+        Sets the disk quota in GB (0 for none) and the eviction policy
+        """
+        self.quota = int(quota * 1e9)
+        self.eviction = eviction
+        self.check.set()
+
+    def relative(self, path):
+        return os.path.relpath(path, self.root)
+
+    def game(self, folder):
+        """
+        Returns the id of the game of a folder, added if needed
+        """
+        folder = self.relative(folder)
+        self.execute('INSERT OR IGNORE INTO games (folder, started) VALUES (?, ?)', (folder, time()))
+        return self.execute('SELECT id FROM games WHERE folder = ?', (folder,))[0]['id']
+
+    def new_game(self, folder):
+        """
+        Adds the game recorded in folder, it is the current game
+        """
+        self.game_id = self.game(folder)
+        return self.game_id
+
+    def add_replay(self, folder_path, filenames, scorer=None, goal_time=None,
+                   speed=None, score=(None, None)):
+        """
+        Indexes the files of a replay saved in folder_path (a folder of
+        a game folder). A replay saved again replaces the previous one.
+        goal_time is monotonic. Returns the id of the replay.
+        """
+        game_id = self.game(os.path.dirname(folder_path))
+        name = os.path.basename(folder_path)
+        when = time() if goal_time is None else time() - (monotonic() - goal_time)
+
+        files = []
+        for filename in filenames:
+            if not os.path.exists(filename):
+                continue
+            # the composite is camera 0
+            match = re.match(r'cam(\d+)\.\w+$', os.path.basename(filename))
+            camera = int(match.group(1)) if match else 0
+            files.append((camera, self.relative(filename), os.path.getsize(filename)))
+        thumbnail = create_thumbnail(filenames[0]) if files else None
+        size = sum(file_size for _, _, file_size in files)
+
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM replays WHERE game_id = ? AND name = ?', (game_id, name))
+            cursor = self.connection.execute(
+                'INSERT INTO replays (game_id, name, scorer, time, speed, blue_score, red_score,'
+                ' size, thumbnail, last_used) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (game_id, name, scorer, when, speed, score[0], score[1], size, thumbnail, when))
+            replay_id = cursor.lastrowid
+            self.connection.executemany(
+                'INSERT INTO files (replay_id, camera, path, size) VALUES (?, ?, ?, ?)',
+                [(replay_id,) + file for file in files])
+
+        # the quota is checked once the save is over
+        self.check.set()
+        return replay_id
+
+    def search(self, scorer=None, since=None, game_id=None, limit=200):
+        """
+        Returns the most recent replays as dicts, optionally only those
+        of a scorer ('blue', 'red', or '' for the replays without goal),
+        since a time (seconds since the epoch) or of a game
+        """
+        conditions = []
+        parameters = []
+        if scorer == '':
+            conditions.append('scorer IS NULL')
+        elif scorer is not None:
+            conditions.append('scorer = ?')
+            parameters.append(scorer)
+        if since is not None:
+            conditions.append('time >= ?')
+            parameters.append(since)
+        if game_id is not None:
+            conditions.append('game_id = ?')
+            parameters.append(game_id)
+
+        sql = 'SELECT %s FROM replays JOIN games ON games.id = replays.game_id' % ', '.join(COLUMNS)
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY time DESC LIMIT ?'
+        return [dict(row) for row in self.execute(sql, parameters + [limit])]
+
+    def thumbnail(self, replay_id):
+        rows = self.execute('SELECT thumbnail FROM replays WHERE id = ?', (replay_id,))
+        return rows[0]['thumbnail'] if rows else None
+
+    def files(self, replay_id):
+        """
+        Returns the paths of the files of a replay, by camera
+        """
+        rows = self.execute('SELECT path FROM files WHERE replay_id = ? ORDER BY camera', (replay_id,))
+        return [os.path.join(self.root, row['path']) for row in rows]
+
+    def mark_used(self, replay_id):
+        """
+        Records that a replay was watched, for the 'lru' eviction
+        """
+        self.execute('UPDATE replays SET last_used = ? WHERE id = ?', (time(), replay_id))
+
+    def total_size(self):
+        return self.execute('SELECT COALESCE(SUM(size), 0) AS size FROM replays')[0]['size']
+
+    def remove(self, replay_id):
+        """
+        Deletes the files of a replay and removes it from the index
+        """
+        for filename in self.files(replay_id):
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+            except PermissionError:
+                # being played, evicted later
+                return False
+
+            folder = os.path.dirname(filename)
+            if os.path.isdir(folder) and not os.listdir(folder):
+                os.rmdir(folder)
+
+        self.execute('DELETE FROM replays WHERE id = ?', (replay_id,))
+        return True
+
+    def remove_game(self, folder):
+        """
+        Removes the replays of a game from the index, once its
+        folder has been deleted
+        """
+        self.execute('DELETE FROM games WHERE folder = ?', (self.relative(folder),))
+
+    def evict(self):
+        """
+        Deletes replays until the library fits in the quota, unless a
+        replay is being saved. Returns the number of deleted replays.
+        """
+        if self.quota <= 0:
+            return 0
+
+        order = 'last_used' if self.eviction == 'lru' else 'time'
+        total = self.total_size()
+        evicted = 0
+        while total > self.quota and not self.saving():
+            rows = self.execute('SELECT id, size FROM replays WHERE game_id IS NOT ?'
+                                ' ORDER BY %s LIMIT 1' % order, (self.game_id,))
+            if not rows or not self.remove(rows[0]['id']):
+                break
+            total -= rows[0]['size']
+            evicted += 1
+
+        if evicted:
+            self.prune_games()
+            print('Replay library: %d replays evicted, %.0f MB left' % (evicted, total / 1e6))
+        return evicted
+
+    def prune_games(self):
+        """
+        Removes the past games without replays left, and their folders
+        """
+        rows = self.execute('SELECT id, folder FROM games WHERE id IS NOT ? AND NOT EXISTS'
+                            ' (SELECT 1 FROM replays WHERE game_id = games.id)', (self.game_id,))
+        for row in rows:
+            folder = os.path.join(self.root, row['folder'])
+            if os.path.isdir(folder) and not os.listdir(folder):
+                os.rmdir(folder)
+            self.execute('DELETE FROM games WHERE id = ?', (row['id'],))
+
+    def start(self, saving, interval=30):
+        """
+        Starts evicting replays in the background, every interval
+        seconds and after every replay saved. saving is a function
+        returning True while a replay is being saved.
+        """
+        self.saving = saving
+        if self.thread is None:
+            self.thread = Thread(target=self.loop, args=(interval,), daemon=True)
+            self.thread.start()
+
+    def loop(self, interval):
+        while not self.stopped.is_set():
+            self.check.wait(interval)
+            self.check.clear()
+            if not self.stopped.is_set():
+                self.evict()
+
+    def stop(self):
+        if self.thread is not None:
+            self.stopped.set()
+            self.check.set()
+            self.thread.join()
+            self.thread = None
+
+    def close(self):
+        self.stop()
+        self.connection.close()
@@ -0,0 +1,115 @@
+from collections import OrderedDict
+from time import monotonic
+
+# states of the queue
+IDLE = 'idle'
+SAVING = 'saving'
+WAITING = 'waiting'
+PLAYING = 'playing'
+
+
+class ReplayQueue:
+    """
+    Shows the goal replays one after the other without blocking the
+    event loop, which calls update() at every iteration:
+
+        saving  -> the replay of the next goal is being written
+        waiting -> it is saved, the replay delay since the goal runs out
+        playing -> the player shows it, until it ends or is skipped
+        idle    -> no replay to show
+
+    The goals scored while a replay is saved or played are queued and
+    shown next, in order. The player is polled for the replay playing:
+    poll() returns None while it plays, else 'ended', 'skip' or
+    'skip_all' (which also drops the queued replays). The player is told
+    to drop() the replays that will not be shown.
+    """
+    def __init__(self, player, delay):
+        self.player = player
+        # function returning the replay delay (s)
+        self.delay = delay
+
+        # goal number: (goal time, saved), in goal order
+        self.goals = OrderedDict()
+        self.playing = None
+
+    def __len__(self):
+        return len(self.goals) + (self.playing is not None)
+
+    @property
+    def state(self):
+        if self.playing is not None:
+            return PLAYING
+        if not self.goals:
+            return IDLE
+        (goal_time, saved) = next(iter(self.goals.values()))
+        return WAITING if saved else SAVING
+
+    def add(self, goal_number, goal_time):
+        """
+        Queues the replay of a goal, being saved. A goal saved again
+        (the score was corrected) takes the place of the previous one.
+        """
+        self.goals.pop(goal_number, None)
+        self.goals[goal_number] = (goal_time, False)
+
+    def saved(self, goal_number, success=True):
+        """
+        Marks the replay of a goal as ready to be shown, a replay that
+        could not be saved is dropped unless it was already ready (shown
+        from memory)
+        """
+        if goal_number not in self.goals:
+            return
+        (goal_time, ready) = self.goals[goal_number]
+        if success:
+            self.goals[goal_number] = (goal_time, True)
+        elif not ready:
+            del self.goals[goal_number]
+
+    def update(self, now=None):
+        """
+        Follows the replay playing and starts the next one once it is
+        saved and its delay is over. Returns the state of the queue.
+        """
+        if self.playing is not None:
+            reason = self.player.poll()
+            if reason is None:
+                return PLAYING
+            self.playing = None
+            if reason == 'skip_all':
+                self.drop_all()
+
+        now = monotonic() if now is None else now
+        while self.goals and self.playing is None:
+            (goal_number, (goal_time, saved)) = next(iter(self.goals.items()))
+            if not saved or now - goal_time < self.delay():
+                break
+            del self.goals[goal_number]
+            if self.player.start(goal_number, goal_time):
+                self.playing = goal_number
+
+        if self.playing is None:
+            self.player.hide()
+        return self.state
+
+    def skip(self):
+        """
+        Cuts short the replay playing, the next one is shown
+        """
+        if self.playing is not None:
+            self.player.stop()
+            self.playing = None
+
+    def clear(self):
+        """
+        Stops the replay playing and drops the queued ones
+        """
+        self.drop_all()
+        self.skip()
+        self.player.hide()
+
+    def drop_all(self):
+        for goal_number in self.goals:
+            self.player.drop(goal_number)
+        self.goals.clear()
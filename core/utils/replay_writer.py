@@ -0,0 +1,197 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+from time import monotonic, sleep
+
+from core.utils import constants
+from core.utils.metrics import Metrics
+from core.utils.sync import synchronize
+
+
+class ReplayWriter:
+    """
+    Background service saving the goal replays.
+
+    The buffers of all the webcams are snapshotted together and the clips
+    are then encoded in parallel on a pool of workers, so neither the GUI
+    nor the capture threads wait for the encoding.
+
+    A replay can be limited to a time window around the goal, the writer
+    then lets the capture run until the end of the window and only
+    encodes the frames inside it.
+
+    The clips can also be rendered side by side into a single composite
+    video, so that the replay plays one stream.
+
+    The MJPG frames are independent, they are also encoded by chunks on
+    a second pool, so that a single clip uses all the cores.
+
+    The snapshotted clips can be handed over before they are encoded,
+    to show the replay straight from memory while it is archived.
+    """
+    def __init__(self, max_workers=3):
+        # a single thread takes the snapshots so they stay in goal order
+        self.scheduler = ThreadPoolExecutor(max_workers=1,
+                                            thread_name_prefix='replay_scheduler')
+        self.encoders = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix='replay_encoder')
+        self.max_workers = max_workers
+        # pools replaced by larger ones, they finish their clips
+        self.retired = []
+        # a worker of the encoders waits for its chunks, they need their own pool
+        self.chunk_encoders = ThreadPoolExecutor(max_workers=os.cpu_count(),
+                                                 thread_name_prefix='replay_chunk_encoder')
+        # the callbacks index the replays, the scheduler only snapshots
+        self.callbacks = ThreadPoolExecutor(max_workers=1,
+                                            thread_name_prefix='replay_callback')
+        # replays being saved and callbacks being run
+        self.pending = set()
+
+        self.metrics = Metrics('replay_writer')
+
+    def save(self, webcams, folder_path, callback=None, codec='MJPG', window=None, tile_size=None,
+             container='avi', quality=constants.JPEG_QUALITY, resolution=None, on_snapshot=None):
+        """
+        Saves the buffer of every webcam as 'cam<i>.<container>' in the
+        folder, with the codec given (MJPG in AVI if it is not supported).
+        The quality applies to MJPG, the frames are downscaled to fit the
+        resolution (width, height) if one is given.
+        The window (start, end) in monotonic time limits the replay.
+        If a tile_size (width, height) is given, the clips are instead
+        rendered side by side in a single 'composite.<container>'.
+        Returns a future resolved with the list of written files (None if
+        no clip had frames), the callback (if any) is called with the same
+        list once they are ready, or with None if the replay could not be
+        saved. The callbacks are run in goal order on their own thread.
+        on_snapshot (if any) is called with the synchronized clips before
+        they are encoded.
+
+        The future has a 'timings' dict filled with the monotonic time at
+        which each stage ('start', 'snapshot', 'encoded') ended.
+        """
+        timings = {}
+        encoding = {'codec': codec, 'container': container,
+                    'quality': quality, 'resolution': resolution}
+        future = self.scheduler.submit(self.write, list(webcams), folder_path,
+                                       window, tile_size, encoding, timings, on_snapshot)
+        future.timings = timings
+        self.pending.add(future)
+        if callback is not None:
+            future.add_done_callback(lambda f: self.notify(callback, f))
+        future.add_done_callback(self.pending.discard)
+
+        return future
+
+    def notify(self, callback, future):
+        """
+        Hands the written files (None if the replay could not be saved)
+        to the callback on the callback thread
+        """
+        filenames = None if future.exception() else future.result()
+        notified = self.callbacks.submit(callback, filenames)
+        self.pending.add(notified)
+        notified.add_done_callback(self.notified)
+
+    def notified(self, future):
+        self.pending.discard(future)
+        if future.exception() is not None:
+            print('Replay callback failed: %r' % future.exception())
+
+    def write(self, webcams, folder_path, window, tile_size, encoding, timings, on_snapshot=None):
+        """
+        Snapshots the buffers and encodes the clips in parallel, or in a
+        single composite on one worker (the clips are encoded separately
+        if it can not be rendered). The clips are cut to the same
+        time window.
+        """
+        timings['start'] = monotonic()
+        if window is not None:
+            # wait for the end of the window to be captured
+            remaining = window[1] - monotonic()
+            if remaining > 0:
+                sleep(remaining)
+
+        window = window or (None, None)
+        clips = synchronize([webcam.snapshot(*window) for webcam in webcams])
+        timings['snapshot'] = monotonic()
+        if on_snapshot is not None:
+            on_snapshot(clips)
+
+        # opencv is only loaded once a replay is saved
+        from core.utils.codecs import replay_format
+
+        (codec, container) = replay_format(encoding['codec'], encoding['container'])
+        quality = encoding['quality']
+
+        if tile_size is not None:
+            filename = os.path.join(folder_path, 'composite.' + container)
+            if self.encoders.submit(self.composite, clips, filename, codec, quality, tile_size).result():
+                timings['encoded'] = monotonic()
+                return [filename]
+            print('Composite replay could not be rendered, saving the cameras separately')
+
+        filenames = [os.path.join(folder_path, 'cam%d.%s' % (i, container))
+                     for i in range(1, len(clips) + 1)]
+        futures = [self.encoders.submit(self.encode, webcam, clip, filename, codec,
+                                        quality, encoding['resolution'])
+                   for webcam, clip, filename in zip(webcams, clips, filenames)]
+        wait(futures)
+
+        # raise encoding errors, the empty clips are not written
+        written = [filename for filename in (future.result() for future in futures)
+                   if filename is not None]
+        timings['encoded'] = monotonic()
+
+        return written or None
+
+    def encode(self, webcam, clip, filename, codec, quality, resolution):
+        """
+        Encodes a clip and records the time it took in the webcam metrics.
+        Returns the filename, or None if the clip is empty.
+        """
+        start = monotonic()
+        filename = clip.save(filename, codec, quality, resolution, self.chunk_encoders)
+        if filename is not None:
+            webcam.metrics.observe('save', monotonic() - start)
+        return filename
+
+    def composite(self, clips, filename, codec, quality, tile_size):
+        """
+        Renders the composite of the clips and records the time it took.
+        Returns False if there was nothing to render.
+        """
+        # opencv is only loaded once a replay is saved
+        from core.utils.composite import render_composite
+
+        start = monotonic()
+        rendered = render_composite(clips, filename, tile_size, codec, quality, self.chunk_encoders)
+        if rendered:
+            self.metrics.observe('composite', monotonic() - start)
+        return rendered
+
+    def ensure_workers(self, max_workers):
+        """
+        Grows the pool of encoders to max_workers (one per camera), the
+        clips already submitted are encoded by the previous pool
+        """
+        if max_workers > self.max_workers:
+            self.retired.append(self.encoders)
+            self.encoders = ThreadPoolExecutor(max_workers=max_workers,
+                                               thread_name_prefix='replay_encoder')
+            self.max_workers = max_workers
+
+    def wait(self):
+        """
+        Waits for the replays being saved and their callbacks
+        """
+        while self.pending:
+            wait(list(self.pending))
+
+    def shutdown(self):
+        """
+        Waits for the replays being saved and stops the workers
+        """
+        self.scheduler.shutdown(wait=True)
+        self.callbacks.shutdown(wait=True)
+        for encoders in self.retired + [self.encoders]:
+            encoders.shutdown(wait=True)
+        self.chunk_encoders.shutdown(wait=True)
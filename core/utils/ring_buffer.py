@@ -0,0 +1,262 @@
+from threading import Lock
+from time import monotonic
+
+import numpy as np
+
+from core.utils.clip import fit_size, resize
+
+
+class RingBuffer:
+    """
+    Fixed capacity FIFO buffer with O(1) insertion. Once full, the oldest
+    item is overwritten. Every item is stored with its capture timestamp
+    (time.monotonic() by default).
+    """
+    def __init__(self, capacity):
+        self.capacity = max(int(capacity), 1)
+        self.items = [None] * self.capacity
+        self.timestamps = np.zeros(self.capacity)
+
+        # total number of items ever put, also used as a sequence number
+        self.count = 0
+
+        self.lock = Lock()
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def nbytes(self):
+        """
+        Returns the memory used by the items in bytes
+        """
+        with self.lock:
+            return sum(len(item) for item in self.items if item is not None)
+
+    def full(self):
+        """
+        Returns true if the buffer is full
+        """
+        return self.count >= self.capacity
+
+    def put(self, item, timestamp=None):
+        """
+        Puts an item at the end of the buffer, overwriting the oldest one
+        if the buffer is full
+        """
+        if timestamp is None:
+            timestamp = monotonic()
+
+        with self.lock:
+            index = self.store(self.count % self.capacity, item)
+            self.timestamps[index] = timestamp
+            self.count += 1
+
+    def store(self, index, item):
+        """
+        Stores an item in the given slot, returns the slot used
+        """
+        self.items[index] = item
+        return index
+
+    def load(self, index):
+        """
+        Returns the item of the given slot
+        """
+        return self.items[index]
+
+    def get(self, seq):
+        """
+        Returns the item of sequence number seq (without copy) and its
+        timestamp, or (None, None) if it is not in the buffer anymore.
+        """
+        count = self.count
+        if not count - len(self) <= seq < count:
+            return None, None
+        index = seq % self.capacity
+        return self.load(index), self.timestamps[index]
+
+    def start_index(self):
+        """
+        Returns the slot index of the oldest item
+        """
+        return self.count % self.capacity if self.full() else 0
+
+    def order(self):
+        """
+        Returns the slot indices from the oldest to the newest item
+        """
+        start = self.start_index()
+        return [(start + i) % self.capacity for i in range(len(self))]
+
+    def window(self, start=None, end=None):
+        """
+        Returns the ordered slot indices of the items captured between
+        start and end (monotonic timestamps, None for no limit)
+        """
+        order = self.order()
+        if start is None and end is None:
+            return order
+        times = self.timestamps[order]
+        first = 0 if start is None else np.searchsorted(times, start, side='left')
+        last = len(order) if end is None else np.searchsorted(times, end, side='right')
+        return order[first:last]
+
+    def last(self):
+        """
+        Returns the last element from the buffer
+        """
+        if self.count > 0:
+            return self.items[(self.count - 1) % self.capacity]
+
+    def last_timestamp(self):
+        """
+        Returns the timestamp of the last element from the buffer
+        """
+        if self.count > 0:
+            return self.timestamps[(self.count - 1) % self.capacity]
+
+    def dump(self):
+        """
+        Returns the items ordered from the oldest to the newest
+        """
+        with self.lock:
+            return [self.items[i] for i in self.order()]
+
+    def times(self):
+        """
+        Returns the timestamps ordered from the oldest to the newest
+        """
+        with self.lock:
+            return self.timestamps[self.order()]
+
+    def snapshot(self, start=None, end=None):
+        """
+        Returns a consistent copy of the items and their timestamps
+        that is not affected by later insertions, optionally only the
+        items captured between start and end.
+        """
+        with self.lock:
+            indices = self.window(start, end)
+            return [self.items[i] for i in indices], self.timestamps[indices]
+
+    def since_indices(self, seq):
+        """
+        Returns the slot indices of the items put since the sequence
+        number seq that are still in the buffer.
+        """
+        if seq > self.count:
+            # the buffer was reset
+            seq = 0
+        first = max(seq, self.count - len(self))
+        return [i % self.capacity for i in range(first, self.count)]
+
+    def since(self, seq):
+        """
+        Returns a copy of the items put since the sequence number seq,
+        their timestamps and the sequence number to use for the next call.
+        """
+        with self.lock:
+            indices = self.since_indices(seq)
+            return [self.items[i] for i in indices], self.timestamps[indices], self.count
+
+
+class FrameRingBuffer(RingBuffer):
+    """
+    Ring buffer for video frames backed by a single preallocated
+    (capacity, h, w, 3) uint8 array. The array is allocated when the first
+    frame arrives and reallocated if the frame shape changes.
+
+    If a size (width, height) is given, the larger frames are scaled
+    down to fit it as they are stored, directly into their slot.
+    """
+    def __init__(self, capacity, size=None):
+        super().__init__(capacity)
+        self.size = size
+        self.frames = None
+
+    def nbytes(self):
+        """
+        Returns the memory used by the frame storage in bytes
+        """
+        return 0 if self.frames is None else self.frames.nbytes
+
+    def stored_shape(self, item):
+        """
+        Returns the shape of a frame once stored
+        """
+        if self.size is None:
+            return item.shape
+        (w, h) = fit_size((item.shape[1], item.shape[0]), self.size)
+        return (h, w) + item.shape[2:]
+
+    def write(self, index, item):
+        """
+        Copies a frame in a slot, scaled down if needed
+        """
+        slot = self.frames[index]
+        resize(item, (slot.shape[1], slot.shape[0]), dst=slot)
+
+    def store(self, index, item):
+        shape = self.stored_shape(item)
+        if self.frames is None or self.frames.shape[1:] != shape:
+            # (re)allocate the storage and forget the frames of other shape
+            self.frames = np.empty((self.capacity,) + shape, dtype=np.uint8)
+            self.timestamps[:] = 0
+            self.count = index = 0
+
+        self.write(index, item)
+        return index
+
+    def load(self, index):
+        return self.frames[index]
+
+    def last(self):
+        if self.count > 0:
+            return self.frames[(self.count - 1) % self.capacity]
+
+    def views(self):
+        """
+        Returns the frames as at most two contiguous zero-copy views of the
+        storage, ordered from the oldest to the newest frame.
+        """
+        if self.count == 0:
+            return []
+
+        start = self.start_index()
+        if start == 0:
+            return [self.frames[:len(self)]]
+        return [self.frames[start:], self.frames[:start]]
+
+    def dump(self):
+        """
+        Returns zero-copy views of the frames ordered from the oldest
+        to the newest. The views are overwritten by later insertions,
+        use snapshot() to keep them.
+        """
+        with self.lock:
+            return [frame for view in self.views() for frame in view]
+
+    def snapshot(self, start=None, end=None):
+        """
+        Returns a consistent copy of the frames as a single
+        (n, h, w, 3) array, along with their timestamps. Only the
+        frames captured between start and end are copied.
+        """
+        with self.lock:
+            if start is None and end is None:
+                views = self.views()
+                if not views:
+                    return np.empty((0, 0, 0, 3), dtype=np.uint8), np.empty(0)
+                return np.concatenate(views), self.timestamps[self.order()]
+
+            indices = self.window(start, end)
+            if not indices:
+                return np.empty((0, 0, 0, 3), dtype=np.uint8), np.empty(0)
+            return self.frames[indices], self.timestamps[indices]
+
+    def since(self, seq):
+        with self.lock:
+            indices = self.since_indices(seq)
+            if not indices:
+                return np.empty((0, 0, 0, 3), dtype=np.uint8), np.empty(0), self.count
+            return self.frames[indices], self.timestamps[indices], self.count
@@ -0,0 +1,166 @@
+import os
+import shutil
+import tempfile
+from collections import deque
+from threading import Lock, Thread
+from time import monotonic, sleep
+
+import cv2
+import numpy as np
+
+from core.utils import constants
+from core.utils.avi import MJPEGAviWriter
+from core.utils.clip import Clip
+from core.utils.mjpeg import jpeg_size
+
+
+class Segment:
+    """
+    A few frames of a webcam written as a MJPG avi file. The file position
+    of every JPEG frame is kept so they can be read back without parsing.
+    """
+    def __init__(self, filename, timestamps, positions):
+        self.filename = filename
+        self.timestamps = timestamps
+        self.positions = positions
+
+    def read(self, first, last):
+        """
+        Reads the JPEG bytes of the frames first to last (excluded)
+        """
+        frames = []
+        with open(self.filename, 'rb') as segment_file:
+            for position, size in self.positions[first:last]:
+                segment_file.seek(position)
+                frames.append(segment_file.read(size))
+        return frames
+
+
+class SegmentRecorder:
+    """
+    Continuously encodes the frames of a webcam into short rolling MJPG
+    segments on disk and only keeps the last keep_duration seconds.
+
+    The encoding cost is spread over time by a background thread, and a
+    replay is built by copying the JPEG frames of the segments covering
+    it, without re-encoding them. The webcam buffer only has to hold a
+    couple of segments.
+    """
+    def __init__(self, webcam, segment_duration=1, keep_duration=10):
+        self.webcam = webcam
+        self.segment_duration = segment_duration
+        self.keep_duration = keep_duration
+
+        self.folder = tempfile.mkdtemp(prefix='segments_')
+        self.segments = deque()
+        self.nb_segments = 0
+
+        # sequence number of the next frame to record in the webcam buffer
+        self.buffer = None
+        self.seq = 0
+        # timestamp of the last recorded frame
+        self.last_timestamp = -np.inf
+
+        self.lock = Lock()
+        self.recording = False
+        self.thread = None
+
+    def start(self):
+        if not self.recording:
+            self.recording = True
+            self.thread = Thread(target=self.loop, daemon=True)
+            self.thread.start()
+
+    def loop(self):
+        """
+        Writes a new segment every segment_duration seconds
+        """
+        while self.recording:
+            sleep(self.segment_duration)
+            self.flush()
+            self.drop_old_segments()
+
+    def flush(self):
+        """
+        Writes the frames buffered since the last segment as a new segment
+        """
+        with self.lock:
+            buffer = self.webcam.buffer
+            if buffer is not self.buffer:
+                # the webcam (re)started buffering, the new buffer can hold
+                # copies of the frames already recorded
+                self.buffer = buffer
+                self.seq = 0
+
+            frames, timestamps, self.seq = buffer.since(self.seq)
+            new = timestamps > self.last_timestamp
+            if not new.all():
+                frames = [frame for frame, keep in zip(frames, new) if keep]
+                timestamps = timestamps[new]
+            if len(frames) == 0:
+                return
+            self.last_timestamp = timestamps[-1]
+
+            if self.webcam.ingest != 'passthrough':
+                params = [cv2.IMWRITE_JPEG_QUALITY, constants.JPEG_QUALITY]
+                frames = [cv2.imencode('.jpg', frame, params)[1].tobytes() for frame in frames]
+
+            filename = os.path.join(self.folder, 'segment_%d.avi' % self.nb_segments)
+            self.nb_segments += 1
+
+            fps = Clip(frames, timestamps).fps or constants.DEFAULT_FPS
+            writer = MJPEGAviWriter(filename, fps, jpeg_size(frames[0]))
+            for data in frames:
+                writer.write(data)
+            writer.release()
+
+            self.segments.append(Segment(filename, timestamps, writer.positions))
+
+    def drop_old_segments(self):
+        """
+        Deletes the segments older than keep_duration
+        """
+        limit = monotonic() - self.keep_duration
+        with self.lock:
+            while self.segments and self.segments[0].timestamps[-1] < limit:
+                os.remove(self.segments.popleft().filename)
+
+    def clip(self, start=None, end=None):
+        """
+        Returns the recorded JPEG frames between start and end
+        (monotonic timestamps) as a Clip, including the frames
+        not written to a segment yet.
+        """
+        self.flush()
+
+        with self.lock:
+            segments = list(self.segments)
+
+        if start is None:
+            start = -np.inf
+        if end is None:
+            end = np.inf
+
+        frames = []
+        timestamps = []
+        for segment in segments:
+            first = np.searchsorted(segment.timestamps, start, side='left')
+            last = np.searchsorted(segment.timestamps, end, side='right')
+            if first < last:
+                frames += segment.read(first, last)
+                timestamps.append(segment.timestamps[first:last])
+
+        timestamps = np.concatenate(timestamps) if timestamps else np.empty(0)
+        return Clip(frames, timestamps, jpeg=True)
+
+    def stop(self):
+        """
+        Stops the recording and deletes the segments
+        """
+        if self.recording:
+            self.recording = False
+            self.thread.join()
+
+        with self.lock:
+            self.segments.clear()
+            shutil.rmtree(self.folder, ignore_errors=True)
@@ -1,26 +1,50 @@
-from threading import Thread
-from time import sleep
+from threading import Lock, Thread
+from time import monotonic, sleep
 
 import serial
 from serial.tools import list_ports
 
+from core.utils.metrics import Metrics
+
 
 class IR_Goal_Detector:
     """
     A communication bridge between the arduino IR detection system
     and the replay GUI.
+
+    The arduino sends '0' when both goals are empty and 'b' or 'r' while
+    the ball is in the blue or red goal. A single listening thread stays
+    alive, reads every byte as it arrives and fires a goal on the '0' to
+    'b'/'r' transition, at most once per debounce period. The port is
+    reopened with an increasing delay when it drops.
     """
-    def __init__(self, baudrate, sample_rate, port=None):
+    MIN_BACKOFF = 0.5
+    MAX_BACKOFF = 8
+
+    def __init__(self, baudrate, sample_rate, port=None, debounce=1):
         self.sample_rate = sample_rate
+        self.debounce = debounce
 
         self.ser = serial.Serial()
         self.ser.baudrate = baudrate
         self.ser.port = port
+        # the arduino sends a byte every sample period, the timeout
+        # only bounds how long stop() waits for the thread
+        self.ser.timeout = 2 / sample_rate
+        self.auto_port = port is None
 
+        self.callback = None
         self.listening_thread = None
         self.listening = False
+        self.paused = False
 
         self.connected = False
+        self.port_lock = Lock()
+        # (baudrate, port) given to configure()
+        self.pending = None
+
+        self.metrics = Metrics('serial')
+        self.metrics.gauge('connected', lambda: self.connected)
 
     def find_available_port(self):
         """
@@ -30,59 +54,165 @@ class IR_Goal_Detector:
         for port in ports:
             description = port.description.lower()
             if 'serial' in description or 'bluetooth' not in description:
-                return port.name
+                return port.device
 
-    def start(self, callback):
+    def open(self):
         """
-        Starts to detect goals and executes the function given
-        in the call back. The values given by detection are 'r'
-        for red goal and 'b for blue goal.
+        Opens the serial port, looking for one if none was given.
+        Returns True if the port is open.
         """
-        if self.ser.port is None:
-            self.ser.port = self.find_available_port()
+        with self.port_lock:
+            if self.ser.is_open:
+                self.connected = True
+                return True
+
+            if self.auto_port:
+                self.ser.port = self.find_available_port()
+                if self.ser.port is None:
+                    self.connected = False
+                    return False
 
-        if not self.ser.is_open:
             try:
                 self.ser.open()
-            except serial.serialutil.SerialException:
+            except (serial.SerialException, OSError):
                 self.connected = False
-                return
+                return False
 
-        self.connected = True
+            # clean serial before starting to read
+            self.ser.reset_input_buffer()
+            self.connected = True
+            return True
 
-        # clean serial before starting to read
-        self.ser.flushInput()
+    def configure(self, baudrate, sample_rate, port=None, debounce=1):
+        """
+        Applies new settings while running. The port settings are
+        applied by the listening thread, which reopens the port if
+        it or the baudrate changed.
+        """
+        self.sample_rate = sample_rate
+        self.debounce = debounce
+        self.pending = (baudrate, port)
+
+        if not self.listening:
+            self.apply_port_settings()
 
-        self.listening_thread = Thread(target=self.thread, args=[callback])
-        self.listening_thread.start()
+    def apply_port_settings(self):
+        with self.port_lock:
+            (baudrate, port) = self.pending
+            self.pending = None
+
+            self.ser.timeout = 2 / self.sample_rate
+            if port != (None if self.auto_port else self.ser.port) or baudrate != self.ser.baudrate:
+                self.ser.close()
+                self.connected = False
+                self.auto_port = port is None
+                # set while closed, pyserial reopens an open port
+                self.ser.port = port
+                self.ser.baudrate = baudrate
 
-    def thread(self, callback):
+    def close(self):
+        with self.port_lock:
+            self.ser.close()
+            self.connected = False
+
+    def start(self, callback):
         """
-        Thread to check the serial port.
+        Starts to detect goals and executes the function given
+        in the call back. The values given by detection are 'r'
+        for red goal and 'b for blue goal, along with the monotonic
+        time at which the detection arrived.
         """
+        self.callback = callback
+        self.paused = False
+
+        # try to connect right away so that the status can be shown
+        self.open()
+
         if not self.listening:
             self.listening = True
+            self.listening_thread = Thread(target=self.thread, daemon=True)
+            self.listening_thread.start()
 
-            while self.listening:
-                try:
-                    val = self.ser.readline(1).decode()
-                except serial.serialutil.SerialException:
-                    self.connected = False
-                    self.listening = False
-                    break
+    def thread(self):
+        """
+        Thread to check the serial port.
+        """
+        backoff = self.MIN_BACKOFF
+
+        # unknown until a first byte is read, so that a ball already
+        # resting in a goal is not counted
+        state = None
+        last_goal = None
+        dropped = False
+
+        while self.listening:
+            if self.pending is not None:
+                self.apply_port_settings()
+
+            if not self.connected:
+                if not self.open():
+                    sleep(backoff)
+                    backoff = min(backoff * 2, self.MAX_BACKOFF)
+                    continue
+                if dropped:
+                    self.metrics.increment('reconnects')
+                    dropped = False
+                backoff = self.MIN_BACKOFF
+                state = None
 
-                if val in ('b', 'r'):
-                    callback(val, '')
-                    self.listening = False
+            try:
+                data = self.ser.read(1)
+            except (serial.SerialException, OSError):
+                self.close()
+                dropped = True
+                continue
+
+            # read timeout
+            if not data:
+                continue
+
+            timestamp = monotonic()
+            self.metrics.tick('bytes', timestamp=timestamp)
+            val = chr(data[0])
+            if val not in ('0', 'b', 'r'):
+                continue
+
+            previous, state = state, val
+            if val == '0' or previous != '0' or self.paused:
+                continue
+            if last_goal is not None and timestamp - last_goal < self.debounce:
+                continue
+
+            last_goal = timestamp
+            self.metrics.increment('goals')
+            self.callback(val, timestamp)
+
+    def status(self):
+        """
+        Returns a short summary of the metrics for the status strip
+        """
+        return 'serial: %s, %.0f B/s, %d reconnects' % (
+            'on' if self.connected else 'off',
+            self.metrics.rate('bytes'),
+            self.metrics.counters.get('reconnects', 0))
 
-                sleep(1/self.sample_rate)
-                self.ser.reset_input_buffer()
+    def pause(self):
+        """
+        Ignores the goals until resume() is called, the port stays open.
+        """
+        self.paused = True
+
+    def resume(self):
+        """
+        Resumes the goal detection after pause().
+        """
+        self.paused = False
 
     def stop(self):
         """
         Stops the goal detection system.
         """
         if self.listening:
-            self.listening_thread.join()
             self.listening = False
-            self.ser.close()
+            self.listening_thread.join()
+        self.close()
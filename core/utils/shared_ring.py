@@ -0,0 +1,171 @@
+from multiprocessing import shared_memory
+from time import monotonic
+
+import numpy as np
+
+from core.utils.ring_buffer import FrameRingBuffer
+
+
+def attach_shared_memory(name):
+    """
+    Attaches to an existing shared memory block. The capture processes
+    share the resource tracker of the GUI process, which must not destroy
+    the block when it is only attached.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # python < 3.13, the tracker only knows the block once
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedFrameRing(FrameRingBuffer):
+    """
+    Frame ring buffer stored in a shared memory block, written by the
+    capture process and read without copies by the other processes.
+
+    Layout of the block: the frame count (int64), the sequence number of
+    the frame in every slot (int64, -1 while it is written), the
+    timestamps (float64) and the (capacity, h, w, 3) uint8 frames.
+    Readers check the sequence numbers to drop the frames overwritten
+    while they were copying them.
+    """
+    def __init__(self, capacity, on_allocate=None, size=None):
+        # the count lives in the header once the block is allocated
+        self.header = np.zeros(1, dtype=np.int64)
+        self.shm = None
+        self.owner = False
+        self.closed = False
+
+        super().__init__(capacity, size)
+        self.seqs = np.full(self.capacity, -1, dtype=np.int64)
+
+        # called with the ring once the block is (re)allocated
+        self.on_allocate = on_allocate
+
+    @property
+    def count(self):
+        return int(self.header[0])
+
+    @count.setter
+    def count(self, value):
+        self.header[0] = value
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @classmethod
+    def attach(cls, name, capacity, shape):
+        """
+        Maps the block allocated by another process
+        """
+        ring = cls(capacity)
+        ring.map(attach_shared_memory(name), shape)
+        return ring
+
+    def map(self, shm, shape):
+        cap = self.capacity
+        self.shm = shm
+        self.header = np.ndarray((1,), np.int64, shm.buf, 0)
+        self.seqs = np.ndarray((cap,), np.int64, shm.buf, 8)
+        self.timestamps = np.ndarray((cap,), np.float64, shm.buf, 8 + 8 * cap)
+        self.frames = np.ndarray((cap,) + tuple(shape), np.uint8, shm.buf, 8 + 16 * cap)
+
+    def allocate(self, shape):
+        """
+        Allocates a new block for frames of the given shape
+        """
+        self.close()
+
+        size = 8 + 16 * self.capacity + self.capacity * int(np.prod(shape))
+        self.map(shared_memory.SharedMemory(create=True, size=size), shape)
+        self.owner = True
+        self.count = 0
+        self.seqs[:] = -1
+
+        if self.on_allocate is not None:
+            self.on_allocate(self)
+
+    def put(self, item, timestamp=None):
+        if timestamp is None:
+            timestamp = monotonic()
+
+        with self.lock:
+            if self.closed:
+                return
+            shape = self.stored_shape(item)
+            if self.frames is None or self.frames.shape[1:] != shape:
+                self.allocate(shape)
+
+            count = self.count
+            index = count % self.capacity
+            self.seqs[index] = -1
+            self.write(index, item)
+            self.timestamps[index] = timestamp
+            self.seqs[index] = count
+            self.count = count + 1
+
+    def copy(self, first, start=None, end=None):
+        """
+        Copies the frames from the sequence number first to the last one,
+        dropping the frames overwritten during the copy. Only the frames
+        captured between start and end are copied.
+        """
+        count = self.count
+        if self.frames is None or count == 0:
+            return np.empty((0, 0, 0, 3), dtype=np.uint8), np.empty(0), count
+
+        if first > count:
+            # the ring was reset
+            first = 0
+        seqs = np.arange(max(first, count - self.capacity), count)
+        indices = seqs % self.capacity
+        if start is not None or end is not None:
+            times = self.timestamps[indices]
+            keep = slice(0 if start is None else np.searchsorted(times, start, side='left'),
+                         len(times) if end is None else np.searchsorted(times, end, side='right'))
+            seqs, indices = seqs[keep], indices[keep]
+
+        frames = self.frames[indices]
+        timestamps = self.timestamps[indices]
+        valid = self.seqs[indices] == seqs
+        return frames[valid], timestamps[valid], count
+
+    def snapshot(self, start=None, end=None):
+        frames, timestamps, _ = self.copy(0, start, end)
+        return frames, timestamps
+
+    def since(self, seq):
+        return self.copy(seq)
+
+    def close(self):
+        """
+        Unmaps the block, and destroys it if it was allocated here
+        """
+        if self.shm is None:
+            return
+
+        shm, owner = self.shm, self.owner
+        self.shm = None
+        self.header = np.array([self.count], dtype=np.int64)
+        self.seqs = np.full(self.capacity, -1, dtype=np.int64)
+        self.timestamps = np.zeros(self.capacity)
+        self.frames = None
+
+        try:
+            shm.close()
+        except BufferError:
+            # a view of a frame is still used, the block is unmapped
+            # when it is garbage collected
+            pass
+        if owner:
+            shm.unlink()
+
+    def release(self):
+        """
+        Closes the ring for good, later insertions are ignored
+        """
+        with self.lock:
+            self.closed = True
+            self.close()
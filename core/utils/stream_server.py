@@ -0,0 +1,348 @@
+import json
+import mimetypes
+import os
+import re
+import shutil
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Condition, Lock, Thread
+from time import monotonic, sleep
+from urllib.parse import urlparse
+
+from core.utils import constants
+from core.utils.metrics import Metrics
+
+# port of the spectator server
+STREAM_PORT = 8480
+
+BOUNDARY = b'frame'
+
+# names of the replay folders and files that can be downloaded
+SAFE_NAME = re.compile(r'^[\w-]+(\.\w+)?$')
+
+INDEX = """<!DOCTYPE html>
+<html>
+<head><title>Table soccer</title>
+<style>body{background:#222;color:#eee;font-family:sans-serif;text-align:center}
+img{max-width:48%%;margin:4px}a{color:#8cf}</style></head>
+<body>
+<h1 id="score">-</h1>
+<div>%s</div>
+<h2>Replays</h2>
+<ul id="replays"></ul>
+<script>
+function refresh() {
+  fetch('/score').then(r => r.json()).then(s => {
+    document.getElementById('score').textContent = 'Blue ' + s.blue + ' - ' + s.red + ' Red';
+  });
+  fetch('/replays').then(r => r.json()).then(replays => {
+    document.getElementById('replays').innerHTML = replays.map(replay =>
+      '<li>' + replay.name + ': ' + replay.files.map(f =>
+        '<a href="' + f + '">' + f.split('/').pop() + '</a>').join(' ') + '</li>').join('');
+  });
+}
+refresh();
+setInterval(refresh, 2000);
+</script>
+</body>
+</html>
+"""
+
+
+class FrameBroadcast:
+    """
+    Latest frame of a webcam as JPEG, encoded once and shared by all the
+    clients of its stream. The frames are taken from the webcam buffer,
+    at most fps times per second and only while a client watches. The
+    clients always get the latest frame: a slow client skips frames
+    instead of queueing them.
+    """
+    def __init__(self, webcams, index, fps, quality, metrics):
+        # function returning the connected webcams
+        self.webcams = webcams
+        self.index = index
+        self.fps = fps
+        self.quality = quality
+        self.metrics = metrics
+
+        self.frame = None
+        self.seq = 0
+        self.clients = 0
+        self.stopped = False
+        self.condition = Condition()
+
+        self.thread = Thread(target=self.loop, daemon=True)
+        self.thread.start()
+
+    def webcam(self):
+        webcams = self.webcams()
+        return webcams[self.index] if self.index < len(webcams) else None
+
+    def loop(self):
+        # opencv is only loaded once a spectator watches
+        encode_jpeg = None
+        count = None
+
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.clients > 0 or self.stopped)
+                if self.stopped:
+                    return
+            start = monotonic()
+
+            webcam = self.webcam()
+            buffer = webcam.buffer if webcam is not None else None
+            frames = []
+            if buffer is not None and buffer.count not in (0, count):
+                # copy of the latest frame, not overwritten while encoded
+                frames, _, count = buffer.since(buffer.count - 1)
+            if len(frames) > 0:
+                frame = frames[-1]
+                if not isinstance(frame, bytes):
+                    # the passthrough frames are already JPEG
+                    if encode_jpeg is None:
+                        from core.utils.codecs import encode_jpeg
+                    frame = encode_jpeg(frame, self.quality)
+                    self.metrics.observe('encode', monotonic() - start)
+                self.metrics.tick('frames')
+
+                with self.condition:
+                    self.frame = frame
+                    self.seq += 1
+                    self.condition.notify_all()
+
+            sleep(max(1 / self.fps - (monotonic() - start), 0))
+
+    def next(self, seq, timeout=1):
+        """
+        Waits for a frame newer than seq, returns the latest one and its
+        sequence number (None if there was none within the timeout)
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.seq != seq or self.stopped, timeout)
+            if self.seq == seq:
+                return seq, None
+            return self.seq, self.frame
+
+    def join(self):
+        with self.condition:
+            self.clients += 1
+            self.condition.notify_all()
+
+    def leave(self):
+        with self.condition:
+            self.clients -= 1
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        self.thread.join()
+
+
+class StreamHandler(BaseHTTPRequestHandler):
+    """
+    Spectator interface, for the screens around the table:
+
+        GET  /                       page with the live cameras, the score
+                                     and the replays
+        GET  /cam/1                  MJPEG stream of the first camera
+        GET  /score                  score and goals of the game
+        GET  /replays                replays of the current game
+        GET  /replays/goal_1/cam1.avi
+                                     video of a replay
+    """
+    # a client that does not read for that long is dropped
+    timeout = 10
+
+    def do_GET(self):
+        stream_server = self.server.stream_server
+        path = urlparse(self.path).path.strip('/')
+        parts = path.split('/')
+
+        if path == '':
+            images = ''.join('<img src="/cam/%d">' % (i + 1)
+                             for i in range(len(stream_server.webcams())))
+            self.reply(200, (INDEX % images).encode(), 'text/html; charset=utf-8')
+        elif path == 'score':
+            self.reply_json(200, stream_server.score())
+        elif path == 'replays':
+            self.reply_json(200, stream_server.replays())
+        elif len(parts) == 2 and parts[0] == 'cam' and parts[1].isdigit():
+            broadcast = stream_server.broadcast(int(parts[1]) - 1)
+            if broadcast is None:
+                self.reply_json(404, {'error': 'no camera %s' % parts[1]})
+            else:
+                self.stream(broadcast)
+        elif len(parts) == 3 and parts[0] == 'replays':
+            self.send_replay(parts[1], parts[2])
+        else:
+            self.reply_json(404, {'error': 'unknown resource %s' % path})
+
+    def stream(self, broadcast):
+        """
+        Sends the frames of a camera until the client leaves
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=%s' % BOUNDARY.decode())
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+
+        broadcast.join()
+        seq = 0
+        try:
+            while not broadcast.stopped:
+                seq, frame = broadcast.next(seq)
+                if frame is None:
+                    continue
+                self.wfile.write(b'--%s\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n'
+                                 % (BOUNDARY, len(frame)) + frame + b'\r\n')
+        except OSError:
+            # client gone, or too slow
+            pass
+        finally:
+            broadcast.leave()
+
+    def send_replay(self, folder, name):
+        if not (SAFE_NAME.match(folder) and SAFE_NAME.match(name)):
+            self.reply_json(404, {'error': 'unknown replay'})
+            return
+        filename = os.path.join(constants.GOAL_VIDEOS_PATH, folder, name)
+        try:
+            content = open(filename, 'rb')
+        except OSError:
+            self.reply_json(404, {'error': 'unknown replay %s/%s' % (folder, name)})
+            return
+
+        with content:
+            self.send_response(200)
+            self.send_header('Content-Type', mimetypes.guess_type(name)[0] or 'application/octet-stream')
+            self.send_header('Content-Length', str(os.fstat(content.fileno()).st_size))
+            self.end_headers()
+            try:
+                shutil.copyfileobj(content, self.wfile)
+            except OSError:
+                pass
+
+    def reply_json(self, code, content):
+        self.reply(code, json.dumps(content).encode(), 'application/json')
+
+    def reply(self, code, body, content_type):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StreamServer:
+    """
+    HTTP server for the spectators: re-broadcasts the frames the webcams
+    already captured as MJPEG streams (the phones only serve the capture),
+    and serves the replays of the current game and the score.
+    """
+    def __init__(self, webcams, game, port=STREAM_PORT, fps=15, quality=80, host='0.0.0.0'):
+        # function returning the connected webcams
+        self.webcams = webcams
+        self.game = game
+        self.fps = fps
+        self.quality = quality
+
+        self.broadcasts = {}
+        # the requests are served on their own threads
+        self.broadcasts_lock = Lock()
+        self.metrics = Metrics('stream')
+        self.metrics.gauge('clients', lambda: sum(b.clients for b in list(self.broadcasts.values())))
+
+        self.server = ThreadingHTTPServer((host, port), StreamHandler)
+        self.server.daemon_threads = True
+        self.server.stream_server = self
+        self.thread = None
+
+    def start(self):
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        print('Spectator streams on http://%s:%d' % self.server.server_address[:2])
+
+    def configure(self, fps):
+        self.fps = fps
+        for broadcast in list(self.broadcasts.values()):
+            broadcast.fps = fps
+
+    def broadcast(self, index):
+        """
+        Returns the broadcast of the camera index, None if not connected
+        """
+        if not 0 <= index < len(self.webcams()):
+            return None
+        with self.broadcasts_lock:
+            if index not in self.broadcasts:
+                self.broadcasts[index] = FrameBroadcast(self.webcams, index, self.fps,
+                                                        self.quality, self.metrics)
+            return self.broadcasts[index]
+
+    def score(self):
+        return {'blue': self.game.player_blue.score,
+                'red': self.game.player_red.score,
+                'goals': [goal.to_dict() for goal in self.game.goals]}
+
+    def replays(self):
+        """
+        Returns the replays of the current game, oldest first,
+        with the URLs of their videos
+        """
+        replays = []
+        root = constants.GOAL_VIDEOS_PATH
+        try:
+            folders = sorted(os.scandir(root), key=lambda entry: entry.stat().st_mtime)
+        except OSError:
+            return replays
+        for folder in folders:
+            if not folder.is_dir():
+                continue
+            files = sorted(name for name in os.listdir(folder.path) if SAFE_NAME.match(name)
+                           and name.rsplit('.', 1)[-1] in constants.REPLAY_CONTAINERS)
+            if files:
+                replays.append({'name': folder.name,
+                                'files': ['/replays/%s/%s' % (folder.name, name) for name in files]})
+        return replays
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        for broadcast in list(self.broadcasts.values()):
+            broadcast.stop()
+
+
+def create_stream_server(settings, webcams, game):
+    """
+    Creates and starts the spectator server on the port of the settings,
+    or returns None if it is disabled (port 0) or the port is taken
+    """
+    port = int(settings('stream_port', 0))
+    if port <= 0:
+        return None
+    try:
+        stream_server = StreamServer(webcams, game, port, float(settings('stream_fps', 15)))
+    except OSError as e:
+        print('Could not start the spectator streams on port %d: %s' % (port, e))
+        return None
+    stream_server.start()
+    return stream_server
+
+
+def configure_stream_server(stream_server, settings, webcams, game, changed):
+    """
+    Applies the changed settings to the spectator server. Returns the
+    server to use, a new one (or None) if the port changed.
+    """
+    if 'stream_port' in changed:
+        if stream_server is not None:
+            stream_server.stop()
+        return create_stream_server(settings, webcams, game)
+
+    if stream_server is not None and 'stream_fps' in changed:
+        stream_server.configure(float(settings('stream_fps', 15)))
+    return stream_server
@@ -0,0 +1,17 @@
+def synchronize(clips):
+    """
+    Cuts the clips of several cameras to the time window they all cover,
+    so that they start and end at the same instant. Empty clips are
+    returned as is.
+    """
+    recorded = [clip for clip in clips if len(clip) > 0]
+    if len(recorded) < 2:
+        return clips
+
+    start = max(clip.start() for clip in recorded)
+    end = min(clip.end() for clip in recorded)
+    if start >= end:
+        # the clips do not overlap, better keep them whole
+        return clips
+
+    return [clip.cut(start, end) if len(clip) > 0 else clip for clip in clips]
@@ -1,3 +1,9 @@
+import os
+from datetime import datetime
+
+from core.utils import constants
+
+
 def queue_to_list(q):
     """
     Dumps the content of a queue into a python list.
@@ -55,3 +61,80 @@ class Queue:
         Returns the current queue
         """
         return self.queue
+
+
+def create_replay_folder():
+    """
+    Creates the folder of the goal videos of a new game, named after the
+    current time, and stores its path in the constants.
+    """
+    dir_path = constants.GOAL_VIDEOS_ROOT
+    if not os.path.exists(dir_path):
+        os.mkdir(dir_path)
+
+    goal_videos_path = os.path.join(dir_path, datetime.now().strftime("%d.%m.%Y_%Hh%Mm%S"))
+    try:
+        os.mkdir(goal_videos_path)
+    except FileExistsError:
+        pass    # just override old file
+
+    constants.GOAL_VIDEOS_PATH = goal_videos_path
+    return goal_videos_path
+
+
+def parse_region(raw):
+    """
+    Parses a goal region 'camera, x, y, w, h': the camera number (from 1)
+    and the rectangle relative to the frame size (from 0 to 1).
+    Raises a ValueError if it is not valid.
+    """
+    values = [float(value) for value in raw.split(',')]
+    if len(values) != 5:
+        raise ValueError('a region is "camera, x, y, w, h"')
+
+    (camera, x, y, w, h) = values
+    if camera < 1 or not (0 <= x < 1 and 0 <= y < 1 and 0 < w and 0 < h):
+        raise ValueError('invalid region %s' % raw)
+    return int(camera), (x, y, min(w, 1 - x), min(h, 1 - y))
+
+
+def parse_resolution(raw):
+    """
+    Parses a resolution 'WIDTHxHEIGHT', 'native' gives None.
+    Raises a ValueError if it is not valid.
+    """
+    if raw.strip().lower() == 'native':
+        return None
+    (w, h) = (int(value) for value in raw.lower().split('x'))
+    if w <= 0 or h <= 0:
+        raise ValueError('invalid resolution %s' % raw)
+    return w, h
+
+
+def parse_fps(raw):
+    """
+    Parses a frame rate, 'native' gives None.
+    Raises a ValueError if it is not valid.
+    """
+    if str(raw).strip().lower() == 'native':
+        return None
+    fps = float(raw)
+    if not fps > 0:
+        raise ValueError('invalid frame rate %s' % raw)
+    return fps
+
+
+def parse_per_camera(raw, parse):
+    """
+    Parses a setting given for all the cameras or per camera, separated
+    by commas ('640x480, native'): returns the list of the parsed values,
+    the last one applies to the following cameras.
+    """
+    return [parse(value.strip()) for value in str(raw).split(',')]
+
+
+def camera_value(values, index):
+    """
+    Returns the value of the camera index in a list of parse_per_camera()
+    """
+    return values[min(index, len(values) - 1)]
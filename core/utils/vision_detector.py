@@ -0,0 +1,229 @@
+from threading import Thread
+from time import monotonic, sleep
+
+import cv2
+import numpy as np
+
+from core.utils.metrics import Metrics
+
+# longest side of the downscaled crops (pixels)
+CROP_SIZE = 32
+
+# BGR to grayscale
+GRAY_WEIGHTS = np.array([0.114, 0.587, 0.299], dtype=np.float32)
+
+
+class GoalRegion:
+    """
+    Region of a goal in the frames of a webcam, given relative to the
+    frame size as (x, y, w, h).
+
+    Every frame is cropped to the region, downscaled by taking one pixel
+    out of step and converted to grayscale, then compared to a running
+    average of the previous crops. The region is occupied while enough
+    of its pixels differ from this background, a goal is the transition
+    from empty to occupied.
+    """
+    def __init__(self, color, roi, threshold=25, min_area=0.05, alpha=0.05, min_frames=2):
+        self.color = color
+        self.roi = roi
+        self.threshold = threshold
+        self.min_area = min_area
+        self.alpha = alpha
+        self.min_frames = min_frames
+
+        self.background = None
+        self.occupied = False
+        # number of consecutive frames with enough changed pixels
+        self.changed_frames = 0
+
+    def crop(self, frame):
+        """
+        Returns the downscaled grayscale crop of the region as float32,
+        frame is a BGR or a grayscale array.
+        """
+        (h, w) = frame.shape[:2]
+        (x, y, rw, rh) = self.roi
+        (x0, y0) = (int(x * w), int(y * h))
+        (x1, y1) = (max(int((x + rw) * w), x0 + 1), max(int((y + rh) * h), y0 + 1))
+        step = max(max(x1 - x0, y1 - y0) // CROP_SIZE, 1)
+
+        crop = frame[y0:y1:step, x0:x1:step]
+        if crop.ndim == 3:
+            return crop @ GRAY_WEIGHTS
+        return crop.astype(np.float32)
+
+    def changed(self, frame):
+        """
+        Returns the fraction of the region that differs from the
+        background, which is then updated with the frame.
+        """
+        gray = self.crop(frame)
+        if self.background is None or self.background.shape != gray.shape:
+            self.background = gray
+            return 0
+
+        difference = gray - self.background
+        fraction = np.count_nonzero(np.abs(difference) > self.threshold) / difference.size
+        # the background slowly follows the scene (lighting, ball resting in the goal)
+        self.background += self.alpha * difference
+        return fraction
+
+    def process(self, frame):
+        """
+        Processes a frame, returns True when the ball enters the region
+        """
+        fraction = self.changed(frame)
+
+        if fraction > self.min_area:
+            self.changed_frames += 1
+        else:
+            self.changed_frames = 0
+
+        if not self.occupied and self.changed_frames >= self.min_frames:
+            self.occupied = True
+            return True
+        # hysteresis, so the region is not emptied by a noisy frame
+        if self.occupied and fraction < self.min_area / 2:
+            self.occupied = False
+        return False
+
+
+class Vision_Goal_Detector:
+    """
+    Goal detector watching goal regions in the frames buffered by the
+    webcams, for the tables without the arduino.
+
+    It has the same interface as IR_Goal_Detector: the callback receives
+    'b' or 'r' and the capture time of the frame where the ball entered
+    the goal. A single thread processes the new frames of every camera,
+    reading them in the buffers without copy, so the capture is never
+    slowed down.
+    """
+    def __init__(self, webcams, regions, threshold=25, min_area=0.05, debounce=1, poll_interval=0.01):
+        # function returning the connected webcams
+        self.webcams = webcams
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.regions = []
+        self.configure(regions, threshold, min_area, debounce)
+
+        self.callback = None
+        self.listening_thread = None
+        self.listening = False
+        self.paused = False
+
+        self.metrics = Metrics('vision')
+        self.metrics.gauge('connected', lambda: self.connected)
+
+    @property
+    def connected(self):
+        """
+        True when the webcam of every region is connected
+        """
+        nb_webcams = len(self.webcams())
+        return len(self.regions) > 0 and all(camera <= nb_webcams for camera, _ in self.regions)
+
+    def configure(self, regions, threshold=25, min_area=0.05, debounce=1):
+        """
+        Sets the regions, a list of (color, camera number, roi),
+        the background models are reset.
+        """
+        self.debounce = debounce
+        # (camera number, region), with their buffer and next sequence number
+        self.regions = [(camera, GoalRegion(color, roi, threshold, min_area))
+                        for color, camera, roi in regions]
+        self.cursors = {}
+
+    def start(self, callback):
+        """
+        Starts to detect goals and executes the function given
+        in the call back, like IR_Goal_Detector.start().
+        """
+        self.callback = callback
+        self.paused = False
+
+        if not self.listening:
+            self.listening = True
+            self.listening_thread = Thread(target=self.thread, daemon=True)
+            self.listening_thread.start()
+
+    def thread(self):
+        """
+        Thread processing the new frames of the webcams
+        """
+        last_goal = None
+
+        while self.listening:
+            sleep(self.poll_interval)
+
+            webcams = self.webcams()
+            for camera, region in list(self.regions):
+                if camera > len(webcams):
+                    continue
+
+                for frame, timestamp in self.new_frames(webcams[camera - 1], region):
+                    start = monotonic()
+                    goal = region.process(frame)
+                    self.metrics.observe('process', monotonic() - start)
+                    self.metrics.tick('frames')
+
+                    if not goal or self.paused:
+                        continue
+                    if last_goal is not None and timestamp - last_goal < self.debounce:
+                        continue
+
+                    last_goal = timestamp
+                    self.metrics.increment('goals')
+                    self.callback(region.color, timestamp)
+
+    def new_frames(self, webcam, region):
+        """
+        Yields the frames of the webcam buffered since the last call for
+        the region, as grayscale arrays for the JPEG frames.
+        """
+        buffer = webcam.buffer
+        (previous, seq) = self.cursors.get(id(region), (None, 0))
+        if buffer is not previous:
+            # new buffer, starts with its last frame
+            seq = max(buffer.count - 1, 0)
+
+        # copied, the capture overwrites the slots while they are processed
+        (frames, timestamps, count) = buffer.since(seq)
+        self.cursors[id(region)] = (buffer, count)
+        for frame, timestamp in zip(frames, timestamps):
+            if isinstance(frame, bytes):
+                # the JPEG decoder downscales by 4 for cheap
+                frame = cv2.imdecode(np.frombuffer(frame, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+            yield frame, timestamp
+
+    def status(self):
+        """
+        Returns a short summary of the metrics for the status strip
+        """
+        return 'vision: %s, %.0f fps, %.2f ms/frame, %d goals' % (
+            'on' if self.connected else 'off',
+            self.metrics.rate('frames'),
+            self.metrics.latency('process'),
+            self.metrics.counters.get('goals', 0))
+
+    def pause(self):
+        """
+        Ignores the goals until resume() is called, the regions keep
+        following the scene.
+        """
+        self.paused = True
+
+    def resume(self):
+        """
+        Resumes the goal detection after pause().
+        """
+        self.paused = False
+
+    def stop(self):
+        """
+        Stops the goal detection system.
+        """
+        if self.listening:
+            self.listening = False
+            self.listening_thread.join()
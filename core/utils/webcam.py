@@ -1,54 +1,158 @@
-from threading import Thread
-from time import sleep
-from types import NoneType
+from threading import Lock, Thread
+from time import monotonic, sleep
 
 import cv2
 import numpy as np
 
-from core.utils.utils import Queue
+from core.utils import constants
+from core.utils.ball_tracker import BallTracker
+from core.utils.clip import Clip, decode_jpeg
+from core.utils.metrics import Metrics
+from core.utils.mjpeg import MJPEGStream
+from core.utils.ring_buffer import FrameRingBuffer, RingBuffer
+from core.utils.segment_recorder import SegmentRecorder
 
 
 class Webcam:
     """
-    Webcam class for a droidcam using opencv
+    Webcam class for a droidcam using opencv.
+
+    With the 'decode' ingest mode, frames are decoded by opencv and
+    buffered as BGR arrays. With the 'passthrough' mode, the MJPEG stream
+    is read directly and the compressed JPEG frames are buffered as is,
+    they are only decoded for the live preview.
+
+    The live preview is downscaled and encoded by the capture thread at
+    most preview_fps times per second, the GUI only has to display the
+    cached bytes when preview_seq changes.
+
+    Every buffered frame is stamped with its monotonic capture time and
+    the duplicate frames droidcam sends while the stream stalls are
+    dropped, so the saved clips play at their measured frame rate.
+
+    The stored frames can be limited to stored_size (width, height) and
+    stored_fps frames per second, applied once as they are buffered so
+    that the buffer memory and the encoding time do not depend on the
+    camera. None keeps the native resolution or frame rate. The JPEG
+    frames of the passthrough mode are stored as received, only their
+    rate is limited.
+
+    Opening and reading the stream give up after timeout seconds, a
+    stream without a frame for that long is stalled() and can be
+    reconnected without losing the buffered frames.
     """
 
-    def __init__(self, ip, buffer_duration):
+    def __init__(self, ip, buffer_duration, ingest='decode',
+                 preview_size=constants.CAM_RESOLUTION_BIG, preview_fps=15,
+                 stored_size=None, stored_fps=None, timeout=5):
         self.ip = ip
+        self.ingest = ingest
         self.stream_url = 'http://' + self.ip + ':4747/video'
 
         self.fps = None
+        self.timeout = timeout
+        # monotonic time of the last frame read from the stream
+        self.last_read = 0
 
         self.is_buffering = False
-        self.buffer = Queue()
+        self.buffer = FrameRingBuffer(1)
         self.buffer_duration = buffer_duration
+        # held to store a frame, so that no frame goes to a replaced buffer
+        self.buffer_lock = Lock()
+        self.recorder = None
+        self.tracker = None
+
+        self.stored_size = stored_size
+        self.stored_fps = stored_fps
+        # capture time from which the next frame is stored
+        self.next_store = 0
+
+        self.metrics = Metrics(ip)
+        self.metrics.gauge('nominal_fps', lambda: self.fps or 0)
+        self.metrics.gauge('buffer_frames', lambda: len(self.buffer))
+        self.metrics.gauge('buffer_fill', lambda: len(self.buffer) / self.buffer.capacity)
+        self.metrics.gauge('buffer_mb', lambda: self.buffer.nbytes() / 1e6)
+        self.metrics.gauge('stalled', lambda: self.stalled())
+
+        self.preview_size = preview_size
+        self.preview_fps = preview_fps
+        self.preview_time = 0
+        self.preview_seq = 0
+        # gray image until the first frame arrives
+        (w, h) = preview_size
+        self.preview = self.encode_preview(np.full((h, w, 3), 200, dtype=np.uint8))
 
         self.cam_thread = None
 
+    def open(self):
+        """
+        Opens the stream of the webcam, within the timeout.
+        Raises an Exception if it can not be opened.
+        """
+        if self.ingest == 'passthrough':
+            self.cap = MJPEGStream(self.stream_url, self.timeout)
+            try:
+                self.cap.open()
+            except OSError:
+                pass
+        else:
+            timeout = int(self.timeout * 1000)
+            self.cap = cv2.VideoCapture(self.stream_url, cv2.CAP_FFMPEG,
+                                        [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, timeout,
+                                         cv2.CAP_PROP_READ_TIMEOUT_MSEC, timeout])
+
+        if not self.cap.isOpened():
+            raise Exception('Could not connect %s' % self.ip)
+
+        # the mjpeg stream does not announce its frame rate,
+        # it is measured from the frame timestamps when saving
+        self.fps = self.cap.get(5) if self.ingest == 'decode' else 0
+        if not self.fps > 0:
+            # some streams do not report their frame rate
+            self.fps = constants.DEFAULT_FPS
+        self.last_read = monotonic()
+
     def connect(self):
         """
         Connect to a distant webcam using IP address and droidcam.
         """
         print('Connecting to %s ...' % self.ip)
-        self.cap = cv2.VideoCapture(self.stream_url)
+        self.open()
+        print('Succefully connected to %s!' % self.ip)
 
-        if self.cap.isOpened():
-            print('Succefully connected to %s!' % self.ip)
-            self.fps = self.cap.get(5)
+        self.buffer = self.create_buffer(self.buffer_duration)
+        self.start_thread()
 
-            # begin thread
-            self.cam_thread = Thread(target=self.start_buffering,
-                                     args=(self.cap, self.buffer_duration),
-                                     daemon=True)
-            self.cam_thread.start()
+    def start_thread(self):
+        self.is_buffering = True
+        self.cam_thread = Thread(target=self.start_buffering, args=(self.cap,), daemon=True)
+        self.cam_thread.start()
 
-        else:
-            raise Exception('Could not connect %s' % self.ip)
+    def reconnect(self):
+        """
+        Reopens the stream of a stalled webcam, the buffered frames
+        are kept. Raises an Exception if it can not be reopened.
+        """
+        self.stop_buffering()
+        self.cap.release()
+        self.open()
+        self.start_thread()
+
+    def stalled(self):
+        """
+        Returns True if the stream ended or no frame was read for
+        longer than the timeout
+        """
+        return not self.is_buffering or monotonic() - self.last_read > self.timeout
 
     def disconnect(self):
         """
         Disconnects the webcam
         """
+        if self.recorder is not None:
+            self.recorder.stop()
+            self.recorder = None
+        self.stop_tracking()
         self.stop_buffering()
         self.cap.release()
 
@@ -56,22 +160,145 @@ class Webcam:
 
         print('%s disconnected' % self.ip)
 
-    def start_buffering(self, cap, duration):
+    def start_buffering(self, cap):
         """
-        Starts to buffer images from the camera
-        for a certain duration (in seconds).
+        Starts to buffer images from the camera,
+        until stop_buffering() is called.
         """
-        if not self.is_buffering:
-            self.is_buffering = True
+        if self.ingest == 'passthrough':
+            self.buffer_jpeg(cap)
+            return
 
-            nb_frames = self.fps * duration
+        # the decoded frame is copied into the buffer so the same
+        # array can be reused for every read
+        frame = None
+        signature = None
+        while self.is_buffering:
+            start = monotonic()
+            ret, frame = cap.read(frame)
+            timestamp = monotonic()
+            self.metrics.observe('read', timestamp - start)
 
-            self.buffer = Queue(nb_frames)
+            if ret:
+                # a sparse sample of the pixels is enough to spot
+                # the exact copies of a stalled stream
+                previous, signature = signature, frame[::16, ::16].tobytes()
+                if signature == previous:
+                    self.metrics.increment('duplicates')
+                    continue
+                self.last_read = timestamp
 
-            while self.is_buffering:
-                ret, frame = cap.read()
-                if ret:
-                    self.buffer.put(frame)
+                if self.keep(timestamp):
+                    self.buffer_frame(frame, timestamp)
+                self.update_preview(frame)
+            else:
+                self.metrics.increment('read_errors')
+                # a dead stream fails at once, the supervisor reconnects it
+                sleep(0.01)
+
+    def buffer_jpeg(self, cap):
+        """
+        Buffers the compressed frames of a MJPEG stream.
+        """
+        previous = None
+        while self.is_buffering:
+            start = monotonic()
+            try:
+                data, timestamp = cap.read()
+            except OSError:
+                data = None
+
+            if data is None:
+                self.metrics.increment('read_errors')
+                break
+            self.metrics.observe('read', timestamp - start)
+
+            if data == previous:
+                self.metrics.increment('duplicates')
+                continue
+            previous = data
+            self.last_read = timestamp
+
+            if self.keep(timestamp):
+                self.buffer_frame(data, timestamp)
+            self.update_preview(data)
+
+        self.is_buffering = False
+
+    def buffer_frame(self, frame, timestamp):
+        with self.buffer_lock:
+            self.buffer.put(frame, timestamp)
+        self.metrics.tick('frames', timestamp=timestamp)
+
+    def keep(self, timestamp):
+        """
+        Returns True if the frame captured at timestamp is stored,
+        at most stored_fps frames per second are
+        """
+        if not self.stored_fps:
+            return True
+        if timestamp < self.next_store:
+            self.metrics.increment('decimated')
+            return False
+
+        # keeps the pace of the stored frames, without a burst after a stall
+        period = 1 / self.stored_fps
+        self.next_store = max(self.next_store + period, timestamp - period / 2)
+        return True
+
+    def stored_rate(self, fps):
+        """
+        Returns the frame rate stored of a stream at fps
+        """
+        return min(fps, self.stored_fps) if self.stored_fps else fps
+
+    def create_buffer(self, duration):
+        """
+        Creates a buffer holding duration seconds of frames
+        """
+        if self.ingest == 'passthrough':
+            # the slots only hold references so the buffer is sized for the
+            # highest frame rate, the saved clips are cut by duration
+            return RingBuffer(self.stored_rate(constants.MAX_FPS) * duration)
+        return FrameRingBuffer(int(self.stored_rate(self.fps) * duration), self.stored_size)
+
+    def resize_buffer(self, duration):
+        """
+        Changes the buffered duration while buffering,
+        the most recent frames are kept.
+        """
+        self.buffer_duration = duration
+        buffer = self.create_buffer(duration)
+
+        # the frames are copied while the capture goes on, it only waits
+        # for the frames buffered meanwhile to be copied
+        frames, timestamps, seq = self.buffer.since(0)
+        self.refill(buffer, frames, timestamps)
+        with self.buffer_lock:
+            frames, timestamps, _ = self.buffer.since(seq)
+            self.refill(buffer, frames, timestamps)
+            self.buffer = buffer
+
+    def refill(self, buffer, frames, timestamps):
+        """
+        Puts the most recent frames that fit in a new buffer
+        """
+        first = max(len(frames) - buffer.capacity, 0)
+        for frame, timestamp in zip(frames[first:], timestamps[first:]):
+            buffer.put(frame, timestamp)
+
+    def configure_storage(self, stored_size, stored_fps):
+        """
+        Changes the stored resolution and frame rate while buffering,
+        the buffered frames are kept (scaled down if needed).
+        """
+        if (stored_size, stored_fps) == (self.stored_size, self.stored_fps):
+            return
+        self.stored_size = stored_size
+        self.stored_fps = stored_fps
+        self.next_store = 0
+        if self.is_buffering:
+            self.resize_buffer(self.buffer_duration)
 
     def stop_buffering(self):
         """
@@ -81,32 +308,121 @@ class Webcam:
             self.is_buffering = False
             self.cam_thread.join()
 
-    def save_buffer(self, filename, codec='MJPG'):
+    def record_segments(self, segment_duration, keep_duration):
+        """
+        Continuously records the buffered frames into rolling segments on
+        disk, the replays are then taken from the segments.
+        """
+        self.recorder = SegmentRecorder(self, segment_duration, keep_duration)
+        self.recorder.start()
+
+    def track_ball(self, color_range, field_width, keep_duration):
+        """
+        Follows the ball in the buffered frames to measure its speed
+        """
+        self.stop_tracking()
+        self.tracker = BallTracker(self, color_range, field_width, keep_duration)
+        self.tracker.start()
+
+    def stop_tracking(self):
+        if self.tracker is not None:
+            self.tracker.stop()
+            self.tracker = None
+
+    def peak_speed(self, start=None, end=None):
         """
-        Saves the buffer to the filename provided (only tested for .avi files)
+        Returns the highest ball speed (km/h) between start and end,
+        or None if the ball is not tracked
         """
-        fourcc = cv2.VideoWriter_fourcc(*codec)
-        frames = self.buffer.dump()
+        if self.tracker is not None:
+            return self.tracker.peak_speed(start, end)
 
-        (w, h) = (len(frames[0][0]), len(frames[0]))
-        writer = cv2.VideoWriter(filename,
-                                 fourcc,
-                                 self.fps,
-                                 (w, h),
-                                 True)
+    def snapshot(self, start=None, end=None):
+        """
+        Returns a consistent copy of the buffer as a Clip, which is not
+        affected by the frames buffered afterwards. The clip frame rate
+        is the one measured from the timestamps, not the nominal one.
+        The clip can be limited to the frames captured between start and
+        end (monotonic timestamps).
+        """
+        if self.recorder is not None:
+            return self.recorder.clip(start, end)
 
-        for frame in frames:
-            writer.write(frame)
-        writer.release()
+        if self.ingest == 'passthrough':
+            # only keep the buffer duration
+            last = self.buffer.last_timestamp()
+            if last is not None:
+                start = max(-np.inf if start is None else start, last - self.buffer_duration)
+
+        # only the frames of the window are copied
+        frames, timestamps = self.buffer.snapshot(start, end)
+        return Clip(frames, timestamps, jpeg=self.ingest == 'passthrough')
+
+    def save_buffer(self, filename, codec='MJPG', quality=constants.JPEG_QUALITY, resolution=None):
+        """
+        Saves the buffer to the filename provided, see Clip.save()
+        """
+        self.snapshot().save(filename, codec, quality, resolution)
+
+    def update_preview(self, frame):
+        """
+        Updates the preview with a new frame (BGR array or JPEG bytes)
+        unless the preview frame rate is exceeded.
+        """
+        now = monotonic()
+        if now - self.preview_time < 1 / self.preview_fps:
+            return
+        self.preview_time = now
+
+        (pw, ph) = self.preview_size
+        if self.ingest == 'passthrough':
+            # let the JPEG decoder downscale by 2, 4 or 8 when possible
+            frame = decode_jpeg(frame, self.preview_size)
+
+        # fit the frame in the preview size
+        (h, w) = frame.shape[:2]
+        scale = min(pw / w, ph / h)
+        if scale < 1:
+            frame = cv2.resize(frame, (int(w * scale), int(h * scale)),
+                               interpolation=cv2.INTER_AREA)
+
+        self.preview = self.encode_preview(frame)
+        self.preview_seq += 1
+        self.metrics.observe('preview', monotonic() - now)
+
+    def encode_preview(self, frame):
+        """
+        Encodes a frame with the fast preview format
+        """
+        return cv2.imencode(constants.PREVIEW_FORMAT, frame)[1].tobytes()
+
+    def status(self):
+        """
+        Returns a short summary of the metrics for the status strip
+        """
+        metrics = self.metrics
+        return '%s: %.1f/%.0f fps, %d dup, read %.0f ms, buf %.0f%% %.0f MB%s' % (
+            self.ip,
+            metrics.rate('frames'),
+            self.fps or 0,
+            metrics.counters.get('duplicates', 0),
+            metrics.latency('read'),
+            100 * len(self.buffer) / self.buffer.capacity,
+            self.buffer.nbytes() / 1e6,
+            self.connection_status())
+
+    def connection_status(self):
+        """
+        Returns the stall and reconnections part of the status
+        """
+        status = ', stalled' if self.stalled() else ''
+        reconnects = self.metrics.counters.get('reconnects', 0)
+        if reconnects:
+            status += ', %d reconnects' % reconnects
+        return status
 
     def current_frame(self):
         """
         Returns the current frame to display the live video stream.
         """
-        frame = self.buffer.last()
-        if type(frame) == NoneType:
-            # 200 is for gray
-            frame = np.full((480, 640), 200)
-
-        imgbytes = cv2.imencode('.png', frame)[1].tobytes()
-        return imgbytes
+        return self.preview
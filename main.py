@@ -1,28 +1,57 @@
 import getopt
 import sys
+from time import monotonic
 
-from core.gui import Gui
+# the startup time is measured from here
+START_TIME = monotonic()
+
+USAGE = ('Usage: main.py -c <number_of_camera [1-3]>\n'
+         '       main.py --headless [-i <ip1,ip2>] [-p <control_port>]')
 
 
 def main(argv):
     nb_camera = 1
+    headless = False
+    ips = None
+    control_port = None
 
     try:
-        opts, args = getopt.getopt(argv, "hc:", "nb_cam=")
+        opts, args = getopt.getopt(argv, "hc:i:p:", ["nb_cam=", "headless", "ips=", "port="])
     except getopt.GetoptError:
-        print('Usage: main.py -c <number_of_camera [1-3]>')
+        print(USAGE)
         sys.exit(2)
 
     for opt, arg in opts:
         if opt == '-h':
-            print('Usage: main.py -c <number_of_camera [1-3]>')
+            print(USAGE)
             sys.exit()
 
         elif opt in ("-c", "--nb_cam"):
             nb_camera = int(arg)
 
-    gui = Gui(nb_camera)
-    gui.run()
+        elif opt == "--headless":
+            headless = True
+
+        elif opt in ("-i", "--ips"):
+            ips = arg
+
+        elif opt in ("-p", "--port"):
+            control_port = int(arg)
+
+    # the modules of the other mode are never loaded
+    if headless:
+        from core.headless import CONTROL_PORT, Headless
+        from core.utils.utils import parse_IPs
+
+        if control_port is None:
+            control_port = CONTROL_PORT
+        headless = Headless(parse_IPs(ips) if ips else None, control_port, START_TIME)
+        headless.run()
+    else:
+        from core.gui import Gui
+
+        gui = Gui(nb_camera)
+        gui.run()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,125 @@
+import json
+import os
+from threading import Event
+
+import pytest
+
+from core.utils import constants
+from core.utils.config import Config
+
+
+def write(filename, **changes):
+    """
+    Saves the settings file with the changes, as the settings dialog does
+    """
+    with open(filename, 'r') as content:
+        settings = json.load(content)
+    settings.update(changes)
+    with open(filename, 'w') as content:
+        json.dump(settings, content)
+    # the file may be written twice within the resolution of the clock
+    stat = os.stat(filename)
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+@pytest.fixture
+def filename(tmp_path):
+    return str(tmp_path / 'settings.json')
+
+
+@pytest.fixture
+def config(filename):
+    return Config(filename, constants.DEFAULT_SETTINGS_PATH)
+
+
+def test_the_defaults_are_copied_and_converted(filename, config):
+    assert os.path.exists(filename)
+    with open(constants.DEFAULT_SETTINGS_PATH, 'r') as content:
+        defaults = json.load(content)
+    assert config.speed_factor == defaults['speed_factor']
+    assert isinstance(config.replay_duration, float)
+    assert config.get('unknown', 'default') == 'default'
+    with pytest.raises(AttributeError):
+        config.unknown
+
+
+def test_hot_reload(filename, config):
+    assert config.reload() == set()
+
+    # the settings dialog saves the numbers as strings
+    write(filename, speed_factor='0.25', replay_quality='75')
+    assert config.reload() == {'speed_factor', 'replay_quality'}
+    assert config.speed_factor == 0.25
+    assert config.replay_quality == 75
+
+    # saved again without changes
+    write(filename)
+    assert config.reload() == set()
+
+
+def test_an_invalid_value_keeps_the_previous_one(filename, config):
+    write(filename, speed_factor=2)
+    config.reload()
+
+    write(filename, speed_factor=-1, replay_layout='mosaic', replay_quality='high', replay_delay=3)
+    assert config.reload() == {'replay_delay'}
+    assert config.speed_factor == 2
+    assert config.replay_layout == 'separate'
+    assert config.replay_delay == 3
+
+
+def test_an_invalid_value_in_the_file_keeps_the_default(filename):
+    with open(filename, 'w') as content:
+        json.dump({'replay_duration': 0, 'pre_roll': 'a'}, content)
+    config = Config(filename, constants.DEFAULT_SETTINGS_PATH)
+    assert config.replay_duration > 0
+    assert config.pre_roll >= 0
+
+
+def test_a_file_being_written_is_read_again_later(filename, config):
+    with open(filename, 'w') as content:
+        content.write('{"speed_factor": ')
+    assert config.reload() == set()
+
+    write_time = os.stat(filename).st_mtime_ns
+    with open(filename, 'w') as content:
+        json.dump({'speed_factor': 3}, content)
+    os.utime(filename, ns=(write_time, write_time))
+    assert config.reload() == {'speed_factor'}
+
+
+def test_the_subscribers_get_the_changed_settings(filename, config):
+    calls = []
+    replay_calls = []
+    config.subscribe(calls.append)
+    config.subscribe(replay_calls.append, keys=['speed_factor', 'replay_duration'])
+
+    write(filename, pre_roll=2)
+    config.reload()
+    assert calls == [{'pre_roll'}]
+    # not called for the settings it does not use
+    assert replay_calls == []
+
+    write(filename, pre_roll=3, speed_factor=0.75)
+    config.reload()
+    # called with every changed setting
+    assert calls[-1] == {'pre_roll', 'speed_factor'}
+    assert replay_calls == [{'pre_roll', 'speed_factor'}]
+
+    # no change, no call
+    write(filename)
+    config.reload()
+    assert len(calls) == 2
+
+
+def test_watch(filename, config):
+    changed = Event()
+    config.subscribe(lambda keys: changed.set(), keys=['speed_factor'])
+    config.watch(interval=0.01)
+    try:
+        write(filename, speed_factor=4)
+        assert changed.wait(2)
+        assert config.speed_factor == 4
+    finally:
+        config.stop()
+    assert config.thread is None
@@ -0,0 +1,162 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+import cv2
+import numpy as np
+import pytest
+
+from benchmarks.fakes import MJPEGServer, synthetic_frames
+from core.utils.avi import MJPEGAviWriter
+from core.utils.mjpeg import MJPEGStream, jpeg_size
+
+RESOLUTION = (320, 240)
+
+
+def serve(parts, content_type='multipart/x-mixed-replace; boundary=frame'):
+    """
+    Serves a single response made of the given parts, returns the server
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.end_headers()
+            self.wfile.write(b''.join(parts))
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def url(server):
+    return 'http://127.0.0.1:%d/video' % server.server_address[1]
+
+
+@pytest.fixture
+def frames():
+    return synthetic_frames(RESOLUTION, nb_frames=3)
+
+
+def test_reads_the_frames_of_the_fake_droidcam():
+    server = MJPEGServer(port=0, resolution=RESOLUTION, fps=0)
+    stream = MJPEGStream('http://127.0.0.1:%d/video' % server.server.server_address[1])
+    try:
+        stream.open()
+        expected = synthetic_frames(RESOLUTION)
+        for i in range(len(expected) + 2):
+            data, timestamp = stream.read()
+            assert data == expected[i % len(expected)]
+            assert timestamp > 0
+    finally:
+        stream.release()
+        server.close()
+
+
+def test_content_length_is_used_even_if_the_frame_contains_a_boundary(frames):
+    # the boundary inside the data must not cut the frame
+    data = frames[0] + b'\r\n--frame\r\n' + frames[1]
+    server = serve([b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n' % len(data),
+                    data, b'\r\n--frame\r\nContent-Length: %d\r\n\r\n' % len(frames[2]), frames[2]])
+    stream = MJPEGStream(url(server))
+    try:
+        stream.open()
+        assert stream.read()[0] == data
+        assert stream.read()[0] == frames[2]
+        assert stream.read() == (None, None)
+    finally:
+        stream.release()
+        server.shutdown()
+        server.server_close()
+
+
+def test_frames_without_content_length_end_at_the_boundary(frames):
+    server = serve([b'preamble\r\n--frame\r\nContent-Type: image/jpeg\r\n\r\n', frames[0],
+                    b'\r\n--frame\r\n\r\n', frames[1], b'\r\n--frame--\r\n'])
+    stream = MJPEGStream(url(server))
+    try:
+        stream.open()
+        assert stream.read()[0] == frames[0]
+        assert stream.read()[0] == frames[1]
+    finally:
+        stream.release()
+        server.shutdown()
+        server.server_close()
+
+
+def test_quoted_boundary_with_dashes(frames):
+    server = serve([b'--frame\r\nContent-Length: %d\r\n\r\n' % len(frames[0]), frames[0]],
+                   'multipart/x-mixed-replace;boundary="--frame"')
+    stream = MJPEGStream(url(server))
+    try:
+        stream.open()
+        assert stream.boundary == b'frame'
+        assert stream.read()[0] == frames[0]
+    finally:
+        stream.release()
+        server.shutdown()
+        server.server_close()
+
+
+def test_not_a_multipart_stream():
+    server = serve([b'hello'], 'text/plain')
+    stream = MJPEGStream(url(server))
+    try:
+        with pytest.raises(Exception):
+            stream.open()
+        assert not stream.isOpened()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.parametrize('size', [(320, 240), (1280, 720), (17, 9)])
+def test_jpeg_size(size):
+    frame = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+    assert jpeg_size(cv2.imencode('.jpg', frame)[1].tobytes()) == size
+
+
+def test_jpeg_size_of_progressive_jpeg():
+    frame = np.zeros((48, 64, 3), dtype=np.uint8)
+    data = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_PROGRESSIVE, 1])[1].tobytes()
+    assert jpeg_size(data) == (64, 48)
+
+
+def test_jpeg_size_of_invalid_data():
+    with pytest.raises(ValueError):
+        jpeg_size(b'\xff\xd8not a jpeg')
+
+
+def test_avi_writer_round_trip(tmp_path, frames):
+    filename = str(tmp_path / 'clip.avi')
+    writer = MJPEGAviWriter(filename, 30, RESOLUTION)
+    for data in frames:
+        writer.write(data)
+    writer.release()
+
+    # the frames can be read back without parsing the file
+    with open(filename, 'rb') as avi:
+        for (position, size), data in zip(writer.positions, frames):
+            avi.seek(position)
+            assert avi.read(size) == data
+
+    cap = cv2.VideoCapture(filename)
+    try:
+        assert cap.isOpened()
+        assert cap.get(cv2.CAP_PROP_FRAME_COUNT) == len(frames)
+        assert cap.get(cv2.CAP_PROP_FPS) == pytest.approx(30)
+        decoded = [cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR).astype(int)
+                   for data in frames]
+        for i in range(len(frames)):
+            ret, frame = cap.read()
+            assert ret
+            assert (frame.shape[1], frame.shape[0]) == RESOLUTION
+            # the decoders round differently, the frame is the closest one
+            differences = [np.abs(frame - expected).mean() for expected in decoded]
+            assert np.argmin(differences) == i
+        assert not cap.read()[0]
+    finally:
+        cap.release()
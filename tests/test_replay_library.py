@@ -0,0 +1,120 @@
+import os
+from time import monotonic
+
+import pytest
+
+from core.utils.replay_library import ReplayLibrary
+
+FILE_SIZE = 400
+
+
+def save(library, game, name, goal_time, nb_cameras=2, scorer='blue'):
+    """
+    Writes fake camera files of a replay and indexes them
+    """
+    folder = os.path.join(library.root, game, name)
+    os.makedirs(folder, exist_ok=True)
+    filenames = [os.path.join(folder, 'cam%d.avi' % i) for i in range(nb_cameras)]
+    for filename in filenames:
+        with open(filename, 'wb') as video:
+            video.write(b'\0' * FILE_SIZE)
+    return library.add_replay(folder, filenames, scorer, goal_time)
+
+
+@pytest.fixture
+def library(tmp_path):
+    # room for 3 replays of 2 cameras
+    library = ReplayLibrary(str(tmp_path), quota=6 * FILE_SIZE / 1e9, eviction='age')
+    yield library
+    library.close()
+
+
+def test_add_replay(library):
+    replay_id = save(library, 'game1', 'goal_1', monotonic(), scorer='red')
+    assert library.total_size() == 2 * FILE_SIZE
+    assert [os.path.basename(path) for path in library.files(replay_id)] == ['cam0.avi', 'cam1.avi']
+
+    (replay,) = library.search()
+    assert replay['scorer'] == 'red' and replay['folder'] == 'game1'
+    # not a video, no thumbnail
+    assert library.thumbnail(replay_id) is None
+
+    # saved again, replaced
+    save(library, 'game1', 'goal_1', monotonic(), nb_cameras=1)
+    assert len(library.search()) == 1
+    assert library.total_size() == FILE_SIZE
+
+
+def test_the_oldest_replays_are_evicted_past_the_quota(library):
+    start = monotonic() - 100
+    old = [save(library, 'game1', 'goal_%d' % i, start + i) for i in range(3)]
+    paths = [library.files(replay_id) for replay_id in old]
+    library.new_game(os.path.join(library.root, 'game2'))
+    recent = [save(library, 'game2', 'goal_%d' % i, start + 10 + i) for i in range(2)]
+    assert library.total_size() == 10 * FILE_SIZE
+
+    assert library.evict() == 2
+    assert library.total_size() <= library.quota
+    remaining = [replay['id'] for replay in library.search()]
+    assert sorted(remaining) == sorted(old[2:] + recent)
+
+    # the files and folders of the evicted replays are deleted
+    for filename in paths[0] + paths[1]:
+        assert not os.path.exists(filename)
+        assert not os.path.exists(os.path.dirname(filename))
+    assert all(os.path.exists(filename) for filename in paths[2])
+
+    assert library.evict() == 0
+
+
+def test_the_current_game_is_never_evicted(library):
+    start = monotonic() - 100
+    library.new_game(os.path.join(library.root, 'game1'))
+    for i in range(5):
+        save(library, 'game1', 'goal_%d' % i, start + i)
+
+    assert library.evict() == 0
+    assert len(library.search()) == 5
+
+
+def test_least_recently_used_first(library):
+    library.configure(6 * FILE_SIZE / 1e9, 'lru')
+    start = monotonic() - 100
+    replays = [save(library, 'game1', 'goal_%d' % i, start + i) for i in range(4)]
+    library.mark_used(replays[0])
+
+    assert library.evict() == 1
+    remaining = [replay['id'] for replay in library.search()]
+    assert replays[1] not in remaining and replays[0] in remaining
+
+
+def test_no_eviction_while_saving(library):
+    start = monotonic() - 100
+    for i in range(5):
+        save(library, 'game1', 'goal_%d' % i, start + i)
+    library.saving = lambda: True
+    assert library.evict() == 0
+
+
+def test_empty_past_games_are_pruned(library):
+    start = monotonic() - 100
+    save(library, 'game1', 'goal_1', start, nb_cameras=3)
+    save(library, 'game1', 'goal_2', start + 1, nb_cameras=3)
+    library.new_game(os.path.join(library.root, 'game2'))
+    save(library, 'game2', 'goal_1', start + 2, nb_cameras=4)
+
+    assert library.evict() == 2
+    assert library.search(game_id=library.game_id)
+    assert not os.path.exists(os.path.join(library.root, 'game1'))
+    assert library.execute('SELECT folder FROM games')[0]['folder'] == 'game2'
+
+
+def test_remove_game(library):
+    start = monotonic() - 100
+    replay_id = save(library, 'game1', 'goal_1', start)
+    save(library, 'game2', 'goal_1', start + 1)
+
+    library.remove_game(os.path.join(library.root, 'game1'))
+    assert [replay['folder'] for replay in library.search()] == ['game2']
+    assert library.files(replay_id) == []
+    assert library.total_size() == 2 * FILE_SIZE
@@ -0,0 +1,155 @@
+from core.utils.replay_queue import IDLE, PLAYING, SAVING, WAITING, ReplayQueue
+
+DELAY = 1
+
+
+class FakePlayer:
+    """
+    Replay player whose replays play until ended or skipped by the test
+    """
+    def __init__(self):
+        self.started = []
+        self.dropped = []
+        self.shown = False
+        self.reason = None
+
+    def start(self, goal_number, goal_time):
+        self.started.append(goal_number)
+        self.shown = True
+        self.reason = None
+        return True
+
+    def poll(self, timeout=0):
+        return self.reason
+
+    def stop(self):
+        self.reason = 'skip'
+
+    def hide(self):
+        self.shown = False
+
+    def drop(self, goal_number):
+        self.dropped.append(goal_number)
+
+
+def create():
+    player = FakePlayer()
+    return player, ReplayQueue(player, lambda: DELAY)
+
+
+def test_idle_saving_waiting_playing():
+    player, queue = create()
+    assert queue.update(0) == IDLE
+
+    queue.add(1, 10)
+    assert queue.update(10) == SAVING
+    queue.saved(1)
+    # the delay since the goal is not over
+    assert queue.update(10.5) == WAITING
+    assert player.started == []
+
+    assert queue.update(11) == PLAYING
+    assert player.started == [1] and player.shown
+    assert queue.update(12) == PLAYING
+
+    player.reason = 'ended'
+    assert queue.update(13) == IDLE
+    assert not player.shown
+    assert len(queue) == 0
+
+
+def test_a_save_failure_returns_to_idle():
+    player, queue = create()
+    queue.add(1, 10)
+    queue.saved(1, success=False)
+    assert queue.update(20) == IDLE
+    assert player.started == []
+
+
+def test_a_replay_shown_from_memory_is_kept_if_its_files_fail():
+    player, queue = create()
+    queue.add(1, 10)
+    queue.saved(1)
+    queue.saved(1, success=False)
+    assert queue.update(20) == PLAYING
+
+
+def test_back_to_back_goals_are_shown_in_order():
+    player, queue = create()
+    queue.add(1, 10)
+    queue.add(2, 10.3)
+    queue.add(3, 10.6)
+    assert len(queue) == 3
+
+    # the replays are saved out of order
+    queue.saved(2)
+    assert queue.update(20) == SAVING
+    queue.saved(3)
+    queue.saved(1)
+
+    for goal_number in (1, 2, 3):
+        assert queue.update(20) == PLAYING
+        assert player.started[-1] == goal_number
+        player.reason = 'ended'
+    assert queue.update(20) == IDLE
+    assert player.started == [1, 2, 3]
+
+
+def test_a_goal_scored_during_a_replay_is_shown_next():
+    player, queue = create()
+    queue.add(1, 10)
+    queue.saved(1)
+    assert queue.update(11) == PLAYING
+
+    queue.add(2, 11.5)
+    queue.saved(2)
+    assert queue.update(12) == PLAYING
+    assert player.started == [1]
+
+    queue.skip()
+    assert queue.update(12.5) == PLAYING
+    assert player.started == [1, 2]
+
+
+def test_skip_all_while_saving():
+    player, queue = create()
+    queue.add(1, 10)
+    queue.saved(1)
+    assert queue.update(11) == PLAYING
+    queue.add(2, 11)
+    queue.add(3, 11.5)
+    queue.saved(2)
+
+    player.reason = 'skip_all'
+    assert queue.update(15) == IDLE
+    assert player.dropped == [2, 3]
+
+    # the replay still being saved does not come back
+    queue.saved(3)
+    assert queue.update(20) == IDLE
+    assert player.started == [1]
+
+
+def test_a_goal_saved_again_replaces_the_previous_one():
+    player, queue = create()
+    queue.add(1, 10)
+    queue.add(2, 11)
+    queue.add(1, 12)
+    queue.saved(1)
+    queue.saved(2)
+
+    assert queue.update(20) == PLAYING
+    assert player.started == [2]
+
+
+def test_clear():
+    player, queue = create()
+    queue.add(1, 10)
+    queue.saved(1)
+    queue.update(11)
+    queue.add(2, 11)
+
+    queue.clear()
+    assert queue.state == IDLE
+    assert player.dropped == [2]
+    assert not player.shown
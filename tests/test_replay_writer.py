@@ -0,0 +1,84 @@
+import os
+from threading import Event
+
+import numpy as np
+import pytest
+
+from core.utils.replay_writer import ReplayWriter
+from core.utils.webcam import Webcam
+
+FPS = 10
+
+
+def webcam(nb_frames):
+    """
+    Webcam whose buffer holds nb_frames of a second of capture
+    """
+    webcam = Webcam('127.0.0.1', 1)
+    webcam.fps = FPS
+    webcam.buffer = webcam.create_buffer(1)
+    for i in range(nb_frames):
+        webcam.buffer.put(np.full((48, 64, 3), i * 20, dtype=np.uint8), i / FPS)
+    return webcam
+
+
+@pytest.fixture
+def writer():
+    writer = ReplayWriter(max_workers=2)
+    yield writer
+    writer.shutdown()
+
+
+def test_every_clip_is_written(tmp_path, writer):
+    filenames = writer.save([webcam(8), webcam(8)], str(tmp_path)).result()
+    assert [os.path.basename(filename) for filename in filenames] == ['cam1.avi', 'cam2.avi']
+    assert all(os.path.getsize(filename) > 0 for filename in filenames)
+
+
+def test_empty_clips_are_not_returned(tmp_path, writer):
+    filenames = writer.save([webcam(0), webcam(8)], str(tmp_path)).result()
+    assert [os.path.basename(filename) for filename in filenames] == ['cam2.avi']
+    assert os.listdir(str(tmp_path)) == ['cam2.avi']
+
+
+def test_nothing_written(tmp_path, writer):
+    saved = []
+    done = Event()
+
+    def callback(filenames):
+        saved.append(filenames)
+        done.set()
+
+    future = writer.save([webcam(0), webcam(0)], str(tmp_path), callback)
+    assert future.result() is None
+    assert done.wait(2)
+    assert saved == [None]
+
+
+def test_composite(tmp_path, writer):
+    filenames = writer.save([webcam(8), webcam(8)], str(tmp_path), tile_size=(64, 48)).result()
+    assert [os.path.basename(filename) for filename in filenames] == ['composite.avi']
+
+
+def test_the_cameras_are_saved_separately_if_the_composite_fails(tmp_path, writer):
+    writer.composite = lambda *args: False
+    filenames = writer.save([webcam(8), webcam(8)], str(tmp_path), tile_size=(64, 48)).result()
+    assert [os.path.basename(filename) for filename in filenames] == ['cam1.avi', 'cam2.avi']
+
+
+def test_empty_composite(tmp_path, writer):
+    assert writer.save([webcam(0), webcam(0)], str(tmp_path), tile_size=(64, 48)).result() is None
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_a_slow_callback_does_not_delay_the_next_snapshot(tmp_path, writer):
+    release = Event()
+    snapshots = []
+    writer.save([webcam(8)], str(tmp_path), lambda filenames: release.wait(2))
+    future = writer.save([webcam(8)], str(tmp_path), on_snapshot=snapshots.append)
+    # the first callback is still running
+    assert future.result(2)
+    assert len(snapshots) == 1
+    release.set()
+    writer.wait()
+    assert not writer.pending
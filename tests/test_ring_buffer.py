@@ -0,0 +1,138 @@
+import numpy as np
+import pytest
+
+from core.utils.ring_buffer import FrameRingBuffer, RingBuffer
+from core.utils.webcam import Webcam
+
+
+def frame(value, shape=(4, 6, 3)):
+    return np.full(shape, value, dtype=np.uint8)
+
+
+def fill(buffer, nb, start=0):
+    for i in range(start, start + nb):
+        buffer.put(frame(i) if isinstance(buffer, FrameRingBuffer) else i, float(i))
+
+
+def values(items):
+    return [int(item[0, 0, 0]) if isinstance(item, np.ndarray) else item for item in items]
+
+
+@pytest.fixture(params=[RingBuffer, FrameRingBuffer])
+def buffer(request):
+    return request.param(5)
+
+
+def test_wrap_around(buffer):
+    fill(buffer, 3)
+    assert len(buffer) == 3 and not buffer.full()
+
+    fill(buffer, 5, start=3)
+    assert len(buffer) == 5 and buffer.full()
+    assert buffer.count == 8
+
+    items, timestamps = buffer.snapshot()
+    assert values(items) == [3, 4, 5, 6, 7]
+    assert list(timestamps) == [3, 4, 5, 6, 7]
+    assert values([buffer.last()]) == [7]
+    assert buffer.last_timestamp() == 7
+
+
+def test_snapshot_is_not_affected_by_later_insertions(buffer):
+    fill(buffer, 5)
+    items, timestamps = buffer.snapshot()
+    fill(buffer, 5, start=5)
+    assert values(items) == [0, 1, 2, 3, 4]
+    assert list(timestamps) == [0, 1, 2, 3, 4]
+
+
+def test_since_across_the_wrap(buffer):
+    fill(buffer, 4)
+    items, timestamps, seq = buffer.since(0)
+    assert values(items) == [0, 1, 2, 3] and seq == 4
+
+    # the slots wrap around between the two calls
+    fill(buffer, 3, start=4)
+    items, timestamps, seq = buffer.since(seq)
+    assert values(items) == [4, 5, 6]
+    assert list(timestamps) == [4, 5, 6]
+    assert seq == 7
+
+    # more items than the capacity: only the ones still buffered
+    fill(buffer, 8, start=7)
+    items, _, seq = buffer.since(seq)
+    assert values(items) == [10, 11, 12, 13, 14] and seq == 15
+
+    items, _, seq = buffer.since(seq)
+    assert len(items) == 0 and seq == 15
+
+
+def test_since_after_a_reset(buffer):
+    fill(buffer, 6)
+    # a sequence number of a previous buffer starts over
+    items, _, seq = buffer.since(100)
+    assert values(items) == [1, 2, 3, 4, 5] and seq == 6
+
+
+def test_get(buffer):
+    fill(buffer, 7)
+    item, timestamp = buffer.get(6)
+    assert values([item]) == [6] and timestamp == 6
+    assert values([buffer.get(2)[0]]) == [2]
+
+    # evicted and future sequence numbers
+    assert buffer.get(1) == (None, None)
+    assert buffer.get(7) == (None, None)
+
+
+def test_windowed_snapshot(buffer):
+    fill(buffer, 8)
+    items, timestamps = buffer.snapshot(4, 6)
+    assert values(items) == [4, 5, 6] and list(timestamps) == [4, 5, 6]
+
+    assert values(buffer.snapshot(None, 4.5)[0]) == [3, 4]
+    assert values(buffer.snapshot(5.5)[0]) == [6, 7]
+    assert len(buffer.snapshot(10, 20)[0]) == 0
+
+    empty = type(buffer)(5)
+    assert len(empty.snapshot(0, 1)[0]) == 0
+
+
+def test_frame_shape_change_resets_the_buffer():
+    buffer = FrameRingBuffer(4)
+    for t in (1, 2, 3):
+        buffer.put(frame(t, (2, 2, 3)), t)
+    buffer.put(frame(9, (4, 4, 3)), 9)
+
+    assert buffer.count == 1
+    frames, timestamps = buffer.snapshot()
+    assert frames.shape == (1, 4, 4, 3)
+    assert values(frames) == [9] and list(timestamps) == [9]
+    assert buffer.get(0)[1] == 9
+
+    buffer.put(frame(10, (4, 4, 3)), 10)
+    assert list(buffer.snapshot()[1]) == [9, 10]
+
+
+def test_frames_are_scaled_down_to_the_stored_size():
+    buffer = FrameRingBuffer(2, size=(6, 4))
+    buffer.put(frame(1, (8, 12, 3)))
+    assert buffer.frames.shape == (2, 4, 6, 3)
+    assert values(buffer.snapshot()[0]) == [1]
+
+
+@pytest.mark.parametrize('duration, expected', [(0.5, [5, 6, 7, 8, 9]), (2, list(range(10)))])
+def test_resize_keeps_the_latest_frames(duration, expected):
+    webcam = Webcam('127.0.0.1', 1)
+    webcam.fps = 10
+    webcam.buffer = webcam.create_buffer(1)
+    fill(webcam.buffer, 10)
+
+    webcam.resize_buffer(duration)
+    items, timestamps = webcam.buffer.snapshot()
+    assert values(items) == expected
+    assert list(timestamps) == expected
+
+    # the buffer keeps on working after the resize
+    fill(webcam.buffer, 1, start=10)
+    assert values([webcam.buffer.last()]) == [10]
@@ -0,0 +1,183 @@
+import os
+from threading import Event
+from time import monotonic, sleep
+
+import pytest
+
+from benchmarks.fakes import FakeArduino
+from core.utils.serial_bridge import IR_Goal_Detector
+
+SAMPLE_RATE = 50
+
+
+class Goals:
+    """
+    Callback recording the goals of the detector
+    """
+    def __init__(self):
+        self.goals = []
+        self.event = Event()
+
+    def __call__(self, color, timestamp):
+        self.goals.append((color, timestamp))
+        self.event.set()
+
+    def colors(self):
+        return [color for color, _ in self.goals]
+
+    def wait(self, timeout=2):
+        assert self.event.wait(timeout)
+        self.event.clear()
+
+
+def wait_for(condition, timeout=5):
+    end = monotonic() + timeout
+    while not condition():
+        assert monotonic() < end
+        sleep(0.01)
+
+
+def read(detector, nb=3):
+    """
+    Waits until the detector has read nb more bytes, so that the
+    symbol the arduino is sending now has been seen
+    """
+    count = detector.metrics.counters.get('bytes', 0)
+    wait_for(lambda: detector.metrics.counters.get('bytes', 0) >= count + nb)
+
+
+def start(detector):
+    """
+    Starts the detector, once the goals are known to be empty
+    """
+    goals = Goals()
+    detector.start(goals)
+    read(detector)
+    return goals
+
+
+@pytest.fixture
+def arduino():
+    arduino = FakeArduino(SAMPLE_RATE)
+    yield arduino
+    arduino.close()
+
+
+@pytest.fixture
+def detector(arduino):
+    detector = IR_Goal_Detector(9600, SAMPLE_RATE, arduino.port, debounce=0.2)
+    yield detector
+    detector.stop()
+
+
+def test_a_goal_is_fired_once_on_the_edge(arduino, detector):
+    goals = start(detector)
+    assert detector.connected
+
+    goal_time = arduino.goal('b', duration=0.3)
+    goals.wait()
+    # the ball is taken out of the goal
+    read(detector)
+    arduino.goal('r', duration=0.3)
+    goals.wait()
+    read(detector)
+
+    # the ball resting in a goal is counted once
+    assert goals.colors() == ['b', 'r']
+    # the goal is stamped when its byte arrived
+    assert 0 <= goals.goals[0][1] - goal_time < 0.1
+
+
+def test_a_ball_already_in_a_goal_is_not_counted(arduino, detector):
+    arduino.goal_sent.clear()
+    arduino.symbol = b'b'
+    # no '0' is sent once the detector starts
+    assert arduino.goal_sent.wait(2)
+    goals = start(detector)
+    assert goals.goals == []
+
+    arduino.symbol = b'0'
+    read(detector)
+    arduino.goal('r', duration=0.1)
+    goals.wait()
+    assert goals.colors() == ['r']
+
+
+def test_debounce(arduino, detector):
+    goals = start(detector)
+
+    # the ball bounces out of the goal and back in
+    arduino.goal('b', duration=0.05)
+    goals.wait()
+    arduino.goal('b', duration=0.05)
+    read(detector)
+    assert goals.colors() == ['b']
+
+    wait_for(lambda: monotonic() - goals.goals[0][1] > detector.debounce)
+    arduino.goal('b', duration=0.05)
+    goals.wait()
+    assert goals.colors() == ['b', 'b']
+
+
+def test_paused_goals_are_ignored(arduino, detector):
+    goals = start(detector)
+
+    detector.pause()
+    arduino.goal('b', duration=0.1)
+    read(detector)
+    detector.resume()
+    arduino.goal('r', duration=0.1)
+    goals.wait()
+    assert goals.colors() == ['r']
+
+
+def test_reconnects_with_backoff_after_unplugging(tmp_path):
+    # the port is a link to the pty of the arduino plugged in
+    port = str(tmp_path / 'ttyACM0')
+    arduino = FakeArduino(SAMPLE_RATE)
+    os.symlink(arduino.port, port)
+
+    detector = IR_Goal_Detector(9600, SAMPLE_RATE, port, debounce=0.2)
+    detector.MIN_BACKOFF = 0.05
+    detector.MAX_BACKOFF = 0.4
+
+    attempts = []
+    open_port = detector.open
+
+    def open():
+        attempts.append(monotonic())
+        return open_port()
+    detector.open = open
+
+    try:
+        goals = start(detector)
+        arduino.goal('b', duration=0.1)
+        goals.wait()
+
+        # unplug
+        arduino.close()
+        os.remove(port)
+        wait_for(lambda: not detector.connected)
+        unplugged = len(attempts)
+        wait_for(lambda: len(attempts) >= unplugged + 6)
+
+        # the delay between the attempts doubles up to the maximum
+        delays = [b - a for a, b in zip(attempts[unplugged:], attempts[unplugged + 1:])]
+        assert len(delays) >= 3
+        assert delays[1] > delays[0] * 1.5
+        assert max(delays) < detector.MAX_BACKOFF + 0.1
+        assert delays[-1] > detector.MAX_BACKOFF - 0.1
+
+        # plug it back in
+        arduino = FakeArduino(SAMPLE_RATE)
+        os.symlink(arduino.port, port)
+        wait_for(lambda: detector.connected)
+        assert detector.metrics.counters['reconnects'] == 1
+        read(detector)
+
+        arduino.goal('r', duration=0.1)
+        goals.wait()
+        assert goals.colors() == ['b', 'r']
+    finally:
+        detector.stop()
+        arduino.close()
@@ -0,0 +1,13 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_headless_does_not_load_opencv():
+    # opencv is only loaded when the cameras connect, in a fresh
+    # interpreter since the other tests load it
+    subprocess.run([sys.executable, '-c',
+                    "import core.headless, sys; assert 'cv2' not in sys.modules"],
+                   cwd=ROOT, check=True)